@@ -0,0 +1,511 @@
+"""
+Regras das rotas compartilhadas por app_v2.py (Flask) e app_async.py (Quart)
+
+Validação dos parâmetros, leitura dos corpos e montagem dos documentos de
+resposta ficam aqui, sem depender do framework: cada aplicação só lê a
+requisição (args, corpo) e faz o I/O do seu jeito (síncrono ou asyncio).
+Parâmetros inválidos levantam ApiError, que as duas aplicações convertem
+em {"error": ...} com o status HTTP.
+"""
+import csv
+import io
+import os
+import re
+from datetime import datetime, timedelta
+
+from dateutil import parser
+
+from conversion import BASE_CURRENCY
+from database import OHLC_INTERVALS
+import rate_export
+
+SUPPORTED_CURRENCIES = ['USD', 'EUR', 'CAD', 'CHF', 'GBP', 'JPY', 'CNY']
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 100000))
+OHLC_MAX_CANDLES = int(os.environ.get('OHLC_MAX_CANDLES', 10000))
+DATE_ONLY_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+HISTORY_PAGE_DEFAULT = 1000
+HISTORY_PAGE_MAX = 10000
+HISTORY_STREAM_CHUNK = 2000
+HISTORY_CSV_HEADER = 'id,currency_code,rate_to_brl,recorded_at,source\n'
+# Linhas por row group (Parquet) / record batch (Arrow) em /export/rates
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 50000))
+
+
+class ApiError(Exception):
+    """Requisição que não pode ser atendida: vira {"error": message} com `status`"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def unsupported_currency(available=SUPPORTED_CURRENCIES):
+    return ApiError(f'Moeda não suportada. Moedas disponíveis: {available}')
+
+
+def rates_unavailable():
+    return ApiError('Taxa de câmbio não disponível', 503)
+
+
+def isoformat(value):
+    return value.isoformat() if value else None
+
+
+# Parâmetros
+
+def parse_currency(currency_code):
+    """Código da moeda em maiúsculas, se suportada"""
+    currency_code = currency_code.upper()
+    if currency_code not in SUPPORTED_CURRENCIES:
+        raise unsupported_currency()
+    return currency_code
+
+
+def parse_currency_list(currencies_str):
+    """Moedas separadas por vírgula, sem repetição; None se o parâmetro não veio"""
+    if not currencies_str:
+        return None
+    currency_codes = list(dict.fromkeys(code.strip().upper() for code in currencies_str.split(',') if code.strip()))
+    if not currency_codes or any(code not in SUPPORTED_CURRENCIES for code in currency_codes):
+        raise unsupported_currency()
+    return currency_codes
+
+
+def parse_amount(args):
+    try:
+        return float(args.get('amount', '0'))
+    except ValueError:
+        raise ApiError('Valor inválido')
+
+
+def parse_convert(args):
+    """from, to (padrão: BRL) e amount de /convert"""
+    from_currency = args.get('from', '').upper()
+    to_currency = args.get('to', BASE_CURRENCY).upper()
+    amount = parse_amount(args)
+
+    available = SUPPORTED_CURRENCIES + [BASE_CURRENCY]
+    if from_currency not in available or to_currency not in available:
+        raise unsupported_currency(available)
+    return from_currency, to_currency, amount
+
+
+def parse_convert_reverse(args):
+    """to e amount (em BRL) de /convert/reverse"""
+    to_currency = args.get('to', '').upper()
+    amount = parse_amount(args)
+
+    if to_currency not in SUPPORTED_CURRENCIES:
+        raise unsupported_currency()
+    return to_currency, amount
+
+
+def parse_batch_items(payload=None, csv_data=None):
+    """
+    Itens de /convert/batch como tuplas (from, to, amount)
+
+    Args:
+        payload: Corpo JSON ({"items": [{"from", "to", "amount"}]} ou a lista direto)
+        csv_data: Bytes do CSV com cabeçalho from,to,amount (corpo text/csv ou
+            arquivo no campo 'file'); tem precedência sobre `payload`
+    """
+    try:
+        if csv_data is not None:
+            reader = csv.DictReader(io.StringIO(csv_data.decode('utf-8-sig')))
+            items = [(row.get('from'), row.get('to') or 'BRL', row.get('amount')) for row in reader]
+        else:
+            if isinstance(payload, dict):
+                payload = payload.get('items')
+            if not isinstance(payload, list):
+                raise ValueError('Envie {"items": [...]} em JSON ou um CSV com colunas from,to,amount')
+            items = [
+                (item.get('from'), item.get('to', 'BRL'), item.get('amount'))
+                if isinstance(item, dict) else (None, None, None)
+                for item in payload
+            ]
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        raise ApiError(f'Corpo inválido: {str(e)}')
+
+    if len(items) > BATCH_MAX_ITEMS:
+        raise ApiError(f'Máximo de {BATCH_MAX_ITEMS} itens por requisição')
+    return items
+
+
+def _parse_dates(args, start_key, end_key, default_start, default_end):
+    try:
+        start = parser.parse(args[start_key]) if args.get(start_key) else default_start
+        end = parser.parse(args[end_key]) if args.get(end_key) else default_end
+    except Exception as e:
+        raise ApiError(f'Formato de data inválido: {str(e)}')
+    return start, end
+
+
+def parse_history_range(args):
+    """start_date e end_date da query string (padrão: últimos 30 dias)"""
+    now = datetime.now()
+    return _parse_dates(args, 'start_date', 'end_date', now - timedelta(days=30), now)
+
+
+def parse_history_format(args):
+    """format de /history/<moeda>: None ou 'json' (documento), 'ndjson' ou 'csv' (streaming)"""
+    fmt = args.get('format')
+    if fmt not in (None, 'json', 'ndjson', 'csv'):
+        raise ApiError('Formato deve ser json, ndjson ou csv')
+    return fmt
+
+
+def parse_history_page(args):
+    """
+    limit e after da paginação por keyset de /history/<moeda>
+
+    Returns:
+        (limit, after), com after = (recorded_at, id) ou None; None se a
+        requisição não pediu paginação
+    """
+    if 'limit' not in args and 'after' not in args:
+        return None
+
+    limit = args.get('limit', HISTORY_PAGE_DEFAULT, type=int)
+    if limit < 1 or limit > HISTORY_PAGE_MAX:
+        raise ApiError(f'limit deve estar entre 1 e {HISTORY_PAGE_MAX}')
+
+    after = None
+    after_str = args.get('after')
+    if after_str:
+        try:
+            after_ts, after_id = after_str.rsplit(',', 1)
+            after = (parser.parse(after_ts), int(after_id))
+        except Exception:
+            raise ApiError('Cursor after inválido (formato: recorded_at,id)')
+    return limit, after
+
+
+def parse_export(args):
+    """format, currencies, start_date e end_date de /export/rates (período sem limite por padrão)"""
+    fmt = args.get('format', 'parquet')
+    if fmt not in rate_export.FORMATS:
+        raise ApiError('Formato deve ser parquet ou arrow')
+    currency_codes = parse_currency_list(args.get('currencies'))
+    start_date, end_date = _parse_dates(args, 'start_date', 'end_date', None, None)
+    return fmt, currency_codes, start_date, end_date
+
+
+def parse_stats_days(args):
+    days = args.get('days', 30, type=int)
+    if days < 1 or days > 365:
+        raise ApiError('Dias deve estar entre 1 e 365')
+    return days
+
+
+def parse_as_of(value):
+    """Converte a data pedida no instante de referência: data sem hora vale até o fim do dia"""
+    as_of = parser.parse(value)
+    if DATE_ONLY_RE.match(value.strip()):
+        as_of = as_of + timedelta(days=1) - timedelta(microseconds=1)
+    return as_of
+
+
+def parse_ohlc(args):
+    """interval, start e end de /ohlc/<moeda> (padrão: 500 candles até agora)"""
+    interval = args.get('interval', '1h')
+    if interval not in OHLC_INTERVALS:
+        raise ApiError(f'interval deve ser um de: {", ".join(OHLC_INTERVALS)}')
+    width, _ = OHLC_INTERVALS[interval]
+
+    try:
+        end = parse_as_of(args['end']) if args.get('end') else datetime.now()
+        start = parser.parse(args['start']) if args.get('start') else end - width * 500
+    except Exception as e:
+        raise ApiError(f'Formato de data inválido: {str(e)}')
+
+    if start > end:
+        raise ApiError('start deve ser anterior a end')
+    if (end - start) / width > OHLC_MAX_CANDLES:
+        raise ApiError(f'Período longo demais para interval={interval} (máximo de {OHLC_MAX_CANDLES} candles)')
+    return interval, start, end
+
+
+def parse_rate_at_date(args):
+    """
+    date e asof de /rate-at-date/<moeda>
+
+    Returns:
+        (data pedida como veio, data interpretada, instante as-of ou None sem asof=true)
+    """
+    date_str = args.get('date')
+    if not date_str:
+        raise ApiError('Parâmetro date é obrigatório')
+
+    try:
+        target_date = parser.parse(date_str)
+    except Exception as e:
+        raise ApiError(f'Formato de data inválido: {str(e)}')
+
+    as_of = parse_as_of(date_str) if args.get('asof', 'false').lower() == 'true' else None
+    return date_str, target_date, as_of
+
+
+def parse_as_of_batch(payload):
+    """
+    Itens de POST /rate-at-date ({"items": [{"currency", "date"}]} ou a lista direto)
+
+    Returns:
+        (results, lookups, positions): um resultado por item, já com o erro
+        dos inválidos; (moeda, instante) a consultar e a posição de cada um
+        em `results`
+    """
+    if isinstance(payload, dict):
+        payload = payload.get('items')
+    if not isinstance(payload, list):
+        raise ApiError('Envie {"items": [{"currency": ..., "date": ...}]}')
+
+    if len(payload) > BATCH_MAX_ITEMS:
+        raise ApiError(f'Máximo de {BATCH_MAX_ITEMS} itens por requisição')
+
+    results = [None] * len(payload)
+    lookups = []
+    positions = []
+    for i, item in enumerate(payload):
+        item = item if isinstance(item, dict) else {}
+        currency_code = str(item.get('currency') or item.get('currency_code') or '').upper()
+        date_str = str(item.get('date') or '')
+
+        if currency_code not in SUPPORTED_CURRENCIES:
+            results[i] = {'index': i, 'error': f'Moeda não suportada: {currency_code}'}
+            continue
+        try:
+            as_of = parse_as_of(date_str)
+        except Exception:
+            results[i] = {'index': i, 'error': f'Formato de data inválido: {date_str}'}
+            continue
+
+        results[i] = {'index': i, 'currency_code': currency_code, 'requested_date': date_str}
+        lookups.append((currency_code, as_of))
+        positions.append(i)
+    return results, lookups, positions
+
+
+# Documentos de resposta
+
+def rates_document(snapshot):
+    """/rates: taxas do snapshot em cache, com last_modified"""
+    return {
+        'base_currency': 'BRL',
+        'rates': snapshot.rates,
+        'last_update': isoformat(snapshot.last_update),
+        'supported_currencies': SUPPORTED_CURRENCIES
+    }, snapshot.last_update
+
+
+def latest_rates_document(rates):
+    """
+    /rates/latest: taxas lidas de latest_rates, com last_modified
+
+    get_latest_rates devolve {} quando a consulta falha; vazio vira 503 (e a
+    exceção impede que o corpo vá para o cache do TTL).
+    """
+    if not rates:
+        raise ApiError('Taxas do banco indisponíveis', 503)
+    recorded = [datetime.fromisoformat(value['recorded_at']) for value in rates.values()]
+    return {
+        'base_currency': 'BRL',
+        'rates': rates,
+        'supported_currencies': SUPPORTED_CURRENCIES
+    }, max(recorded) if recorded else None
+
+
+def convert_document(from_currency, to_currency, amount, rate):
+    if rate is None:
+        raise rates_unavailable()
+    return {
+        'from_currency': from_currency,
+        'to_currency': to_currency,
+        'original_amount': amount,
+        'converted_amount': round(amount * rate, 2),
+        'exchange_rate': round(rate, 4),
+        'timestamp': datetime.now().isoformat()
+    }
+
+
+def convert_reverse_document(to_currency, amount, rates):
+    if to_currency not in rates:
+        raise rates_unavailable()
+    rate = rates[to_currency]
+    return {
+        'from_currency': 'BRL',
+        'to_currency': to_currency,
+        'original_amount': amount,
+        'converted_amount': round(amount / rate, 2),
+        'exchange_rate': round(1/rate, 4),
+        'timestamp': datetime.now().isoformat()
+    }
+
+
+def batch_document(snapshot, results):
+    return {
+        'count': len(results),
+        'errors': sum(1 for result in results if 'error' in result),
+        'last_update': isoformat(snapshot.last_update),
+        'results': results
+    }
+
+
+def history_multi_document(currency_codes, start_date, end_date, timestamps, rates):
+    return {
+        'base_currency': 'BRL',
+        'currencies': currency_codes,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'data_points': len(timestamps),
+        'timestamps': timestamps,
+        'rates': rates
+    }
+
+
+def history_document(currency_code, start_date, end_date, history):
+    return {
+        'currency_code': currency_code,
+        'base_currency': 'BRL',
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'data_points': len(history),
+        'history': history
+    }
+
+
+def history_page_document(currency_code, start_date, end_date, history, next_after):
+    """Página do keyset: o documento de history_document mais o cursor da próxima"""
+    document = history_document(currency_code, start_date, end_date, history)
+    document['next_after'] = f'{next_after[0].isoformat()},{next_after[1]}' if next_after else None
+    return document
+
+
+def history_csv(rows):
+    """Linhas (id, currency_code, rate_to_brl, recorded_at, source) em CSV, sem cabeçalho"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerows(
+        (row_id if row_id is not None else '', code, rate, recorded_at.isoformat(), source)
+        for row_id, code, rate, recorded_at, source in rows
+    )
+    return buffer.getvalue()
+
+
+def stats_document(currency_code, days, stats):
+    return {
+        'currency_code': currency_code,
+        'base_currency': 'BRL',
+        'days_requested': days,
+        'days_available': len(stats),
+        'stats': stats
+    }
+
+
+def ohlc_document(currency_code, interval, start, end, candles):
+    return {
+        'currency_code': currency_code,
+        'base_currency': 'BRL',
+        'interval': interval,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'count': len(candles),
+        'candles': candles
+    }
+
+
+def rate_at_date_document(currency_code, date_str, target_date, rate_data):
+    if not rate_data:
+        raise ApiError(f'Nenhuma taxa encontrada para {currency_code} em {date_str}', 404)
+    return {
+        'currency_code': currency_code,
+        'base_currency': 'BRL',
+        'requested_date': target_date.date().isoformat(),
+        'rate': rate_data['rate'],
+        'recorded_at': rate_data['recorded_at']
+    }
+
+
+def as_of_batch_document(results, positions, found):
+    """Completa os resultados de parse_as_of_batch com as taxas encontradas, na ordem de `positions`"""
+    for i, rate_data in zip(positions, found):
+        if rate_data:
+            results[i].update(rate_data)
+        else:
+            results[i]['error'] = 'Nenhuma taxa encontrada até esta data'
+    return {
+        'base_currency': 'BRL',
+        'count': len(results),
+        'results': results
+    }
+
+
+def database_unavailable_document():
+    """Corpo do 503 das rotas que dependem do banco com o circuit breaker aberto"""
+    return {
+        'error': 'Banco de dados indisponível; só taxas em cache (/rates, /convert) estão disponíveis',
+        'degraded': True
+    }
+
+
+def health_document(database_available, snapshot, db, rate_fetcher, write_queue, series_store, **extra):
+    """/health: só estado em memória (breaker, pool, provedores, fila, cache de séries)"""
+    return {
+        'status': 'healthy',
+        'mode': 'normal' if database_available else 'degraded',
+        'timestamp': datetime.now().isoformat(),
+        'rates_available': len(snapshot.rates) > 0,
+        'database_connected': database_available,
+        'database_breaker': db.breaker_state(),
+        'database_pool': db.pool_stats(),
+        'rate_providers': rate_fetcher.stats(),
+        'write_behind': write_queue.stats(),
+        'series_cache': series_store.stats() if series_store is not None else None,
+        **extra
+    }
+
+
+def ready_document(snapshot, database_available):
+    """/ready: (documento, status); pronto com taxas em cache, mesmo sem banco"""
+    if snapshot.rates:
+        return {
+            'status': 'ready',
+            'mode': 'normal' if database_available else 'degraded'
+        }, 200
+    return {'status': 'not ready'}, 503
+
+
+def root_document(stream=False, **extra):
+    """Documento da raiz; `stream` inclui /rates/stream (só no app_async)"""
+    endpoints = {
+        '/health': 'Health check',
+        '/ready': 'Readiness check',
+        '/metrics': 'Prometheus metrics',
+        '/rates': 'Get current exchange rates (cached)',
+        '/rates/latest': 'Get latest rates from database',
+        '/rates/matrix': 'Get the N×N cross-rate matrix'
+    }
+    if stream:
+        endpoints['/rates/stream'] = 'Server-Sent Events with rate updates (diffs)'
+    endpoints.update({
+        '/convert?from=USD&amount=100': 'Convert foreign currency to BRL',
+        '/convert?from=USD&to=EUR&amount=100': 'Convert between any two currencies',
+        '/convert/reverse?to=USD&amount=100': 'Convert BRL to foreign currency',
+        'POST /convert/batch': 'Convert many amounts (JSON or CSV) in one request',
+        '/history/USD?start_date=2024-02-01&end_date=2024-02-10': 'Get historical rates',
+        '/history?currencies=USD,EUR&start_date=2024-02-01': 'Get several currencies in one columnar response',
+        '/export/rates?format=parquet&currencies=USD,EUR': 'Export raw rates as Parquet or Arrow (streaming)',
+        '/stats/USD?days=30': 'Get daily statistics',
+        '/ohlc/USD?interval=1h&start=2024-01-01': 'Get OHLC candles (1m to 1w)',
+        '/rate-at-date/USD?date=2024-02-01': 'Get rate at specific date',
+        '/rate-at-date/USD?date=2024-02-03&asof=true': 'Get latest rate at or before a date',
+        'POST /rate-at-date': 'Get as-of rates for many currency/date pairs in one query'
+    })
+    return {
+        'service': 'Currency Converter API',
+        'version': '2.0.0',
+        **extra,
+        'features': ['Real-time rates', 'Historical data', 'Daily statistics'],
+        'endpoints': endpoints,
+        'supported_currencies': SUPPORTED_CURRENCIES
+    }
@@ -0,0 +1,635 @@
+from quart import Quart, Response, g, jsonify, request
+from quart.wrappers.response import DataBody
+from datetime import datetime, timedelta
+import asyncio
+import os
+import time
+import logging
+from api_common import SUPPORTED_CURRENCIES, ApiError
+from database import HISTORY_FIELDS
+from database_async import AsyncDatabaseManager
+from conversion import CrossRateMatrix, convert_batch
+from http_cache import compress, encoded_payload, negotiate_encoding, prepare_payload, should_compress
+from response_encoding import MIMETYPES, Records, ResponseEncoder
+from series_cache import SeriesStore
+from rate_refresher import AsyncRateRefresher, SnapshotFile, snapshot_from_latest
+from rate_coordinator import AsyncRateCoordinator
+from rate_stream import RateStreamHub
+from circuit_breaker import CircuitOpenError
+from rate_providers import DEFAULT_PROVIDERS, AsyncRateFetcher, build_providers
+from write_behind import AsyncWriteBehindQueue
+import api_common as api
+import rate_export
+import metrics
+
+# Versão ASGI da API (mesmas rotas de app_v2.py), para rodar com uvicorn:
+#   uvicorn app_async:app --host 0.0.0.0 --port 5000
+app = Quart(__name__)
+logging.basicConfig(level=logging.INFO)
+# jsonify negocia JSON/MessagePack pelo Accept; backend JSON: orjson (padrão) ou json
+app.json = ResponseEncoder(app, request, json_backend=os.environ.get('RESPONSE_JSON_BACKEND', 'orjson'))
+
+CACHE_DURATION_MINUTES = 30
+REFRESH_INTERVAL_MINUTES = float(os.environ.get('RATE_REFRESH_INTERVAL_MINUTES', 25))
+REFRESH_RETRY_SECONDS = float(os.environ.get('RATE_REFRESH_RETRY_SECONDS', 60))
+LATEST_RATES_CACHE_SECONDS = int(os.environ.get('LATEST_RATES_CACHE_SECONDS', 60))
+SERIES_CACHE_ENABLED = os.environ.get('SERIES_CACHE_ENABLED', 'false').lower() == 'true'
+SERIES_CACHE_DAYS = int(os.environ.get('SERIES_CACHE_DAYS', 90))
+SERIES_CACHE_MAX_MB = float(os.environ.get('SERIES_CACHE_MAX_MB', 32))
+SERIES_SYNC_OVERLAP_SECONDS = int(os.environ.get('SERIES_SYNC_OVERLAP_SECONDS', 300))
+EXCHANGE_API_URL = os.environ.get('EXCHANGE_API_URL', 'https://api.exchangerate-api.com/v4/latest/BRL')
+RATE_PROVIDERS = [name.strip() for name in os.environ.get('RATE_PROVIDERS', DEFAULT_PROVIDERS).split(',') if name.strip()]
+RATE_PROVIDER_TIMEOUT_SECONDS = float(os.environ.get('RATE_PROVIDER_TIMEOUT_SECONDS', 5))
+RATE_PROVIDER_RETRIES = int(os.environ.get('RATE_PROVIDER_RETRIES', 2))
+RATE_PROVIDER_HEDGE_SECONDS = float(os.environ.get('RATE_PROVIDER_HEDGE_SECONDS', 2))
+RATE_COORDINATION = os.environ.get('RATE_COORDINATION', 'none').lower()
+SSE_HEARTBEAT_SECONDS = float(os.environ.get('SSE_HEARTBEAT_SECONDS', 15))
+WRITE_BEHIND_SPOOL_DIR = os.environ.get('WRITE_BEHIND_SPOOL_DIR', '/tmp/currency-spool')
+WRITE_BEHIND_BATCH_SIZE = int(os.environ.get('WRITE_BEHIND_BATCH_SIZE', 100))
+WRITE_BEHIND_RETRY_SECONDS = float(os.environ.get('WRITE_BEHIND_RETRY_SECONDS', 10))
+RATE_SNAPSHOT_FILE = os.environ.get('RATE_SNAPSHOT_FILE', os.path.join(WRITE_BEHIND_SPOOL_DIR, 'latest-snapshot.json'))
+
+# Pool asyncpg é criado no loop do servidor (before_serving); o cliente HTTP
+# do rate_fetcher, na primeira busca
+db = AsyncDatabaseManager()
+rate_fetcher = AsyncRateFetcher(
+    build_providers(RATE_PROVIDERS, EXCHANGE_API_URL),
+    SUPPORTED_CURRENCIES,
+    timeout=RATE_PROVIDER_TIMEOUT_SECONDS,
+    retries=RATE_PROVIDER_RETRIES,
+    hedge_after=RATE_PROVIDER_HEDGE_SECONDS
+)
+# Fila de escrita com spool local (mesma regra de app_v2.py); a task começa no before_serving
+write_queue = AsyncWriteBehindQueue(
+    db,
+    WRITE_BEHIND_SPOOL_DIR,
+    batch_size=WRITE_BEHIND_BATCH_SIZE,
+    retry_seconds=WRITE_BEHIND_RETRY_SECONDS
+)
+
+async def fetch_upstream_rates():
+    """Busca as taxas nos provedores sem bloquear o loop, sem gravar; retorna (taxas, provedor)"""
+    return await rate_fetcher.fetch()
+
+async def fetch_exchange_rates():
+    """Busca as taxas de câmbio nos provedores e enfileira a gravação, com o provedor em `source`"""
+    rates, source = await fetch_upstream_rates()
+
+    write_queue.submit(rates, source=source)
+
+    app.logger.info(f"Taxas atualizadas com sucesso: {rates}")
+    return rates
+
+# Modo coordenado: mesma regra de app_v2.py (advisory lock + LISTEN/NOTIFY)
+coordinator = None
+if RATE_COORDINATION == 'advisory-lock':
+    coordinator = AsyncRateCoordinator(
+        db,
+        fetch_upstream_rates,
+        fresh_seconds=REFRESH_INTERVAL_MINUTES * 60 * 0.8,
+        write_behind=write_queue
+    )
+
+refresher = AsyncRateRefresher(
+    coordinator.fetch_rates if coordinator is not None else fetch_exchange_rates,
+    interval_seconds=REFRESH_INTERVAL_MINUTES * 60,
+    retry_seconds=REFRESH_RETRY_SECONDS
+)
+
+def get_cached_snapshot():
+    """Retorna o snapshot atual sem fazer I/O; se vazio ou vencido, pede uma atualização"""
+    snapshot = refresher.snapshot
+
+    if not snapshot.rates or not snapshot.last_update:
+        metrics.CACHE_LOOKUPS.labels('miss').inc()
+        refresher.trigger()
+    elif (datetime.now() - snapshot.last_update) > timedelta(minutes=CACHE_DURATION_MINUTES):
+        metrics.CACHE_LOOKUPS.labels('stale').inc()
+        refresher.trigger()
+    else:
+        metrics.CACHE_LOOKUPS.labels('hit').inc()
+
+    return snapshot
+
+def get_cached_rates():
+    """Retorna as taxas do snapshot em cache"""
+    return get_cached_snapshot().rates
+
+cross_rates = CrossRateMatrix(refresher.snapshot, app.json.encode)
+
+def update_cross_rates(previous, snapshot):
+    """Listener do atualizador: recalcula a matriz N×N para o novo snapshot"""
+    global cross_rates
+    cross_rates = CrossRateMatrix(snapshot, app.json.encode)
+
+def get_cross_rates():
+    """Retorna a matriz de taxas cruzadas do snapshot em cache"""
+    get_cached_snapshot()
+    return cross_rates
+
+# Corpos de /rates, /rates/latest e / serializados (e comprimidos) uma vez por snapshot e formato:
+# {(chave, formato): (snapshot, PreparedPayload)}
+prepared_payloads = {}
+
+async def get_prepared_payload(key, snapshot, build, ttl=None):
+    """Como em app_v2.py, mas `build` é uma corrotina"""
+    fmt = app.json.negotiate()
+    now = time.monotonic()
+    entry = prepared_payloads.get((key, fmt))
+    if entry is not None and entry[0] is snapshot:
+        if ttl is None or now - entry[1].created_at < ttl:
+            return entry[1]
+
+    data, last_modified = await build()
+    payload = prepare_payload(app.json.encode(data, fmt), last_modified, now, MIMETYPES[fmt])
+    prepared_payloads[(key, fmt)] = (snapshot, payload)
+    return payload
+
+async def payload_response(payload, max_age):
+    """Serve um PreparedPayload respeitando If-None-Match / If-Modified-Since"""
+    body, encoding, etag, vary_encoding = encoded_payload(payload, request.accept_encodings)
+    response = Response(body, mimetype=payload.mimetype)
+    response.vary.add('Accept')
+    if vary_encoding:
+        response.vary.add('Accept-Encoding')
+    if encoding is not None:
+        response.content_encoding = encoding
+    response.set_etag(etag)
+    if payload.last_modified is not None:
+        response.last_modified = payload.last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = max(int(max_age), 0)
+    return await response.make_conditional(request)
+
+def seconds_until_refresh(snapshot):
+    """Segundos até o snapshot ser substituído pela próxima atualização agendada"""
+    if not snapshot.last_update:
+        return 0
+    age = (datetime.now() - snapshot.last_update).total_seconds()
+    return REFRESH_INTERVAL_MINUTES * 60 - age
+
+series_store = SeriesStore(int(SERIES_CACHE_MAX_MB * 1024 * 1024)) if SERIES_CACHE_ENABLED else None
+series_load_lock = asyncio.Lock()
+
+async def load_series_store():
+    """Carrega os últimos SERIES_CACHE_DAYS dias de amostras no cache de séries"""
+    if series_load_lock.locked():
+        return
+    async with series_load_lock:
+        try:
+            since = datetime.now() - timedelta(days=SERIES_CACHE_DAYS)
+            async for rows in db.iter_raw_rates(since=since):
+                series_store.add(rows)
+            series_store.mark_loaded(since)
+            app.logger.info(f"Cache de séries carregado: {series_store.stats()['samples']}")
+        except Exception as e:
+            app.logger.error(f"Erro ao carregar cache de séries: {str(e)}")
+
+async def sync_series_store():
+    """Acrescenta ao cache de séries as amostras gravadas desde a última sincronização (como em app_v2.py)"""
+    if not series_store.ready:
+        await load_series_store()
+        return
+    try:
+        created_since = series_store.sync_from(timedelta(seconds=SERIES_SYNC_OVERLAP_SECONDS))
+        async for rows in db.iter_raw_rates(since=series_store.loaded_from, created_since=created_since):
+            series_store.add(rows)
+    except Exception as e:
+        app.logger.error(f"Erro ao sincronizar cache de séries: {str(e)}")
+
+def schedule_series_sync(*_):
+    """Listener da fila de escrita (e do atualizador no modo coordenado): agenda a sincronização no loop"""
+    asyncio.ensure_future(sync_series_store())
+
+def series_covers(currency_code, start):
+    """True se o cache de séries pode responder a partir de `start` sem ir ao banco"""
+    return series_store is not None and series_store.covers(currency_code, start)
+
+# Assinantes de /rates/stream recebem um diff a cada troca de snapshot
+stream_hub = RateStreamHub(heartbeat_seconds=SSE_HEARTBEAT_SECONDS)
+
+refresher.add_listener(update_cross_rates)
+refresher.add_listener(stream_hub.publish)
+
+# Último snapshot em disco (mesma regra de app_v2.py)
+snapshot_file = SnapshotFile(RATE_SNAPSHOT_FILE)
+
+async def warm_start():
+    """Conecta ao banco, aquece o cache com latest_rates e inicia o atualizador (como em app_v2.py)"""
+    if not refresher.snapshot.rates:
+        refresher.start()
+    if await db.connect():
+        refresher.warm(snapshot_from_latest(await db.get_latest_rates()))
+    if series_store is not None:
+        asyncio.ensure_future(load_series_store())
+        # Como em app_v2.py: sincroniza depois do commit de cada lote da fila de escrita
+        write_queue.add_listener(schedule_series_sync)
+        if coordinator is not None:
+            refresher.add_listener(schedule_series_sync)
+    if coordinator is not None:
+        coordinator.start_listener(refresher.set_rates)
+    refresher.start()
+
+@app.before_serving
+async def startup():
+    """
+    Aquece o cache com o snapshot local e inicia a fila de escrita
+
+    Banco e atualizador sobem em segundo plano (warm_start), para que o
+    servidor aceite conexões sem esperar por eles.
+    """
+    refresher.warm(snapshot_file.load())
+    refresher.add_listener(snapshot_file.save)
+    write_queue.start()
+    asyncio.ensure_future(warm_start())
+
+@app.after_serving
+async def shutdown():
+    """Para o atualizador e a fila de escrita e fecha o cliente HTTP e o pool do banco"""
+    await refresher.stop()
+    if coordinator is not None:
+        await coordinator.stop()
+    await write_queue.stop()
+    await rate_fetcher.close()
+    await db.close()
+
+@app.before_request
+async def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+async def record_request_metrics(response):
+    """Registra a latência da requisição por rota (padrão da URL) e status"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        metrics.observe_request(
+            request.method,
+            request.url_rule.rule if request.url_rule is not None else None,
+            response.status_code,
+            time.perf_counter() - started
+        )
+    return response
+
+@app.after_request
+async def mark_degraded_mode(response):
+    """Com o banco indisponível, toda resposta sai marcada como modo degradado"""
+    if not db.is_available():
+        response.headers['X-Degraded-Mode'] = 'database-unavailable'
+    return response
+
+@app.after_request
+async def compress_body(response):
+    """
+    Comprime (br ou gzip, pelo Accept-Encoding) as respostas acima de COMPRESSION_MIN_BYTES
+
+    Como http_cache.compress_response; a compressão roda em uma thread, fora do loop.
+    """
+    if not isinstance(response.response, DataBody) or response.content_encoding:
+        return response
+    body = response.response.data
+    if not should_compress(response.mimetype, len(body)):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding is not None:
+        response.set_data(await asyncio.to_thread(compress, body, encoding))
+        response.content_encoding = encoding
+    return response
+
+@app.errorhandler(ApiError)
+async def api_error(e):
+    """Parâmetro inválido ou recurso indisponível (api_common.ApiError)"""
+    return jsonify({'error': e.message}), e.status
+
+@app.errorhandler(CircuitOpenError)
+async def database_unavailable(e):
+    """Rotas que dependem do banco falham na hora enquanto o circuit breaker está aberto"""
+    response = jsonify(api.database_unavailable_document())
+    response.headers['Retry-After'] = str(max(1, int(e.retry_in + 0.5)))
+    return response, 503
+
+@app.route('/metrics', methods=['GET'])
+async def prometheus_metrics():
+    """Métricas no formato do Prometheus (somadas entre os workers, se houver vários)"""
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+@app.route('/health', methods=['GET'])
+async def health_check():
+    """Endpoint de health check para Kubernetes (sem I/O: o estado do banco vem do circuit breaker)"""
+    return jsonify(api.health_document(
+        db.is_available(), refresher.snapshot, db, rate_fetcher, write_queue, series_store,
+        stream_subscribers=stream_hub.subscribers
+    )), 200
+
+@app.route('/ready', methods=['GET'])
+async def readiness_check():
+    """Endpoint de readiness para Kubernetes (pronto com taxas em cache, mesmo sem banco)"""
+    document, status = api.ready_document(refresher.snapshot, db.is_available())
+    return jsonify(document), status
+
+@app.route('/rates', methods=['GET'])
+async def get_rates():
+    """Retorna todas as taxas de câmbio atuais (moeda estrangeira -> BRL)"""
+    snapshot = get_cached_snapshot()
+
+    async def build():
+        return api.rates_document(snapshot)
+
+    payload = await get_prepared_payload('rates', snapshot, build)
+    return await payload_response(payload, seconds_until_refresh(snapshot))
+
+@app.route('/rates/stream', methods=['GET'])
+async def stream_rates():
+    """
+    Server-Sent Events com as taxas atuais
+
+    O primeiro evento é o snapshot completo ('snapshot'); depois, a cada troca de
+    snapshot, só as taxas que mudaram ('diff'). Ao reconectar, o navegador envia
+    Last-Event-ID e recebe apenas o que mudou desde então.
+    """
+    get_cached_snapshot()
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    response = Response(
+        stream_hub.subscribe(last_event_id),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # Conexão de longa duração: sem o limite padrão de tempo de resposta do Quart
+    response.timeout = None
+    return response
+
+@app.route('/rates/matrix', methods=['GET'])
+async def get_rates_matrix():
+    """
+    Retorna a matriz N×N de taxas cruzadas (linha = origem, coluna = destino)
+    Parâmetros:
+    - format: json (padrão) ou binary (float64 little-endian, moedas no header X-Currencies)
+
+    Com Accept: application/msgpack, o mesmo documento do JSON em MessagePack.
+    """
+    matrix = get_cross_rates()
+
+    if not matrix.snapshot.rates:
+        raise api.rates_unavailable()
+
+    if request.args.get('format') == 'binary':
+        return Response(
+            matrix.binary,
+            mimetype='application/octet-stream',
+            headers={'X-Currencies': ','.join(matrix.codes)}
+        )
+
+    fmt = app.json.negotiate()
+    response = Response(matrix.encoded[fmt], mimetype=MIMETYPES[fmt])
+    response.vary.add('Accept')
+    return response
+
+@app.route('/rates/latest', methods=['GET'])
+async def get_latest_rates_from_db():
+    """Retorna as taxas mais recentes do banco de dados"""
+    snapshot = get_cached_snapshot()
+
+    async def build():
+        db.require_available()
+        rates = await db.get_latest_rates()
+        if not rates:
+            # Falha da consulta pode ter aberto o breaker: responde o 503 do modo degradado
+            db.require_available()
+        return api.latest_rates_document(rates)
+
+    payload = await get_prepared_payload('rates_latest', snapshot, build, ttl=LATEST_RATES_CACHE_SECONDS)
+
+    remaining = LATEST_RATES_CACHE_SECONDS - (time.monotonic() - payload.created_at)
+    return await payload_response(payload, min(remaining, seconds_until_refresh(snapshot)))
+
+@app.route('/convert', methods=['GET'])
+async def convert_currency():
+    """
+    Converte valor entre duas moedas quaisquer (BRL ou moedas suportadas)
+    Parâmetros:
+    - from: código da moeda de origem (USD, EUR, etc)
+    - to: código da moeda de destino (padrão: BRL)
+    - amount: valor a converter
+    """
+    from_currency, to_currency, amount = api.parse_convert(request.args)
+    rate = get_cross_rates().rate(from_currency, to_currency)
+    return jsonify(api.convert_document(from_currency, to_currency, amount, rate)), 200
+
+@app.route('/convert/reverse', methods=['GET'])
+async def convert_currency_reverse():
+    """
+    Converte valor de BRL para moeda estrangeira
+    Parâmetros:
+    - to: código da moeda (USD, EUR, etc)
+    - amount: valor em BRL a converter
+    """
+    to_currency, amount = api.parse_convert_reverse(request.args)
+    return jsonify(api.convert_reverse_document(to_currency, amount, get_cached_rates())), 200
+
+async def parse_batch_items():
+    """Lê os itens de conversão da requisição (CSV ou JSON, como em app_v2.py)"""
+    upload = (await request.files).get('file')
+    if upload is not None:
+        return api.parse_batch_items(csv_data=upload.read())
+    if request.mimetype == 'text/csv':
+        return api.parse_batch_items(csv_data=await request.get_data())
+    return api.parse_batch_items(await request.get_json(silent=True))
+
+@app.route('/convert/batch', methods=['POST'])
+async def convert_currency_batch():
+    """Converte vários valores em uma requisição, contra o mesmo snapshot de taxas"""
+    items = await parse_batch_items()
+
+    matrix = get_cross_rates()
+    if not matrix.snapshot.rates:
+        raise api.rates_unavailable()
+
+    return jsonify(api.batch_document(matrix.snapshot, convert_batch(matrix, items))), 200
+
+async def stream_history(currency_code, start_date, end_date, fmt):
+    """Gera o histórico em blocos NDJSON ou CSV a partir de um cursor no servidor"""
+    if fmt == 'csv':
+        yield api.HISTORY_CSV_HEADER.encode('utf-8')
+
+    try:
+        async for rows in db.iter_historical_rates(currency_code, start_date, end_date, api.HISTORY_STREAM_CHUNK):
+            if fmt == 'csv':
+                yield api.history_csv(rows).encode('utf-8')
+            else:
+                yield app.json.ndjson(Records(HISTORY_FIELDS, rows))
+    except Exception as e:
+        # Os headers já foram enviados: só resta registrar e encerrar o stream
+        app.logger.error(f"Erro no streaming do histórico: {str(e)}")
+
+@app.route('/history', methods=['GET'])
+async def get_historical_rates_multi():
+    """
+    Retorna o histórico de várias moedas em uma requisição, em formato colunar
+    Parâmetros:
+    - currencies: moedas separadas por vírgula (padrão: todas as suportadas)
+    - start_date, end_date: como em /history/<currency_code>
+
+    Um único array `timestamps` (epoch em segundos, do mais antigo ao mais
+    recente) e, em `rates`, um array por moeda alinhado a ele (null quando a
+    moeda não tem amostra naquele instante).
+    """
+    currency_codes = api.parse_currency_list(request.args.get('currencies')) or list(SUPPORTED_CURRENCIES)
+    start_date, end_date = api.parse_history_range(request.args)
+
+    if all(series_covers(code, start_date) for code in currency_codes):
+        timestamps, rates = series_store.history_columnar(currency_codes, start_date, end_date)
+    else:
+        db.require_available()
+        timestamps, rates = await db.get_historical_rates_multi(currency_codes, start_date, end_date)
+
+    return jsonify(api.history_multi_document(currency_codes, start_date, end_date, timestamps, rates)), 200
+
+@app.route('/history/<currency_code>', methods=['GET'])
+async def get_historical_rates(currency_code):
+    """
+    Retorna histórico de taxas para uma moeda
+    Parâmetros: start_date, end_date, format (json, ndjson, csv), limit, after
+    """
+    currency_code = api.parse_currency(currency_code)
+    start_date, end_date = api.parse_history_range(request.args)
+
+    fmt = api.parse_history_format(request.args)
+    if fmt in ('ndjson', 'csv'):
+        db.require_available()
+        mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+        return Response(stream_history(currency_code, start_date, end_date, fmt), mimetype=mimetype)
+
+    page = api.parse_history_page(request.args)
+    if page is not None:
+        limit, after = page
+        db.require_available()
+        history, next_after = await db.get_historical_rates_page(
+            currency_code, start_date, end_date, after=after, limit=limit
+        )
+        return jsonify(api.history_page_document(currency_code, start_date, end_date, history, next_after)), 200
+
+    if series_covers(currency_code, start_date):
+        history = series_store.history(currency_code, start_date, end_date)
+    else:
+        db.require_available()
+        history = await db.get_historical_rates(currency_code, start_date, end_date)
+
+    return jsonify(api.history_document(currency_code, start_date, end_date, history)), 200
+
+async def stream_export(currency_codes, start_date, end_date, fmt):
+    """Gera o arquivo Parquet/Arrow bloco a bloco a partir de um cursor no servidor"""
+    try:
+        chunks = db.iter_export_rates(currency_codes, start_date, end_date, api.EXPORT_CHUNK_SIZE)
+        async for data in rate_export.aiter_export(chunks, fmt):
+            yield data
+    except Exception as e:
+        # Sem o footer/fim do stream o cliente percebe que o arquivo está truncado
+        app.logger.error(f"Erro na exportação: {str(e)}")
+
+@app.route('/export/rates', methods=['GET'])
+async def export_rates():
+    """
+    Exporta exchange_rates em formato colunar, em streaming
+    Parâmetros:
+    - format: parquet (padrão) ou arrow (Arrow IPC stream)
+    - currencies: moedas separadas por vírgula (padrão: todas)
+    - start_date, end_date: limites de recorded_at (padrão: sem limite)
+
+    O arquivo pode ser carregado de volta com `python manage.py import-rates`.
+
+    Exemplo: /export/rates?format=parquet&currencies=USD,EUR&start_date=2024-01-01
+    """
+    fmt, currency_codes, start_date, end_date = api.parse_export(request.args)
+
+    db.require_available()
+    filename = f"exchange_rates{rate_export.EXTENSIONS[fmt]}"
+    return Response(
+        stream_export(currency_codes, start_date, end_date, fmt),
+        mimetype=rate_export.FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+@app.route('/stats/<currency_code>', methods=['GET'])
+async def get_currency_stats(currency_code):
+    """
+    Retorna estatísticas diárias para uma moeda
+    Parâmetros:
+    - days: número de dias (padrão: 30)
+    """
+    currency_code = api.parse_currency(currency_code)
+    days = api.parse_stats_days(request.args)
+
+    start_date = datetime.now().date() - timedelta(days=days)
+    if series_covers(currency_code, datetime.combine(start_date, datetime.min.time())):
+        stats = series_store.daily_stats(currency_code, start_date, datetime.now())
+    else:
+        db.require_available()
+        stats = await db.get_daily_stats(currency_code, days)
+
+    return jsonify(api.stats_document(currency_code, days, stats)), 200
+
+@app.route('/ohlc/<currency_code>', methods=['GET'])
+async def get_ohlc(currency_code):
+    """
+    Retorna candles OHLC (abertura, máxima, mínima, fechamento) de uma moeda
+    Parâmetros:
+    - interval: 1m, 5m, 15m, 30m, 1h, 4h, 1d ou 1w (padrão: 1h)
+    - start: início do período (padrão: 500 candles antes de end)
+    - end: fim do período (padrão: agora; data sem hora vale até o fim do dia)
+    """
+    currency_code = api.parse_currency(currency_code)
+    interval, start, end = api.parse_ohlc(request.args)
+
+    db.require_available()
+    candles = await db.get_ohlc(currency_code, interval, start, end)
+
+    return jsonify(api.ohlc_document(currency_code, interval, start, end, candles)), 200
+
+@app.route('/rate-at-date/<currency_code>', methods=['GET'])
+async def get_rate_at_specific_date(currency_code):
+    """
+    Retorna a taxa de uma moeda em uma data específica
+    Parâmetros:
+    - date: data desejada (formato: YYYY-MM-DD ou timestamp ISO)
+    - asof: se true, retorna a última taxa até a data
+    """
+    currency_code = api.parse_currency(currency_code)
+    date_str, target_date, as_of = api.parse_rate_at_date(request.args)
+
+    if as_of is not None:
+        db.require_available()
+        rate_data = await db.get_rate_as_of(currency_code, as_of)
+    elif series_covers(currency_code, datetime.combine(target_date.date(), datetime.min.time())):
+        rate_data = series_store.rate_at(currency_code, target_date.date())
+    else:
+        db.require_available()
+        rate_data = await db.get_rate_at_date(currency_code, target_date)
+
+    return jsonify(api.rate_at_date_document(currency_code, date_str, target_date, rate_data)), 200
+
+@app.route('/rate-at-date', methods=['POST'])
+async def get_rates_at_dates_batch():
+    """Retorna a taxa vigente para vários pares moeda/data em uma consulta"""
+    results, lookups, positions = api.parse_as_of_batch(await request.get_json(silent=True))
+
+    db.require_available()
+    found = await db.get_rates_as_of_batch(lookups)
+
+    return jsonify(api.as_of_batch_document(results, positions, found)), 200
+
+@app.route('/', methods=['GET'])
+async def root():
+    """Endpoint raiz com informações da API (serializado e comprimido uma vez por snapshot)"""
+    snapshot = refresher.snapshot
+
+    async def build():
+        return api.root_document(stream=True, server='asgi'), None
+
+    payload = await get_prepared_payload('root', snapshot, build)
+    return await payload_response(payload, seconds_until_refresh(snapshot))
+
+if __name__ == '__main__':
+    import uvicorn
+    port = int(os.environ.get('PORT', 5000))
+    uvicorn.run(app, host='0.0.0.0', port=port)
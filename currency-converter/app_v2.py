@@ -1,148 +1,399 @@
-from flask import Flask, jsonify, request
-import requests
+from flask import Flask, Response, g, jsonify, request, stream_with_context
 from datetime import datetime, timedelta
-from dateutil import parser
+import atexit
 import os
+import threading
+import time
 import logging
-from database import DatabaseManager
+from api_common import SUPPORTED_CURRENCIES, ApiError
+from database import HISTORY_FIELDS, DatabaseManager
+from conversion import CrossRateMatrix, convert_batch
+from http_cache import compress_response, payload_response, prepare_payload
+from response_encoding import MIMETYPES, Records, ResponseEncoder
+from series_cache import SeriesStore
+from rate_refresher import RateRefresher, SnapshotFile, snapshot_from_latest
+from rate_coordinator import RateCoordinator
+from circuit_breaker import CircuitOpenError
+from rate_providers import DEFAULT_PROVIDERS, RateFetcher, build_providers
+from write_behind import WriteBehindQueue
+import api_common as api
+import rate_export
+import metrics
 
 app = Flask(__name__)
 logging.basicConfig(level=logging.INFO)
+# jsonify negocia JSON/MessagePack pelo Accept; backend JSON: orjson (padrão) ou json
+app.json = ResponseEncoder(app, request, json_backend=os.environ.get('RESPONSE_JSON_BACKEND', 'orjson'))
 
-# Cache para taxas de câmbio
-cache = {
-    'rates': {},
-    'last_update': None
-}
-
-SUPPORTED_CURRENCIES = ['USD', 'EUR', 'CAD', 'CHF', 'GBP', 'JPY', 'CNY']
 CACHE_DURATION_MINUTES = 30
+# Atualiza antes do cache vencer, para que nenhuma requisição veja taxas velhas
+REFRESH_INTERVAL_MINUTES = float(os.environ.get('RATE_REFRESH_INTERVAL_MINUTES', 25))
+REFRESH_RETRY_SECONDS = float(os.environ.get('RATE_REFRESH_RETRY_SECONDS', 60))
+LATEST_RATES_CACHE_SECONDS = int(os.environ.get('LATEST_RATES_CACHE_SECONDS', 60))
+# Cache opcional em memória do histórico recente (/history, /stats, /rate-at-date)
+SERIES_CACHE_ENABLED = os.environ.get('SERIES_CACHE_ENABLED', 'false').lower() == 'true'
+SERIES_CACHE_DAYS = int(os.environ.get('SERIES_CACHE_DAYS', 90))
+SERIES_CACHE_MAX_MB = float(os.environ.get('SERIES_CACHE_MAX_MB', 32))
+SERIES_SYNC_OVERLAP_SECONDS = int(os.environ.get('SERIES_SYNC_OVERLAP_SECONDS', 300))
+EXCHANGE_API_URL = os.environ.get('EXCHANGE_API_URL', 'https://api.exchangerate-api.com/v4/latest/BRL')
+# Provedores de taxas pela ordem de preferência ('fake' = provedor local, sem rede)
+RATE_PROVIDERS = [name.strip() for name in os.environ.get('RATE_PROVIDERS', DEFAULT_PROVIDERS).split(',') if name.strip()]
+RATE_PROVIDER_TIMEOUT_SECONDS = float(os.environ.get('RATE_PROVIDER_TIMEOUT_SECONDS', 5))
+RATE_PROVIDER_RETRIES = int(os.environ.get('RATE_PROVIDER_RETRIES', 2))
+RATE_PROVIDER_HEDGE_SECONDS = float(os.environ.get('RATE_PROVIDER_HEDGE_SECONDS', 2))
+# 'advisory-lock': um processo por vez busca e grava; os demais recarregam via LISTEN/NOTIFY
+RATE_COORDINATION = os.environ.get('RATE_COORDINATION', 'none').lower()
+# Snapshots que não chegam ao banco ficam neste diretório até ele voltar
+WRITE_BEHIND_SPOOL_DIR = os.environ.get('WRITE_BEHIND_SPOOL_DIR', '/tmp/currency-spool')
+WRITE_BEHIND_BATCH_SIZE = int(os.environ.get('WRITE_BEHIND_BATCH_SIZE', 100))
+WRITE_BEHIND_RETRY_SECONDS = float(os.environ.get('WRITE_BEHIND_RETRY_SECONDS', 10))
+# Último snapshot de taxas em disco, para aquecer o cache na inicialização sem o banco
+RATE_SNAPSHOT_FILE = os.environ.get('RATE_SNAPSHOT_FILE', os.path.join(WRITE_BEHIND_SPOOL_DIR, 'latest-snapshot.json'))
+
+# Inicializa o banco de dados; o pool conecta em segundo plano (warm_start) ou na
+# primeira consulta, nunca durante o import
+db = DatabaseManager(connect=False)
+
+# Fila de escrita: grava os snapshots em segundo plano, com spool local se o banco cair
+write_queue = WriteBehindQueue(
+    db,
+    WRITE_BEHIND_SPOOL_DIR,
+    batch_size=WRITE_BEHIND_BATCH_SIZE,
+    retry_seconds=WRITE_BEHIND_RETRY_SECONDS
+)
+write_queue.start()
+atexit.register(write_queue.stop)
+
+# Sessão HTTP persistente, com retry e hedge entre os provedores
+rate_fetcher = RateFetcher(
+    build_providers(RATE_PROVIDERS, EXCHANGE_API_URL),
+    SUPPORTED_CURRENCIES,
+    timeout=RATE_PROVIDER_TIMEOUT_SECONDS,
+    retries=RATE_PROVIDER_RETRIES,
+    hedge_after=RATE_PROVIDER_HEDGE_SECONDS
+)
+
+def fetch_upstream_rates():
+    """
+    Busca as taxas de câmbio nos provedores, sem gravar
+
+    Returns:
+        Tupla (taxas, nome do provedor que respondeu)
+    """
+    return rate_fetcher.fetch()
+
+def fetch_exchange_rates():
+    """Busca as taxas de câmbio nos provedores e enfileira a gravação, com o provedor em `source`"""
+    rates, source = fetch_upstream_rates()
+    
+    # Grava no banco pela fila de escrita, fora do caminho da atualização
+    write_queue.submit(rates, source=source)
+    
+    app.logger.info(f"Taxas atualizadas com sucesso: {rates}")
+    return rates
 
-# Inicializa o banco de dados
-db = DatabaseManager()
+# Só no modo coordenado: a busca passa pelo advisory lock e o LISTEN recarrega as taxas
+coordinator = None
+if RATE_COORDINATION == 'advisory-lock':
+    coordinator = RateCoordinator(
+        db,
+        fetch_upstream_rates,
+        # Gravação de outro processo mais nova que isso é reaproveitada
+        fresh_seconds=REFRESH_INTERVAL_MINUTES * 60 * 0.8,
+        write_behind=write_queue
+    )
+
+# Atualizador em segundo plano: troca o snapshot de taxas de forma atômica
+refresher = RateRefresher(
+    coordinator.fetch_rates if coordinator is not None else fetch_exchange_rates,
+    interval_seconds=REFRESH_INTERVAL_MINUTES * 60,
+    retry_seconds=REFRESH_RETRY_SECONDS
+)
 
 def update_exchange_rates():
-    """Atualiza as taxas de câmbio usando API e salva no banco"""
+    """Força uma atualização das taxas (colapsada com qualquer busca em andamento)"""
+    return refresher.refresh()
+
+def get_cached_snapshot():
+    """
+    Retorna o snapshot atual sem fazer I/O
+
+    Se o snapshot estiver vazio ou vencido, apenas pede uma atualização em
+    segundo plano.
+    """
+    snapshot = refresher.snapshot
+    
+    if not snapshot.rates or not snapshot.last_update:
+        metrics.CACHE_LOOKUPS.labels('miss').inc()
+        refresher.trigger()
+    elif (datetime.now() - snapshot.last_update) > timedelta(minutes=CACHE_DURATION_MINUTES):
+        metrics.CACHE_LOOKUPS.labels('stale').inc()
+        refresher.trigger()
+    else:
+        metrics.CACHE_LOOKUPS.labels('hit').inc()
+    
+    return snapshot
+
+def get_cached_rates():
+    """Retorna as taxas do snapshot em cache"""
+    return get_cached_snapshot().rates
+
+# Matriz de taxas cruzadas, reconstruída a cada troca de snapshot
+cross_rates = CrossRateMatrix(refresher.snapshot, app.json.encode)
+
+def update_cross_rates(previous, snapshot):
+    """Listener do atualizador: recalcula a matriz N×N para o novo snapshot"""
+    global cross_rates
+    cross_rates = CrossRateMatrix(snapshot, app.json.encode)
+
+def get_cross_rates():
+    """Retorna a matriz de taxas cruzadas do snapshot em cache"""
+    get_cached_snapshot()
+    return cross_rates
+
+# Corpos de /rates, /rates/latest e / serializados (e comprimidos) uma vez por snapshot e formato:
+# {(chave, formato): (snapshot, PreparedPayload)}
+prepared_payloads = {}
+
+def get_prepared_payload(key, snapshot, build, ttl=None):
+    """
+    Retorna o corpo pré-serializado de `key` para o snapshot atual, no formato
+    negociado pelo Accept
+
+    `build` só é chamado quando o snapshot mudou ou, com `ttl`, quando o corpo
+    montado tem mais de `ttl` segundos. Retorna (dados, last_modified).
+    """
+    fmt = app.json.negotiate()
+    now = time.monotonic()
+    entry = prepared_payloads.get((key, fmt))
+    if entry is not None and entry[0] is snapshot:
+        if ttl is None or now - entry[1].created_at < ttl:
+            return entry[1]
+    
+    data, last_modified = build()
+    payload = prepare_payload(app.json.encode(data, fmt), last_modified, now, MIMETYPES[fmt])
+    prepared_payloads[(key, fmt)] = (snapshot, payload)
+    return payload
+
+def seconds_until_refresh(snapshot):
+    """Segundos até o snapshot ser substituído pela próxima atualização agendada"""
+    if not snapshot.last_update:
+        return 0
+    age = (datetime.now() - snapshot.last_update).total_seconds()
+    return REFRESH_INTERVAL_MINUTES * 60 - age
+
+# Séries em memória, carregadas na inicialização e sincronizadas a cada atualização
+series_store = SeriesStore(int(SERIES_CACHE_MAX_MB * 1024 * 1024)) if SERIES_CACHE_ENABLED else None
+series_load_lock = threading.Lock()
+
+def load_series_store():
+    """Carrega os últimos SERIES_CACHE_DAYS dias de amostras no cache de séries"""
+    if not series_load_lock.acquire(blocking=False):
+        return
     try:
-        # Usando exchangerate-api (gratuita)
-        api_key = os.environ.get('EXCHANGE_API_KEY', 'demo')
-        url = f"https://api.exchangerate-api.com/v4/latest/BRL"
-        
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Inverter as taxas (queremos de moeda estrangeira para BRL)
-        rates = {}
-        for currency in SUPPORTED_CURRENCIES:
-            if currency in data['rates']:
-                # Taxa inversa (de moeda estrangeira para BRL)
-                rates[currency] = 1 / data['rates'][currency]
-        
-        # Atualiza cache
-        cache['rates'] = rates
-        cache['last_update'] = datetime.now()
-        
-        # Salva no banco de dados
-        db.save_rates(rates)
-        
-        app.logger.info(f"Taxas atualizadas com sucesso: {rates}")
-        return True
+        since = datetime.now() - timedelta(days=SERIES_CACHE_DAYS)
+        for rows in db.iter_raw_rates(since=since):
+            series_store.add(rows)
+        series_store.mark_loaded(since)
+        app.logger.info(f"Cache de séries carregado: {series_store.stats()['samples']}")
     except Exception as e:
-        app.logger.error(f"Erro ao atualizar taxas: {str(e)}")
-        return False
+        app.logger.error(f"Erro ao carregar cache de séries: {str(e)}")
+    finally:
+        series_load_lock.release()
 
-def get_cached_rates():
-    """Retorna taxas do cache ou atualiza se necessário"""
-    now = datetime.now()
-    
-    if not cache['rates'] or not cache['last_update']:
-        update_exchange_rates()
-    elif (now - cache['last_update']) > timedelta(minutes=CACHE_DURATION_MINUTES):
-        update_exchange_rates()
-    
-    return cache['rates']
+def sync_series_store(*_):
+    """
+    Acrescenta ao cache de séries as amostras gravadas desde a última sincronização
+
+    Listener da fila de escrita (chamado depois do commit de cada lote) e, no
+    modo coordenado, do atualizador, que só publica taxas já gravadas.
+    Relê as amostras gravadas nos últimos SERIES_SYNC_OVERLAP_SECONDS antes
+    da última sincronização (transações que confirmaram fora da ordem dos
+    ids); as que o cache já tem são ignoradas pelo id.
+    """
+    if not series_store.ready:
+        load_series_store()
+        return
+    try:
+        created_since = series_store.sync_from(timedelta(seconds=SERIES_SYNC_OVERLAP_SECONDS))
+        for rows in db.iter_raw_rates(since=series_store.loaded_from, created_since=created_since):
+            series_store.add(rows)
+    except Exception as e:
+        app.logger.error(f"Erro ao sincronizar cache de séries: {str(e)}")
+
+def series_covers(currency_code, start):
+    """True se o cache de séries pode responder a partir de `start` sem ir ao banco"""
+    return series_store is not None and series_store.covers(currency_code, start)
+
+# Último snapshot em disco, regravado a cada troca de snapshot
+snapshot_file = SnapshotFile(RATE_SNAPSHOT_FILE)
+
+def warm_start():
+    """
+    Inicialização em segundo plano (no gunicorn, já dentro de cada worker)
+
+    Conecta ao banco, aquece o cache com latest_rates se for mais novo que o
+    snapshot local e só então inicia o atualizador, que adia a primeira busca
+    enquanto o snapshot aquecido estiver dentro do intervalo. Sem snapshot
+    nenhum, a busca nos provedores começa na hora, junto com a conexão.
+    """
+    if not refresher.snapshot.rates:
+        refresher.start()
+    if db.connect():
+        refresher.warm(snapshot_from_latest(db.get_latest_rates()))
+    if series_store is not None:
+        load_series_store()
+        # Sincroniza depois da gravação, não na troca do snapshot: a fila grava em segundo plano
+        write_queue.add_listener(sync_series_store)
+        if coordinator is not None:
+            refresher.add_listener(sync_series_store)
+    if coordinator is not None:
+        coordinator.start_listener(refresher.set_rates)
+    refresher.start()
+
+# O snapshot local é lido já no import (sem rede): o pod fica pronto sem esperar banco nem provedores
+refresher.add_listener(update_cross_rates)
+refresher.warm(snapshot_file.load())
+refresher.add_listener(snapshot_file.save)
+threading.Thread(target=warm_start, name='warm-start', daemon=True).start()
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Registra a latência da requisição por rota (padrão da URL) e status"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        metrics.observe_request(
+            request.method,
+            request.url_rule.rule if request.url_rule is not None else None,
+            response.status_code,
+            time.perf_counter() - started
+        )
+    return response
+
+@app.after_request
+def mark_degraded_mode(response):
+    """Com o banco indisponível, toda resposta sai marcada como modo degradado"""
+    if not db.is_available():
+        response.headers['X-Degraded-Mode'] = 'database-unavailable'
+    return response
+
+@app.after_request
+def compress_body(response):
+    """Comprime (br ou gzip, pelo Accept-Encoding) as respostas acima de COMPRESSION_MIN_BYTES"""
+    return compress_response(response, request.accept_encodings)
+
+@app.errorhandler(ApiError)
+def api_error(e):
+    """Parâmetro inválido ou recurso indisponível (api_common.ApiError)"""
+    return jsonify({'error': e.message}), e.status
+
+@app.errorhandler(CircuitOpenError)
+def database_unavailable(e):
+    """Rotas que dependem do banco falham na hora enquanto o circuit breaker está aberto"""
+    response = jsonify(api.database_unavailable_document())
+    response.headers['Retry-After'] = str(max(1, int(e.retry_in + 0.5)))
+    return response, 503
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Métricas no formato do Prometheus (somadas entre os workers do gunicorn)"""
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Endpoint de health check para Kubernetes"""
-    return jsonify({
-        'status': 'healthy',
-        'timestamp': datetime.now().isoformat(),
-        'rates_available': len(cache['rates']) > 0,
-        'database_connected': db.ensure_connection()
-    }), 200
+    """
+    Endpoint de health check para Kubernetes
+
+    Não faz I/O: o estado do banco vem do circuit breaker, para que o probe
+    de liveness não espere timeouts de conexão com o banco fora do ar.
+    """
+    return jsonify(api.health_document(
+        db.is_available(), refresher.snapshot, db, rate_fetcher, write_queue, series_store
+    )), 200
 
 @app.route('/ready', methods=['GET'])
 def readiness_check():
-    """Endpoint de readiness para Kubernetes"""
-    if cache['rates'] and db.ensure_connection():
-        return jsonify({'status': 'ready'}), 200
-    else:
-        return jsonify({'status': 'not ready'}), 503
+    """
+    Endpoint de readiness para Kubernetes
+
+    Com taxas em cache o pod continua pronto mesmo com o banco fora do ar
+    (modo degradado: /rates e /convert seguem respondendo).
+    """
+    document, status = api.ready_document(refresher.snapshot, db.is_available())
+    return jsonify(document), status
 
 @app.route('/rates', methods=['GET'])
 def get_rates():
     """Retorna todas as taxas de câmbio atuais (moeda estrangeira -> BRL)"""
-    rates = get_cached_rates()
+    snapshot = get_cached_snapshot()
+    payload = get_prepared_payload('rates', snapshot, lambda: api.rates_document(snapshot))
+    return payload_response(payload, seconds_until_refresh(snapshot))
+
+@app.route('/rates/matrix', methods=['GET'])
+def get_rates_matrix():
+    """
+    Retorna a matriz N×N de taxas cruzadas (linha = origem, coluna = destino)
+    Parâmetros:
+    - format: json (padrão) ou binary (float64 little-endian, moedas no header X-Currencies)
     
-    return jsonify({
-        'base_currency': 'BRL',
-        'rates': rates,
-        'last_update': cache['last_update'].isoformat() if cache['last_update'] else None,
-        'supported_currencies': SUPPORTED_CURRENCIES
-    }), 200
+    Com Accept: application/msgpack, o mesmo documento do JSON em MessagePack.
+    
+    Exemplo: /rates/matrix?format=binary
+    """
+    matrix = get_cross_rates()
+    
+    if not matrix.snapshot.rates:
+        raise api.rates_unavailable()
+    
+    if request.args.get('format') == 'binary':
+        return Response(
+            matrix.binary,
+            mimetype='application/octet-stream',
+            headers={'X-Currencies': ','.join(matrix.codes)}
+        )
+    
+    fmt = app.json.negotiate()
+    response = Response(matrix.encoded[fmt], mimetype=MIMETYPES[fmt])
+    response.vary.add('Accept')
+    return response
 
 @app.route('/rates/latest', methods=['GET'])
 def get_latest_rates_from_db():
     """Retorna as taxas mais recentes do banco de dados"""
-    rates = db.get_latest_rates()
+    snapshot = get_cached_snapshot()
+    
+    def build():
+        db.require_available()
+        rates = db.get_latest_rates()
+        if not rates:
+            # Falha da consulta pode ter aberto o breaker: responde o 503 do modo degradado
+            db.require_available()
+        return api.latest_rates_document(rates)
+    
+    payload = get_prepared_payload('rates_latest', snapshot, build, ttl=LATEST_RATES_CACHE_SECONDS)
     
-    return jsonify({
-        'base_currency': 'BRL',
-        'rates': rates,
-        'supported_currencies': SUPPORTED_CURRENCIES
-    }), 200
+    remaining = LATEST_RATES_CACHE_SECONDS - (time.monotonic() - payload.created_at)
+    return payload_response(payload, min(remaining, seconds_until_refresh(snapshot)))
 
 @app.route('/convert', methods=['GET'])
 def convert_currency():
     """
-    Converte valor de uma moeda estrangeira para BRL
+    Converte valor entre duas moedas quaisquer (BRL ou moedas suportadas)
     Parâmetros:
-    - from: código da moeda (USD, EUR, etc)
+    - from: código da moeda de origem (USD, EUR, etc)
+    - to: código da moeda de destino (padrão: BRL)
     - amount: valor a converter
     
-    Exemplo: /convert?from=USD&amount=100
+    Exemplo: /convert?from=USD&to=EUR&amount=100
     """
-    from_currency = request.args.get('from', '').upper()
-    amount_str = request.args.get('amount', '0')
-    
-    try:
-        amount = float(amount_str)
-    except ValueError:
-        return jsonify({'error': 'Valor inválido'}), 400
-    
-    if from_currency not in SUPPORTED_CURRENCIES:
-        return jsonify({
-            'error': f'Moeda não suportada. Moedas disponíveis: {SUPPORTED_CURRENCIES}'
-        }), 400
-    
-    rates = get_cached_rates()
-    
-    if from_currency not in rates:
-        return jsonify({'error': 'Taxa de câmbio não disponível'}), 503
-    
-    rate = rates[from_currency]
-    converted_amount = amount * rate
-    
-    return jsonify({
-        'from_currency': from_currency,
-        'to_currency': 'BRL',
-        'original_amount': amount,
-        'converted_amount': round(converted_amount, 2),
-        'exchange_rate': round(rate, 4),
-        'timestamp': datetime.now().isoformat()
-    }), 200
+    from_currency, to_currency, amount = api.parse_convert(request.args)
+    rate = get_cross_rates().rate(from_currency, to_currency)
+    return jsonify(api.convert_document(from_currency, to_currency, amount, rate)), 200
 
 @app.route('/convert/reverse', methods=['GET'])
 def convert_currency_reverse():
@@ -154,35 +405,75 @@ def convert_currency_reverse():
     
     Exemplo: /convert/reverse?to=USD&amount=100
     """
-    to_currency = request.args.get('to', '').upper()
-    amount_str = request.args.get('amount', '0')
+    to_currency, amount = api.parse_convert_reverse(request.args)
+    return jsonify(api.convert_reverse_document(to_currency, amount, get_cached_rates())), 200
+
+def parse_batch_items():
+    """Lê os itens de conversão da requisição: CSV (corpo text/csv ou arquivo no campo 'file') ou JSON"""
+    upload = request.files.get('file')
+    if upload is not None:
+        return api.parse_batch_items(csv_data=upload.read())
+    if request.mimetype == 'text/csv':
+        return api.parse_batch_items(csv_data=request.get_data())
+    return api.parse_batch_items(request.get_json(silent=True))
+
+@app.route('/convert/batch', methods=['POST'])
+def convert_currency_batch():
+    """
+    Converte vários valores em uma requisição, contra o mesmo snapshot de taxas
+    Corpo (JSON):
+    - items: lista de {"from": "USD", "to": "EUR", "amount": 100}
+    Ou CSV com cabeçalho from,to,amount (text/csv ou upload no campo 'file')
     
-    try:
-        amount = float(amount_str)
-    except ValueError:
-        return jsonify({'error': 'Valor inválido'}), 400
+    Exemplo: curl -X POST /convert/batch -H 'Content-Type: text/csv' --data-binary @faturas.csv
+    """
+    items = parse_batch_items()
     
-    if to_currency not in SUPPORTED_CURRENCIES:
-        return jsonify({
-            'error': f'Moeda não suportada. Moedas disponíveis: {SUPPORTED_CURRENCIES}'
-        }), 400
+    matrix = get_cross_rates()
+    if not matrix.snapshot.rates:
+        raise api.rates_unavailable()
+    
+    return jsonify(api.batch_document(matrix.snapshot, convert_batch(matrix, items))), 200
+
+def stream_history(currency_code, start_date, end_date, fmt):
+    """Gera o histórico em blocos NDJSON ou CSV a partir de um cursor no servidor"""
+    if fmt == 'csv':
+        yield api.HISTORY_CSV_HEADER
+    
+    try:
+        for rows in db.iter_historical_rates(currency_code, start_date, end_date, api.HISTORY_STREAM_CHUNK):
+            if fmt == 'csv':
+                yield api.history_csv(rows)
+            else:
+                yield app.json.ndjson(Records(HISTORY_FIELDS, rows))
+    except Exception as e:
+        # Os headers já foram enviados: só resta registrar e encerrar o stream
+        app.logger.error(f"Erro no streaming do histórico: {str(e)}")
+
+@app.route('/history', methods=['GET'])
+def get_historical_rates_multi():
+    """
+    Retorna o histórico de várias moedas em uma requisição, em formato colunar
+    Parâmetros:
+    - currencies: moedas separadas por vírgula (padrão: todas as suportadas)
+    - start_date, end_date: como em /history/<currency_code>
     
-    rates = get_cached_rates()
+    Um único array `timestamps` (epoch em segundos, do mais antigo ao mais
+    recente) e, em `rates`, um array por moeda alinhado a ele (null quando a
+    moeda não tem amostra naquele instante).
     
-    if to_currency not in rates:
-        return jsonify({'error': 'Taxa de câmbio não disponível'}), 503
+    Exemplo: /history?currencies=USD,EUR,GBP&start_date=2024-02-01&end_date=2024-02-10
+    """
+    currency_codes = api.parse_currency_list(request.args.get('currencies')) or list(SUPPORTED_CURRENCIES)
+    start_date, end_date = api.parse_history_range(request.args)
     
-    rate = rates[to_currency]
-    converted_amount = amount / rate
+    if all(series_covers(code, start_date) for code in currency_codes):
+        timestamps, rates = series_store.history_columnar(currency_codes, start_date, end_date)
+    else:
+        db.require_available()
+        timestamps, rates = db.get_historical_rates_multi(currency_codes, start_date, end_date)
     
-    return jsonify({
-        'from_currency': 'BRL',
-        'to_currency': to_currency,
-        'original_amount': amount,
-        'converted_amount': round(converted_amount, 2),
-        'exchange_rate': round(1/rate, 4),
-        'timestamp': datetime.now().isoformat()
-    }), 200
+    return jsonify(api.history_multi_document(currency_codes, start_date, end_date, timestamps, rates)), 200
 
 @app.route('/history/<currency_code>', methods=['GET'])
 def get_historical_rates(currency_code):
@@ -191,43 +482,74 @@ def get_historical_rates(currency_code):
     Parâmetros:
     - start_date: data inicial (formato: YYYY-MM-DD)
     - end_date: data final (formato: YYYY-MM-DD)
+    - format: ndjson ou csv para receber o período inteiro em streaming
+    - limit: tamanho da página (paginação por keyset, do mais recente ao mais antigo)
+    - after: cursor "recorded_at,id" devolvido em next_after pela página anterior
     
     Exemplo: /history/USD?start_date=2024-02-01&end_date=2024-02-10
+    Exemplo: /history/USD?start_date=2020-01-01&format=ndjson
+    Exemplo: /history/USD?limit=500&after=2024-02-10T14:30:00,123
     """
-    currency_code = currency_code.upper()
-    
-    if currency_code not in SUPPORTED_CURRENCIES:
-        return jsonify({
-            'error': f'Moeda não suportada. Moedas disponíveis: {SUPPORTED_CURRENCIES}'
-        }), 400
-    
-    # Parse dates
-    start_date_str = request.args.get('start_date')
-    end_date_str = request.args.get('end_date')
+    currency_code = api.parse_currency(currency_code)
+    start_date, end_date = api.parse_history_range(request.args)
+    
+    fmt = api.parse_history_format(request.args)
+    if fmt in ('ndjson', 'csv'):
+        db.require_available()
+        mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+        return Response(
+            stream_with_context(stream_history(currency_code, start_date, end_date, fmt)),
+            mimetype=mimetype
+        )
+    
+    page = api.parse_history_page(request.args)
+    if page is not None:
+        limit, after = page
+        db.require_available()
+        history, next_after = db.get_historical_rates_page(
+            currency_code, start_date, end_date, after=after, limit=limit
+        )
+        return jsonify(api.history_page_document(currency_code, start_date, end_date, history, next_after)), 200
+    
+    if series_covers(currency_code, start_date):
+        history = series_store.history(currency_code, start_date, end_date)
+    else:
+        db.require_available()
+        history = db.get_historical_rates(currency_code, start_date, end_date)
     
+    return jsonify(api.history_document(currency_code, start_date, end_date, history)), 200
+
+def stream_export(currency_codes, start_date, end_date, fmt):
+    """Gera o arquivo Parquet/Arrow bloco a bloco a partir de um cursor no servidor"""
     try:
-        if start_date_str:
-            start_date = parser.parse(start_date_str)
-        else:
-            start_date = datetime.now() - timedelta(days=30)
-        
-        if end_date_str:
-            end_date = parser.parse(end_date_str)
-        else:
-            end_date = datetime.now()
+        chunks = db.iter_export_rates(currency_codes, start_date, end_date, api.EXPORT_CHUNK_SIZE)
+        yield from rate_export.iter_export(chunks, fmt)
     except Exception as e:
-        return jsonify({'error': f'Formato de data inválido: {str(e)}'}), 400
+        # Sem o footer/fim do stream o cliente percebe que o arquivo está truncado
+        app.logger.error(f"Erro na exportação: {str(e)}")
+
+@app.route('/export/rates', methods=['GET'])
+def export_rates():
+    """
+    Exporta exchange_rates em formato colunar, em streaming
+    Parâmetros:
+    - format: parquet (padrão) ou arrow (Arrow IPC stream)
+    - currencies: moedas separadas por vírgula (padrão: todas)
+    - start_date, end_date: limites de recorded_at (padrão: sem limite)
     
-    history = db.get_historical_rates(currency_code, start_date, end_date)
+    O arquivo pode ser carregado de volta com `python manage.py import-rates`.
     
-    return jsonify({
-        'currency_code': currency_code,
-        'base_currency': 'BRL',
-        'start_date': start_date.isoformat(),
-        'end_date': end_date.isoformat(),
-        'data_points': len(history),
-        'history': history
-    }), 200
+    Exemplo: /export/rates?format=parquet&currencies=USD,EUR&start_date=2024-01-01
+    """
+    fmt, currency_codes, start_date, end_date = api.parse_export(request.args)
+    
+    db.require_available()
+    filename = f"exchange_rates{rate_export.EXTENSIONS[fmt]}"
+    return Response(
+        stream_with_context(stream_export(currency_codes, start_date, end_date, fmt)),
+        mimetype=rate_export.FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
 
 @app.route('/stats/<currency_code>', methods=['GET'])
 def get_currency_stats(currency_code):
@@ -238,94 +560,88 @@ def get_currency_stats(currency_code):
     
     Exemplo: /stats/USD?days=7
     """
-    currency_code = currency_code.upper()
+    currency_code = api.parse_currency(currency_code)
+    days = api.parse_stats_days(request.args)
     
-    if currency_code not in SUPPORTED_CURRENCIES:
-        return jsonify({
-            'error': f'Moeda não suportada. Moedas disponíveis: {SUPPORTED_CURRENCIES}'
-        }), 400
+    start_date = datetime.now().date() - timedelta(days=days)
+    if series_covers(currency_code, datetime.combine(start_date, datetime.min.time())):
+        stats = series_store.daily_stats(currency_code, start_date, datetime.now())
+    else:
+        db.require_available()
+        stats = db.get_daily_stats(currency_code, days)
     
-    days = request.args.get('days', 30, type=int)
+    return jsonify(api.stats_document(currency_code, days, stats)), 200
+
+@app.route('/ohlc/<currency_code>', methods=['GET'])
+def get_ohlc(currency_code):
+    """
+    Retorna candles OHLC (abertura, máxima, mínima, fechamento) de uma moeda
+    Parâmetros:
+    - interval: 1m, 5m, 15m, 30m, 1h, 4h, 1d ou 1w (padrão: 1h)
+    - start: início do período (padrão: 500 candles antes de end)
+    - end: fim do período (padrão: agora; data sem hora vale até o fim do dia)
     
-    if days < 1 or days > 365:
-        return jsonify({'error': 'Dias deve estar entre 1 e 365'}), 400
+    Exemplo: /ohlc/USD?interval=1h&start=2024-01-01&end=2024-12-31
+    Exemplo: /ohlc/EUR?interval=15m&start=2024-02-01T09:00
+    """
+    currency_code = api.parse_currency(currency_code)
+    interval, start, end = api.parse_ohlc(request.args)
     
-    stats = db.get_daily_stats(currency_code, days)
+    db.require_available()
+    candles = db.get_ohlc(currency_code, interval, start, end)
     
-    return jsonify({
-        'currency_code': currency_code,
-        'base_currency': 'BRL',
-        'days_requested': days,
-        'days_available': len(stats),
-        'stats': stats
-    }), 200
+    return jsonify(api.ohlc_document(currency_code, interval, start, end, candles)), 200
 
 @app.route('/rate-at-date/<currency_code>', methods=['GET'])
 def get_rate_at_specific_date(currency_code):
     """
     Retorna a taxa de uma moeda em uma data específica
     Parâmetros:
-    - date: data desejada (formato: YYYY-MM-DD)
+    - date: data desejada (formato: YYYY-MM-DD ou timestamp ISO)
+    - asof: se true, retorna a última taxa até a data (fim do dia) ou o
+      timestamp, mesmo que não haja amostra naquele dia
     
     Exemplo: /rate-at-date/USD?date=2024-02-01
+    Exemplo: /rate-at-date/USD?date=2024-02-03&asof=true
     """
-    currency_code = currency_code.upper()
-    
-    if currency_code not in SUPPORTED_CURRENCIES:
-        return jsonify({
-            'error': f'Moeda não suportada. Moedas disponíveis: {SUPPORTED_CURRENCIES}'
-        }), 400
-    
-    date_str = request.args.get('date')
-    
-    if not date_str:
-        return jsonify({'error': 'Parâmetro date é obrigatório'}), 400
+    currency_code = api.parse_currency(currency_code)
+    date_str, target_date, as_of = api.parse_rate_at_date(request.args)
+    
+    if as_of is not None:
+        db.require_available()
+        rate_data = db.get_rate_as_of(currency_code, as_of)
+    elif series_covers(currency_code, datetime.combine(target_date.date(), datetime.min.time())):
+        rate_data = series_store.rate_at(currency_code, target_date.date())
+    else:
+        db.require_available()
+        rate_data = db.get_rate_at_date(currency_code, target_date)
     
-    try:
-        target_date = parser.parse(date_str)
-    except Exception as e:
-        return jsonify({'error': f'Formato de data inválido: {str(e)}'}), 400
+    return jsonify(api.rate_at_date_document(currency_code, date_str, target_date, rate_data)), 200
+
+@app.route('/rate-at-date', methods=['POST'])
+def get_rates_at_dates_batch():
+    """
+    Retorna a taxa vigente (última até a data) para vários pares moeda/data em uma consulta
+    Corpo (JSON):
+    - items: lista de {"currency": "USD", "date": "2024-02-01"}
     
-    rate_data = db.get_rate_at_date(currency_code, target_date)
+    Data sem hora vale até o fim do dia; timestamps ISO são usados como estão.
+    """
+    results, lookups, positions = api.parse_as_of_batch(request.get_json(silent=True))
     
-    if not rate_data:
-        return jsonify({
-            'error': f'Nenhuma taxa encontrada para {currency_code} em {date_str}'
-        }), 404
+    db.require_available()
+    found = db.get_rates_as_of_batch(lookups)
     
-    return jsonify({
-        'currency_code': currency_code,
-        'base_currency': 'BRL',
-        'requested_date': target_date.date().isoformat(),
-        'rate': rate_data['rate'],
-        'recorded_at': rate_data['recorded_at']
-    }), 200
+    return jsonify(api.as_of_batch_document(results, positions, found)), 200
 
 @app.route('/', methods=['GET'])
 def root():
-    """Endpoint raiz com informações da API"""
-    return jsonify({
-        'service': 'Currency Converter API',
-        'version': '2.0.0',
-        'features': ['Real-time rates', 'Historical data', 'Daily statistics'],
-        'endpoints': {
-            '/health': 'Health check',
-            '/ready': 'Readiness check',
-            '/rates': 'Get current exchange rates (cached)',
-            '/rates/latest': 'Get latest rates from database',
-            '/convert?from=USD&amount=100': 'Convert foreign currency to BRL',
-            '/convert/reverse?to=USD&amount=100': 'Convert BRL to foreign currency',
-            '/history/USD?start_date=2024-02-01&end_date=2024-02-10': 'Get historical rates',
-            '/stats/USD?days=30': 'Get daily statistics',
-            '/rate-at-date/USD?date=2024-02-01': 'Get rate at specific date'
-        },
-        'supported_currencies': SUPPORTED_CURRENCIES
-    }), 200
+    """Endpoint raiz com informações da API (serializado e comprimido uma vez por snapshot)"""
+    snapshot = refresher.snapshot
+    payload = get_prepared_payload('root', snapshot, lambda: (api.root_document(), None))
+    return payload_response(payload, seconds_until_refresh(snapshot))
 
 if __name__ == '__main__':
-    # Atualiza taxas na inicialização
-    update_exchange_rates()
-    
     # Roda o servidor
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
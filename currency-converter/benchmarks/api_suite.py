@@ -0,0 +1,251 @@
+"""
+Suíte de benchmark da API (app_v2 no gunicorn) para comparar mudanças
+
+Popula exchange_rates com N anos de amostras, sobe o servidor apontando para
+um upstream falso e mede requisições/s e latências p50/p99 de /convert,
+/rates, /history, /stats, /ohlc e /rate-at-date em vários níveis de concorrência.
+Os resultados vão para um JSON; com --compare, cada medição é comparada com
+um JSON anterior e a saída é 1 se alguma piorou além de --threshold.
+
+O banco vem das variáveis DB_* (um Postgres local ou o do docker-compose.yml:
+`docker compose up -d postgres`). As amostras geradas têm source='benchmark'
+e ficam no banco entre execuções (--clean-seed remove): rode contra um banco
+descartável.
+
+Uso:
+    DB_HOST=localhost DB_USER=currency_user DB_PASSWORD=changeme123 \\
+        python benchmarks/api_suite.py --seed-years 2 --concurrency 1,16,64 --json atual.json
+    python benchmarks/api_suite.py --skip-seed --json novo.json --compare atual.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from database import DatabaseManager  # noqa: E402
+from load_test import (  # noqa: E402
+    APP_DIR, CURRENCIES, SERVERS, run_load, start_server, start_stub_upstream, stop_server
+)
+
+SOURCE = 'benchmark'
+PATHS_PER_SCENARIO = 500
+
+
+def seeded_range(db):
+    """Retorna (primeira, última, linhas) das amostras de benchmark, ou (None, None, 0)"""
+    with db.pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT MIN(recorded_at), MAX(recorded_at), COUNT(*)
+                FROM exchange_rates
+                WHERE source = %s
+            """, (SOURCE,))
+            return cur.fetchone()
+
+
+def clean_seed(db):
+    with db.pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM exchange_rates WHERE source = %s", (SOURCE,))
+        conn.commit()
+
+
+def seed(db, years, interval_minutes, batch_snapshots=500):
+    """
+    Grava `years` anos de snapshots (um a cada `interval_minutes`) até agora
+
+    As taxas seguem um passeio aleatório por moeda, para que /stats e os
+    rollups tenham mínimo, máximo e média diferentes.
+    """
+    end = datetime.now().replace(second=0, microsecond=0)
+    start = end - timedelta(days=365 * years)
+    step = timedelta(minutes=interval_minutes)
+    rates = {code: random.uniform(0.05, 7) for code in CURRENCIES}
+
+    batch = []
+    rows = 0
+    recorded_at = start
+    started = time.perf_counter()
+    while recorded_at < end:
+        rates = {code: max(0.0001, rate * random.uniform(0.995, 1.005)) for code, rate in rates.items()}
+        batch.append(({code: round(rate, 6) for code, rate in rates.items()}, recorded_at, SOURCE))
+        recorded_at += step
+        if len(batch) >= batch_snapshots:
+            if not db.save_rates_bulk(batch):
+                raise RuntimeError('falha ao gravar amostras de benchmark')
+            rows += len(batch) * len(CURRENCIES)
+            batch = []
+    if batch and not db.save_rates_bulk(batch):
+        raise RuntimeError('falha ao gravar amostras de benchmark')
+    rows += len(batch) * len(CURRENCIES)
+    return start, end, rows, time.perf_counter() - started
+
+
+def build_scenarios(first, last):
+    """Rotas de cada cenário, com moedas e datas sorteadas dentro do período populado"""
+    span_days = max(1, (last - first).days)
+
+    def random_day(margin=0):
+        return (first + timedelta(days=random.randint(0, max(0, span_days - margin)))).date()
+
+    def ohlc_path():
+        start = random_day(30)
+        interval = random.choice(['15m', '1h', '4h', '1d'])
+        return f'/ohlc/{random.choice(CURRENCIES)}?interval={interval}&start={start}&end={start + timedelta(days=30)}'
+
+    def history_path():
+        start = random_day(30)
+        end = start + timedelta(days=random.randint(1, 30))
+        return f'/history/{random.choice(CURRENCIES)}?start_date={start}&end_date={end}&limit=500'
+
+    return {
+        'convert': [
+            f'/convert?from={random.choice(CURRENCIES)}&to={random.choice(CURRENCIES)}&amount=100'
+            for _ in range(PATHS_PER_SCENARIO)
+        ],
+        'rates': ['/rates', '/rates/latest'],
+        'history': [history_path() for _ in range(PATHS_PER_SCENARIO)],
+        'stats': [
+            f'/stats/{random.choice(CURRENCIES)}?days={random.choice([7, 30, 365])}'
+            for _ in range(PATHS_PER_SCENARIO)
+        ],
+        'ohlc': [ohlc_path() for _ in range(PATHS_PER_SCENARIO)],
+        'rate-at-date': [
+            f'/rate-at-date/{random.choice(CURRENCIES)}?date={random_day()}&asof=true'
+            for _ in range(PATHS_PER_SCENARIO)
+        ]
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=APP_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    """Imprime a variação em relação ao baseline e retorna as medições que pioraram"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(r['scenario'], r['concurrency']): r for r in json.load(f)['results']}
+
+    regressions = []
+    print(f"\n{'cenário':<14} {'conc':>5} {'req/s':>16} {'p50 ms':>16} {'p99 ms':>16}")
+    for result in results:
+        old = baseline.get((result['scenario'], result['concurrency']))
+        if old is None:
+            continue
+        deltas = {
+            key: (result[key] - old[key]) / old[key] if old[key] else 0.0
+            for key in ('rps', 'p50_ms', 'p99_ms')
+        }
+        worse = deltas['rps'] < -threshold or deltas['p99_ms'] > threshold
+        if worse:
+            regressions.append(result)
+        print(f"{result['scenario']:<14} {result['concurrency']:>5} "
+              f"{result['rps']:>8.1f} ({deltas['rps']:+6.1%}) "
+              f"{result['p50_ms']:>7.1f} ({deltas['p50_ms']:+6.1%}) "
+              f"{result['p99_ms']:>7.1f} ({deltas['p99_ms']:+6.1%})"
+              f"{'  <- pior' if worse else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Suíte de benchmark da API (app_v2 no gunicorn)')
+    parser.add_argument('--server', default='gunicorn', choices=sorted(SERVERS))
+    parser.add_argument('--workers', type=int, default=2, help='Processos do servidor (o Dockerfile usa 2)')
+    parser.add_argument('--scenarios', default='convert,rates,history,stats,ohlc,rate-at-date')
+    parser.add_argument('--concurrency', default='1,16,64', help='Níveis de concorrência, separados por vírgula')
+    parser.add_argument('--duration', type=float, default=10, help='Segundos por cenário e nível')
+    parser.add_argument('--seed-years', type=float, default=1)
+    parser.add_argument('--seed-interval-minutes', type=int, default=60)
+    parser.add_argument('--skip-seed', action='store_true', help='Usa as amostras já gravadas')
+    parser.add_argument('--clean-seed', action='store_true', help='Remove as amostras ao final')
+    parser.add_argument('--upstream-delay', type=float, default=0.2)
+    parser.add_argument('--json', help='Grava os resultados neste arquivo')
+    parser.add_argument('--compare', help='JSON de uma execução anterior para comparar')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Piora relativa de req/s ou p99 que conta como regressão')
+    args = parser.parse_args()
+
+    random.seed(42)
+    db = DatabaseManager()
+    try:
+        first, last, rows = seeded_range(db)
+        if not args.skip_seed:
+            wanted = datetime.now() - timedelta(days=365 * args.seed_years)
+            if first is None or first > wanted + timedelta(days=1):
+                clean_seed(db)
+                first, last, rows, elapsed = seed(db, args.seed_years, args.seed_interval_minutes)
+                print(f"Gravou {rows} amostras ({args.seed_years} ano(s)) em {elapsed:.1f}s")
+        if first is None:
+            raise SystemExit('Sem amostras de benchmark no banco; rode sem --skip-seed')
+        print(f"Amostras de benchmark: {rows} linhas de {first:%Y-%m-%d} a {last:%Y-%m-%d}")
+
+        scenarios = build_scenarios(first, last)
+        levels = [int(level) for level in args.concurrency.split(',')]
+
+        upstream = start_stub_upstream(args.upstream_delay)
+        env = dict(os.environ)
+        env['EXCHANGE_API_URL'] = f'http://127.0.0.1:{upstream.server_address[1]}/v4/latest/BRL'
+        env['RATE_PROVIDERS'] = 'exchangerate-api'
+        env['PYTHONUNBUFFERED'] = '1'
+
+        results = []
+        print(f"\n{'cenário':<14} {'conc':>5} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'erros':>6}")
+        proc, base_url = start_server(args.server, args.workers, env)
+        try:
+            for scenario in args.scenarios.split(','):
+                for level in levels:
+                    stats = asyncio.run(run_load(base_url, scenarios[scenario], level, args.duration))
+                    stats.update(scenario=scenario, concurrency=level)
+                    results.append(stats)
+                    print(f"{scenario:<14} {level:>5} {stats['rps']:>9.1f} {stats['p50_ms']:>8.1f} "
+                          f"{stats['p99_ms']:>8.1f} {stats['errors']:>6}")
+        finally:
+            stop_server(proc)
+            upstream.shutdown()
+
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'timestamp': datetime.now().isoformat(),
+                    'git_revision': git_revision(),
+                    'python': platform.python_version(),
+                    'cpus': os.cpu_count(),
+                    'server': args.server,
+                    'workers': args.workers,
+                    'duration': args.duration,
+                    'seed': {
+                        'rows': rows,
+                        'first': first.isoformat(),
+                        'last': last.isoformat(),
+                        'interval_minutes': args.seed_interval_minutes
+                    },
+                    'results': results
+                }, f, indent=2)
+
+        regressions = compare(results, args.compare, args.threshold) if args.compare else []
+        if args.clean_seed:
+            clean_seed(db)
+    finally:
+        db.close()
+
+    if regressions:
+        print(f"\n{len(regressions)} medição(ões) piorou(aram) mais de {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
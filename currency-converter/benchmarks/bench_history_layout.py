@@ -0,0 +1,96 @@
+"""
+Benchmark do histórico de várias moedas: N chamadas de /history/<moeda> vs /history colunar
+
+Mede, para a mesma janela, o tempo de consulta, o tempo de serialização JSON
+e o tamanho do corpo nos dois formatos:
+- por moeda: uma consulta e uma lista de dicts por moeda (get_historical_rates);
+- colunar: uma consulta para todas (get_historical_rates_multi).
+
+Usa as mesmas variáveis DB_* da aplicação; rode depois de popular o banco
+(benchmarks/api_suite.py grava amostras com source='benchmark').
+
+Uso:
+    DB_HOST=localhost DB_PASSWORD=changeme123 \\
+        python benchmarks/bench_history_layout.py --days 30
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from database import DatabaseManager  # noqa: E402
+from response_encoding import JSON_BACKENDS  # noqa: E402
+
+CURRENCIES = ['USD', 'EUR', 'CAD', 'CHF', 'GBP', 'JPY', 'CNY']
+
+
+def dumps(payload):
+    # Encoder das respostas com o backend json da biblioteca padrão, igual nos dois formatos
+    return JSON_BACKENDS['json'][0](payload)
+
+
+def per_currency(db, start, end):
+    """Caminho antigo: uma requisição (consulta + resposta) por moeda"""
+    started = time.perf_counter()
+    payloads = [
+        {
+            'currency_code': code,
+            'base_currency': 'BRL',
+            'start_date': start.isoformat(),
+            'end_date': end.isoformat(),
+            'history': db.get_historical_rates(code, start, end)
+        }
+        for code in CURRENCIES
+    ]
+    queried = time.perf_counter()
+    bodies = [dumps(payload) for payload in payloads]
+    return queried - started, time.perf_counter() - queried, sum(len(body) for body in bodies)
+
+
+def columnar(db, start, end):
+    """Caminho novo: uma consulta e uma resposta para todas as moedas"""
+    started = time.perf_counter()
+    timestamps, rates = db.get_historical_rates_multi(CURRENCIES, start, end)
+    queried = time.perf_counter()
+    body = dumps({
+        'base_currency': 'BRL',
+        'currencies': CURRENCIES,
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'data_points': len(timestamps),
+        'timestamps': timestamps,
+        'rates': rates
+    })
+    return queried - started, time.perf_counter() - queried, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--days', type=int, default=30, help='Tamanho da janela, terminando agora')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    end = datetime.now()
+    start = end - timedelta(days=args.days)
+    db = DatabaseManager()
+    try:
+        results = {}
+        for name, fn in [('por moeda', per_currency), ('colunar', columnar)]:
+            runs = [fn(db, start, end) for _ in range(args.repeat)]
+            results[name] = (min(r[0] for r in runs), min(r[1] for r in runs), runs[0][2])
+            query, serialize, size = results[name]
+            print(f"{name:10s} consulta {query * 1000:8.1f} ms  serialização {serialize * 1000:8.1f} ms  "
+                  f"corpo {size / 1024:9.1f} KiB")
+
+        old, new = results['por moeda'], results['colunar']
+        print(f"\ncolunar: consulta {old[0] / new[0]:.1f}x, serialização {old[1] / new[1]:.1f}x, "
+              f"corpo {old[2] / new[2]:.1f}x menor")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark de escrita: loop de INSERTs vs DatabaseManager.save_rates_bulk
+
+Usa as mesmas variáveis DB_* da aplicação. As linhas de exchange_rates são
+gravadas com source='benchmark' e removidas ao final, mas as de rate_updates
+permanecem: rode contra um banco descartável.
+
+Uso:
+    DB_HOST=localhost DB_PASSWORD=changeme123 \\
+        python benchmarks/bench_save_rates.py --currencies 160 --snapshots 50
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from database import DatabaseManager  # noqa: E402
+
+SOURCE = 'benchmark'
+
+
+def make_snapshots(n_currencies, n_snapshots):
+    codes = [f"{chr(65 + i // 26 % 26)}{chr(65 + i % 26)}X" for i in range(n_currencies)]
+    base = datetime.now() - timedelta(days=1)
+    return [
+        (
+            {code: round(random.uniform(0.01, 10), 6) for code in codes},
+            base + timedelta(minutes=i),
+            SOURCE
+        )
+        for i in range(n_snapshots)
+    ]
+
+
+def save_loop(db, snapshots):
+    """Caminho antigo: um INSERT por moeda, um commit por snapshot"""
+    for rates_dict, recorded_at, source in snapshots:
+        with db.pool.connection() as conn:
+            with conn.cursor() as cur:
+                for currency_code, rate in rates_dict.items():
+                    cur.execute("""
+                        INSERT INTO exchange_rates (currency_code, rate_to_brl, recorded_at, source)
+                        VALUES (%s, %s, %s, %s)
+                    """, (currency_code, rate, recorded_at, source))
+                cur.execute("""
+                    INSERT INTO rate_updates (currencies_updated, success)
+                    VALUES (%s, %s)
+                """, (len(rates_dict), True))
+            conn.commit()
+
+
+def save_per_snapshot(db, snapshots):
+    """Caminho novo, um snapshot por chamada (como faz o atualizador)"""
+    for snapshot in snapshots:
+        db.save_rates_bulk([snapshot])
+
+
+def save_all_at_once(db, snapshots):
+    """Caminho novo, todos os snapshots em uma chamada"""
+    db.save_rates_bulk(snapshots)
+
+
+def cleanup(db):
+    with db.pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM exchange_rates WHERE source = %s", (SOURCE,))
+        conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--currencies', type=int, default=160)
+    parser.add_argument('--snapshots', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    db = DatabaseManager()
+    snapshots = make_snapshots(args.currencies, args.snapshots)
+    rows = args.currencies * args.snapshots
+
+    print(f"{rows} linhas ({args.snapshots} snapshots x {args.currencies} moedas)")
+    try:
+        for name, fn in [
+            ('loop (antigo)', save_loop),
+            ('bulk por snapshot', save_per_snapshot),
+            ('bulk único', save_all_at_once),
+        ]:
+            best = None
+            for _ in range(args.repeat):
+                cleanup(db)
+                start = time.perf_counter()
+                fn(db, snapshots)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            print(f"{name:20s} {best * 1000:9.1f} ms  {rows / best:12.0f} linhas/s")
+    finally:
+        cleanup(db)
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark de serialização por endpoint: jsonify antigo vs backends do ResponseEncoder
+
+Faz as mesmas requisições no app_v2 (test client do Flask, sem rede) com
+cada codificação de resposta e mede o tempo por requisição e o tamanho do
+corpo:
+- legado: json da biblioteca padrão com sort_keys/ensure_ascii (o jsonify
+  antigo), montando um dict por linha com float()/isoformat() como antes;
+- json: ResponseEncoder com o backend json da biblioteca padrão;
+- orjson: ResponseEncoder com orjson (padrão);
+- msgpack: ResponseEncoder com Accept: application/msgpack.
+
+Usa as mesmas variáveis DB_* da aplicação; rode depois de popular o banco
+(benchmarks/api_suite.py grava amostras com source='benchmark'). O cache de
+séries fica desligado, para que /history e /stats leiam do banco.
+
+Uso:
+    DB_HOST=localhost DB_PASSWORD=changeme123 \\
+        python benchmarks/bench_serialization.py --days 30 --repeat 20
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('RATE_PROVIDERS', 'fake')
+os.environ['SERIES_CACHE_ENABLED'] = 'false'
+
+from flask import request  # noqa: E402
+
+import app_v2  # noqa: E402
+from response_encoding import Records, ResponseEncoder  # noqa: E402
+
+MSGPACK = {'Accept': 'application/msgpack'}
+
+
+def legacy_default(obj):
+    """Como o caminho antigo: um dict por linha, com float()/isoformat() campo a campo"""
+    if isinstance(obj, Records):
+        return [
+            {
+                field: value.isoformat() if isinstance(value, (datetime, date)) else value
+                for field, value in zip(obj.fields, row)
+            }
+            for row in obj.rows
+        ]
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(type(obj).__name__)
+
+
+class LegacyEncoder(ResponseEncoder):
+    """jsonify antigo: json da biblioteca padrão com sort_keys e ensure_ascii"""
+
+    def __init__(self, app):
+        super().__init__(app, request, json_backend='json')
+        self._dumps = lambda obj: json.dumps(
+            obj, default=legacy_default, sort_keys=True, separators=(',', ':')
+        ).encode('utf-8')
+
+
+def endpoints(days):
+    start = (datetime.now() - timedelta(days=days)).date().isoformat()
+    return [
+        '/rates',
+        '/rates/latest',
+        '/rates/matrix',
+        '/convert?from=USD&to=EUR&amount=100',
+        f'/history/USD?start_date={start}',
+        f'/history/USD?start_date={start}&limit=1000',
+        f'/history?currencies=USD,EUR,GBP&start_date={start}',
+        '/stats/USD?days=365',
+        f'/ohlc/USD?interval=1h&start={start}',
+        f'/rate-at-date/USD?date={date.today().isoformat()}',
+    ]
+
+
+def measure(client, path, headers, repeat):
+    """Menor tempo por requisição em `repeat` execuções, e o tamanho do corpo"""
+    best = float('inf')
+    size = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(path, headers=headers)
+        best = min(best, time.perf_counter() - started)
+        size = len(response.data)
+    return best, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--days', type=int, default=30, help='Janela de /history e /ohlc, terminando agora')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    app = app_v2.app
+    client = app.test_client()
+    variants = [
+        ('legado', LegacyEncoder(app), {}),
+        ('json', ResponseEncoder(app, request, json_backend='json'), {}),
+        ('orjson', ResponseEncoder(app, request, json_backend='orjson'), {}),
+        ('msgpack', ResponseEncoder(app, request, json_backend='orjson'), MSGPACK),
+    ]
+
+    print(f"{'endpoint':58s}" + ''.join(f'{name:>18s}' for name, _, _ in variants))
+    for path in endpoints(args.days):
+        cells = []
+        for _, provider, headers in variants:
+            app.json = provider
+            if path in ('/rates', '/rates/latest'):
+                # Corpo guardado por snapshot: mede a montagem, limpando o cache a cada requisição
+                elapsed, size = float('inf'), 0
+                for _ in range(args.repeat):
+                    app_v2.prepared_payloads.clear()
+                    once, size = measure(client, path, headers, 1)
+                    elapsed = min(elapsed, once)
+            else:
+                client.get(path, headers=headers)
+                elapsed, size = measure(client, path, headers, args.repeat)
+            cells.append(f'{elapsed * 1000:8.2f}ms {size / 1024:6.1f}K')
+        print(f'{path[:58]:58s}' + ''.join(f'{cell:>18s}' for cell in cells))
+
+if __name__ == '__main__':
+    main()
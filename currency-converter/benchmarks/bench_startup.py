@@ -0,0 +1,149 @@
+"""
+Tempo de inicialização: quanto o servidor leva até o /ready responder 200
+
+Inicia o app_v2 (gunicorn) e o app_async (uvicorn) do zero em três cenários
+e mede, a partir do lançamento do processo:
+- ready: tempo até o primeiro 200 em /ready (o que o readinessProbe vê);
+- rates: latência do primeiro GET /rates logo depois disso.
+
+Cenários:
+- db-up: banco das variáveis DB_*;
+- db-down: o banco aceita a conexão TCP e não responde (servidor falso
+  local), como um banco travado; cada conexão espera DB_CONNECT_TIMEOUT_SECONDS;
+- db-down-snapshot: igual, com um snapshot de taxas salvo em RATE_SNAPSHOT_FILE.
+
+O upstream é o provedor fake com FAKE_PROVIDER_DELAY_SECONDS de atraso, para
+que a primeira busca custe o mesmo que uma busca real fria. No cenário db-up
+as taxas buscadas são gravadas no banco: rode contra um banco descartável.
+
+Uso:
+    DB_HOST=localhost DB_PASSWORD=changeme123 \\
+        python benchmarks/bench_startup.py --runs 3 --upstream-delay 3
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import httpx
+
+from load_test import APP_DIR, SERVERS, free_port, stop_server
+
+SCENARIOS = ('db-up', 'db-down', 'db-down-snapshot')
+
+
+def start_silent_database():
+    """Servidor TCP que aceita conexões e nunca responde (banco travado)"""
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(64)
+    held = []
+
+    def accept():
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            held.append(conn)
+
+    threading.Thread(target=accept, daemon=True).start()
+    return listener
+
+
+def write_snapshot(path):
+    """Snapshot de taxas no formato gravado pela aplicação (SnapshotFile)"""
+    with open(path, 'w') as f:
+        json.dump({
+            'rates': {'USD': 5.0, 'EUR': 5.4, 'CAD': 3.7, 'CHF': 5.6, 'GBP': 6.3, 'JPY': 0.034, 'CNY': 0.69},
+            'last_update': datetime.now().isoformat()
+        }, f)
+
+
+def measure_startup(name, env, timeout=60):
+    """Lança o servidor e retorna (segundos até /ready 200, ms do primeiro /rates)"""
+    port = free_port()
+    started = time.monotonic()
+    proc = subprocess.Popen(
+        SERVERS[name](port, 1), cwd=APP_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        with httpx.Client(timeout=timeout) as client:
+            while True:
+                if proc.poll() is not None:
+                    raise RuntimeError(f'{name} terminou ao iniciar (código {proc.returncode})')
+                if time.monotonic() - started > timeout:
+                    raise RuntimeError(f'{name} não ficou pronto em {timeout}s')
+                try:
+                    if client.get(f'{base_url}/ready').status_code == 200:
+                        break
+                except httpx.HTTPError:
+                    pass
+                time.sleep(0.02)
+            ready = time.monotonic() - started
+            request_started = time.perf_counter()
+            response = client.get(f'{base_url}/rates')
+            rates_ms = (time.perf_counter() - request_started) * 1000
+            if response.status_code != 200:
+                raise RuntimeError(f'{name}: /rates respondeu {response.status_code}')
+        return ready, rates_ms
+    finally:
+        stop_server(proc)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--servers', default='gunicorn,uvicorn')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--upstream-delay', type=float, default=3.0,
+                        help='Atraso da primeira busca de taxas (FAKE_PROVIDER_DELAY_SECONDS)')
+    parser.add_argument('--connect-timeout', type=int, default=5,
+                        help='DB_CONNECT_TIMEOUT_SECONDS nos cenários sem banco')
+    args = parser.parse_args()
+
+    silent_db = start_silent_database()
+    workdir = tempfile.mkdtemp(prefix='bench-startup-')
+    base_env = dict(
+        os.environ,
+        RATE_PROVIDERS='fake',
+        FAKE_PROVIDER_DELAY_SECONDS=str(args.upstream_delay),
+        RATE_PROVIDER_TIMEOUT_SECONDS=str(args.upstream_delay + 5),
+        WRITE_BEHIND_SPOOL_DIR=os.path.join(workdir, 'spool')
+    )
+    base_env.pop('PROMETHEUS_MULTIPROC_DIR', None)
+
+    print(f"{'servidor':10s} {'cenário':18s} {'ready (s)':>10s} {'1º /rates (ms)':>15s}")
+    for name in args.servers.split(','):
+        for scenario in args.scenarios.split(','):
+            snapshot_file = os.path.join(workdir, f'{name}-{scenario}.json')
+            env = dict(base_env, RATE_SNAPSHOT_FILE=snapshot_file)
+            if scenario != 'db-up':
+                env.update(
+                    DB_HOST='127.0.0.1',
+                    DB_PORT=str(silent_db.getsockname()[1]),
+                    DB_CONNECT_TIMEOUT_SECONDS=str(args.connect_timeout)
+                )
+            results = []
+            for _ in range(args.runs):
+                if scenario == 'db-down-snapshot':
+                    write_snapshot(snapshot_file)
+                elif os.path.exists(snapshot_file):
+                    os.remove(snapshot_file)
+                results.append(measure_startup(name, env))
+            ready = statistics.median(r[0] for r in results)
+            rates_ms = statistics.median(r[1] for r in results)
+            print(f'{name:10s} {scenario:18s} {ready:10.2f} {rates_ms:15.1f}')
+    silent_db.close()
+
+
+if __name__ == '__main__':
+    main()
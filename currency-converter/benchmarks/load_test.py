@@ -0,0 +1,263 @@
+"""
+Teste de carga: app_v2 (Flask + gunicorn) vs app_async (Quart + uvicorn)
+
+Sobe um upstream falso (no lugar da exchangerate-api, com atraso
+configurável), inicia cada servidor apontando para ele e para o banco das
+variáveis DB_*, e dispara requisições concorrentes contra as mesmas rotas.
+Reporta requisições/s e latências p50/p95/p99 por servidor e cenário.
+
+As taxas do upstream falso são gravadas no banco a cada atualização: rode
+contra um banco descartável.
+
+Uso:
+    DB_HOST=localhost DB_PASSWORD=changeme123 \\
+        python benchmarks/load_test.py --concurrency 64 --duration 15 --upstream-delay 0.5
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+CURRENCIES = ['USD', 'EUR', 'CAD', 'CHF', 'GBP', 'JPY', 'CNY']
+
+# Cenário -> rotas sorteadas a cada requisição
+SCENARIOS = {
+    'convert': ['/convert?from=USD&to=EUR&amount=100', '/convert?from=GBP&amount=10'],
+    'rates': ['/rates', '/rates/latest'],
+    'history': [f'/history/{code}?limit=200' for code in CURRENCIES],
+    'stats': [f'/stats/{code}?days=30' for code in CURRENCIES],
+    'mixed': [
+        '/convert?from=USD&to=EUR&amount=100', '/rates',
+        '/history/USD?limit=200', '/stats/EUR?days=30',
+        '/rate-at-date/USD?date=2024-02-01&asof=true'
+    ]
+}
+
+SERVERS = {
+    'gunicorn': lambda port, workers: [
+        sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}',
+        '--workers', str(workers), '--timeout', '120', 'app_v2:app'
+    ],
+    'uvicorn': lambda port, workers: [
+        sys.executable, '-m', 'uvicorn', '--host', '127.0.0.1', '--port', str(port),
+        '--workers', str(workers), '--log-level', 'warning', 'app_async:app'
+    ]
+}
+
+
+def start_stub_upstream(delay):
+    """Upstream falso no formato da exchangerate-api, respondendo após `delay` segundos"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            body = json.dumps({
+                'base': 'BRL',
+                'rates': {code: round(random.uniform(0.1, 30), 6) for code in CURRENCIES}
+            }).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(name, workers, env):
+    """Inicia o servidor e espera /ready responder 200"""
+    port = free_port()
+    proc = subprocess.Popen(
+        SERVERS[name](port, workers), cwd=APP_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f'{name} terminou ao iniciar (código {proc.returncode})')
+        try:
+            if httpx.get(f'{base_url}/ready', timeout=1).status_code == 200:
+                return proc, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    stop_server(proc)
+    raise RuntimeError(f'{name} não ficou pronto em 60s')
+
+
+def stop_server(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(timeout=15)
+    except Exception:
+        os.killpg(proc.pid, signal.SIGKILL)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+async def _read_response(reader):
+    """Lê uma resposta HTTP/1.1 (Content-Length ou chunked) e retorna o status"""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ', 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            key, value = line.split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+async def run_load(base_url, paths, concurrency, duration, warmup=1.0):
+    """
+    Dispara requisições GET em `concurrency` conexões keep-alive por `duration` segundos
+
+    O cliente fala HTTP/1.1 direto sobre asyncio streams: com um cliente
+    completo (httpx) o próprio gerador de carga vira o gargalo a partir de
+    algumas dezenas de conexões.
+
+    Returns:
+        Dict com requests, errors, rps e latências (ms) p50/p95/p99/max
+    """
+    url = httpx.URL(base_url)
+    host, port = url.host, url.port or 80
+    latencies = []
+    errors = 0
+
+    async def worker(stop_at, record):
+        nonlocal errors
+        reader = writer = None
+        while time.monotonic() < stop_at:
+            path = random.choice(paths)
+            started = time.perf_counter()
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(host, port)
+                writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n'.encode('latin-1'))
+                status, keep_alive = await _read_response(reader)
+                ok = status < 500
+                if not keep_alive:
+                    writer.close()
+                    writer = None
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                ok = False
+                if writer is not None:
+                    writer.close()
+                writer = None
+            if record:
+                latencies.append((time.perf_counter() - started) * 1000)
+                if not ok:
+                    errors += 1
+        if writer is not None:
+            writer.close()
+
+    if warmup:
+        stop_at = time.monotonic() + warmup
+        await asyncio.gather(*(worker(stop_at, False) for _ in range(concurrency)))
+
+    started = time.monotonic()
+    stop_at = started + duration
+    await asyncio.gather(*(worker(stop_at, True) for _ in range(concurrency)))
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'max_ms': latencies[-1] if latencies else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Teste de carga gunicorn (app_v2) vs uvicorn (app_async)')
+    parser.add_argument('--servers', default='gunicorn,uvicorn')
+    parser.add_argument('--scenarios', default='convert,rates,history,mixed')
+    parser.add_argument('--workers', type=int, default=2, help='Processos por servidor (o deploy usa 2)')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--upstream-delay', type=float, default=0.5,
+                        help='Atraso (s) do upstream falso a cada busca de taxas')
+    parser.add_argument('--refresh-seconds', type=float, default=5,
+                        help='Intervalo de atualização das taxas durante o teste')
+    parser.add_argument('--json', help='Grava os resultados neste arquivo')
+    args = parser.parse_args()
+
+    upstream = start_stub_upstream(args.upstream_delay)
+    env = dict(os.environ)
+    env['EXCHANGE_API_URL'] = f'http://127.0.0.1:{upstream.server_address[1]}/v4/latest/BRL'
+    env['RATE_PROVIDERS'] = 'exchangerate-api'
+    env['RATE_REFRESH_INTERVAL_MINUTES'] = str(args.refresh_seconds / 60)
+    env['PYTHONUNBUFFERED'] = '1'
+
+    results = []
+    print(f"{'servidor':<10} {'cenário':<10} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'max ms':>8} {'erros':>6}")
+    for name in args.servers.split(','):
+        proc, base_url = start_server(name, args.workers, env)
+        try:
+            for scenario in args.scenarios.split(','):
+                stats = asyncio.run(run_load(base_url, SCENARIOS[scenario], args.concurrency, args.duration))
+                stats.update(server=name, scenario=scenario)
+                results.append(stats)
+                print(f"{name:<10} {scenario:<10} {stats['rps']:>9.1f} {stats['p50_ms']:>8.1f} "
+                      f"{stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f} {stats['max_ms']:>8.1f} "
+                      f"{stats['errors']:>6}")
+        finally:
+            stop_server(proc)
+    upstream.shutdown()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                'workers': args.workers,
+                'concurrency': args.concurrency,
+                'duration': args.duration,
+                'upstream_delay': args.upstream_delay,
+                'results': results
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
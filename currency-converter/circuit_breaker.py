@@ -0,0 +1,147 @@
+from datetime import datetime
+import random
+import threading
+import time
+import logging
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """O circuit breaker está aberto: a chamada falhou sem tentar conectar"""
+
+    def __init__(self, name, retry_in):
+        super().__init__(f"{name} indisponível; nova tentativa em {retry_in:.0f}s")
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker com sondagem em backoff exponencial
+
+    Após `failure_threshold` falhas de conexão seguidas o circuito abre e as
+    chamadas falham na hora (CircuitOpenError). Enquanto aberto, só o dono
+    do breaker sonda o recurso, no instante de `probe_delay()`: uma sondagem
+    bem-sucedida fecha o circuito; uma falha dobra o intervalo, até
+    `backoff_max`. O estado é só memória, então consultá-lo não faz I/O.
+
+    Thread-safe; as mesmas regras valem para uso dentro de um loop asyncio.
+    """
+
+    def __init__(self, name, failure_threshold=3, backoff_initial=1.0, backoff_max=60.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.backoff_initial = backoff_initial
+        self.backoff_max = max(backoff_max, backoff_initial)
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._backoff = backoff_initial
+        self._next_probe = 0.0
+        self._opened_at = None
+        self._last_error = None
+
+    @property
+    def state(self):
+        return self._state
+
+    def allow(self):
+        """True se as chamadas podem seguir (circuito fechado)"""
+        return self._state == CLOSED
+
+    def check(self):
+        """Levanta CircuitOpenError se o circuito não estiver fechado"""
+        if self._state != CLOSED:
+            raise CircuitOpenError(self.name, self.retry_in())
+
+    def retry_in(self):
+        """Segundos até a próxima sondagem (0 com o circuito fechado)"""
+        if self._state == CLOSED:
+            return 0.0
+        return max(0.0, self._next_probe - time.monotonic())
+
+    def _transition(self, state):
+        self._state = state
+        metrics.CIRCUIT_BREAKER_TRANSITIONS.labels(self.name, state).inc()
+
+    def _schedule_probe(self):
+        # Jitter para que os workers não sondem todos no mesmo instante
+        self._next_probe = time.monotonic() + self._backoff * random.uniform(0.8, 1.2)
+
+    def record_success(self):
+        """
+        Registra uma chamada bem-sucedida
+
+        Com o circuito fechado, zera as falhas seguidas; na sondagem
+        (half-open), fecha o circuito. Sucessos de chamadas que começaram
+        antes da abertura são ignorados.
+        """
+        with self._lock:
+            self._failures = 0
+            if self._state != HALF_OPEN:
+                return
+            self._transition(CLOSED)
+            self._backoff = self.backoff_initial
+            self._opened_at = None
+            self._last_error = None
+        logger.info(f"Circuit breaker {self.name}: fechado, recurso respondeu de novo")
+
+    def record_failure(self, error):
+        """
+        Registra uma falha de conexão
+
+        Returns:
+            True se esta falha abriu o circuito (o dono deve começar a sondar)
+        """
+        with self._lock:
+            self._last_error = str(error) or type(error).__name__
+            if self._state == OPEN:
+                return False
+            if self._state == HALF_OPEN:
+                self._backoff = min(self._backoff * 2, self.backoff_max)
+                self._transition(OPEN)
+                self._schedule_probe()
+                return False
+            self._failures += 1
+            if self._failures < self.failure_threshold:
+                return False
+            self._transition(OPEN)
+            self._opened_at = datetime.now()
+            self._schedule_probe()
+        logger.error(
+            f"Circuit breaker {self.name}: aberto após {self.failure_threshold} falha(s) "
+            f"seguida(s): {self._last_error}"
+        )
+        return True
+
+    def begin_probe(self):
+        """Passa para half-open antes de uma sondagem; False se o circuito já fechou"""
+        with self._lock:
+            if self._state == CLOSED:
+                return False
+            self._transition(HALF_OPEN)
+            return True
+
+    def probe_delay(self):
+        """Segundos que o dono deve esperar antes da próxima sondagem"""
+        with self._lock:
+            return max(0.0, self._next_probe - time.monotonic())
+
+    def snapshot(self):
+        """Estado atual para /health, sem I/O"""
+        with self._lock:
+            return {
+                'state': self._state,
+                'consecutive_failures': self._failures,
+                'opened_at': self._opened_at.isoformat() if self._opened_at else None,
+                'retry_in_seconds': round(self.retry_in(), 1),
+                'backoff_seconds': self._backoff,
+                'last_error': self._last_error
+            }
@@ -0,0 +1,118 @@
+import math
+
+import numpy as np
+
+from response_encoding import MIMETYPES
+
+BASE_CURRENCY = 'BRL'
+
+
+class CrossRateMatrix:
+    """
+    Matriz N×N de taxas cruzadas de um snapshot
+
+    `matrix[index[de], index[para]]` é quanto 1 unidade de `de` vale em
+    `para`, calculado uma vez a partir das taxas sem arredondamento. As
+    representações servidas por /rates/matrix são serializadas aqui, uma
+    vez por snapshot, pelo `encode(obj, fmt)` do provedor JSON da aplicação
+    (app.json.encode), como as demais respostas.
+    """
+
+    def __init__(self, snapshot, encode):
+        rates = snapshot.rates
+        self.snapshot = snapshot
+        self.codes = [BASE_CURRENCY] + sorted(code for code in rates if code != BASE_CURRENCY)
+        self.index = {code: i for i, code in enumerate(self.codes)}
+
+        # Taxa de cada moeda para BRL; BRL entra com 1.0
+        to_brl = np.array(
+            [1.0] + [float(rates[code]) for code in self.codes[1:]], dtype=np.float64
+        )
+        self.matrix = to_brl[:, np.newaxis] / to_brl[np.newaxis, :]
+
+        document = {
+            'base_currency': BASE_CURRENCY,
+            'currencies': self.codes,
+            'matrix': self.matrix.tolist(),
+            'last_update': snapshot.last_update.isoformat() if snapshot.last_update else None
+        }
+        # {formato: corpo}, um por formato negociável (json, msgpack)
+        self.encoded = {fmt: encode(document, fmt) for fmt in MIMETYPES}
+        # float64 little-endian, linha a linha (ordem das moedas em `codes`)
+        self.binary = self.matrix.astype('<f8').tobytes()
+
+    def rate(self, from_currency, to_currency):
+        """Taxa de from_currency para to_currency, ou None se indisponível"""
+        i = self.index.get(from_currency)
+        j = self.index.get(to_currency)
+        if i is None or j is None:
+            return None
+        return float(self.matrix[i, j])
+
+
+def convert_batch(cross_rates, items):
+    """
+    Converte vários valores de uma vez contra uma única matriz de taxas
+
+    A busca dos códigos é feita item a item; a leitura das taxas na matriz,
+    a multiplicação e o arredondamento rodam vetorizados sobre todos os itens.
+
+    Args:
+        cross_rates: CrossRateMatrix do snapshot atual
+        items: Lista de tuplas (from_currency, to_currency, amount)
+
+    Returns:
+        Lista de resultados na mesma ordem de `items`; itens inválidos trazem
+        apenas 'error'
+    """
+    index = cross_rates.index
+    n = len(items)
+
+    from_idx = np.empty(n, dtype=np.intp)
+    to_idx = np.empty(n, dtype=np.intp)
+    amounts = np.zeros(n, dtype=np.float64)
+    errors = [None] * n
+
+    for i, (from_currency, to_currency, amount) in enumerate(items):
+        from_currency = str(from_currency or '').strip().upper()
+        to_currency = str(to_currency or '').strip().upper()
+        f = index.get(from_currency)
+        t = index.get(to_currency)
+        try:
+            amounts[i] = float(amount)
+            if not math.isfinite(amounts[i]):
+                raise ValueError(amount)
+        except (TypeError, ValueError):
+            amounts[i] = 0.0
+            errors[i] = 'Valor inválido'
+        if f is None or t is None:
+            missing = from_currency if f is None else to_currency
+            errors[i] = f'Moeda não suportada ou taxa indisponível: {missing}'
+        from_idx[i] = f if f is not None else 0
+        to_idx[i] = t if t is not None else 0
+
+    exchange_rates = cross_rates.matrix[from_idx, to_idx]
+    converted = np.round(amounts * exchange_rates, 2)
+    exchange_rates = np.round(exchange_rates, 6)
+
+    codes = cross_rates.codes
+    from_list = from_idx.tolist()
+    to_list = to_idx.tolist()
+    amount_list = amounts.tolist()
+    converted_list = converted.tolist()
+    rate_list = exchange_rates.tolist()
+
+    results = []
+    for i in range(n):
+        if errors[i]:
+            results.append({'index': i, 'error': errors[i]})
+            continue
+        results.append({
+            'index': i,
+            'from_currency': codes[from_list[i]],
+            'to_currency': codes[to_list[i]],
+            'original_amount': amount_list[i],
+            'converted_amount': converted_list[i],
+            'exchange_rate': rate_list[i]
+        })
+    return results
@@ -1,17 +1,323 @@
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2 import sql
+from psycopg2.extras import RealDictCursor, execute_values
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 import os
+import threading
+import time
 import logging
 
+from circuit_breaker import CircuitBreaker
+from metrics import observe_save, timed_db_method
+from response_encoding import Records
+
 logger = logging.getLogger(__name__)
 
+# Valor de `source` nas linhas vindas de exchange_rates_hourly
+DOWNSAMPLED_SOURCE = 'downsampled-1h'
+
+# Resoluções pré-calculadas em rate_candles (nome -> largura do bucket no SQL)
+CANDLE_RESOLUTIONS = {'15m': '15 minutes', '1h': '1 hour', '1d': '1 day'}
+_CANDLE_RESOLUTIONS_SQL = ', '.join(
+    f"('{name}', INTERVAL '{width}')" for name, width in CANDLE_RESOLUTIONS.items()
+)
+# Origem dos buckets (date_bin): uma segunda-feira à meia-noite, para 1d e 1w
+CANDLE_ORIGIN = "TIMESTAMP '2000-01-03'"
+# Intervalos do /ohlc: (largura, resolução de rate_candles agregada; None = amostras brutas)
+OHLC_INTERVALS = {
+    '1m': (timedelta(minutes=1), None),
+    '5m': (timedelta(minutes=5), None),
+    '15m': (timedelta(minutes=15), '15m'),
+    '30m': (timedelta(minutes=30), '15m'),
+    '1h': (timedelta(hours=1), '1h'),
+    '4h': (timedelta(hours=4), '1h'),
+    '1d': (timedelta(days=1), '1d'),
+    '1w': (timedelta(days=7), '1d'),
+}
+
+# Campos das linhas de histórico, estatísticas diárias e candles, na ordem das colunas do SQL
+HISTORY_FIELDS = ('id', 'currency_code', 'rate_to_brl', 'recorded_at', 'source')
+DAILY_STATS_FIELDS = ('date', 'min_rate', 'max_rate', 'avg_rate', 'sample_count')
+OHLC_FIELDS = ('time', 'open', 'high', 'low', 'close', 'sample_count')
+
+
+class PoolTimeoutError(Exception):
+    """Nenhuma conexão ficou disponível dentro do tempo limite"""
+
+
+class ConnectionPool:
+    """
+    Pool de conexões thread-safe para o PostgreSQL
+
+    Conexões ociosas por mais de `validate_after` segundos são testadas com
+    `SELECT 1` no checkout; as demais são entregues sem round trip extra.
+
+    Com um `breaker`, falhas de conexão seguidas abrem o circuito: os
+    checkouts passam a falhar na hora (CircuitOpenError) e uma thread sonda o
+    banco em backoff exponencial até ele voltar.
+    """
+
+    def __init__(self, config, min_size=1, max_size=5, validate_after=30, timeout=10,
+                 connect_timeout=5, breaker=None):
+        self.config = config
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.validate_after = validate_after
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.breaker = breaker
+        self._probe_thread = None
+        self._probe_stop = threading.Event()
+
+        self._idle = []  # [(conexão, último uso em time.monotonic())]
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'connections_created': 0,
+            'broken_connections': 0,
+            'validations': 0,
+            'timeouts': 0,
+            'wait_time_total_ms': 0.0,
+            'wait_time_max_ms': 0.0
+        }
+
+    def _new_connection(self):
+        try:
+            conn = psycopg2.connect(connect_timeout=self.connect_timeout, **self.config)
+        except Exception as e:
+            self._record_failure(e)
+            raise
+        conn.autocommit = False
+        with self._cond:
+            self._stats['connections_created'] += 1
+        if self.breaker is not None:
+            self.breaker.record_success()
+        return conn
+
+    def _record_failure(self, error):
+        """Conta uma falha de conexão no breaker; se o circuito abriu, começa a sondar"""
+        if self.breaker is None or not self.breaker.record_failure(error):
+            return
+        # As conexões ociosas provavelmente caíram junto com o banco
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+        if self._probe_thread is None or not self._probe_thread.is_alive():
+            self._probe_thread = threading.Thread(target=self._probe, name='db-breaker-probe', daemon=True)
+            self._probe_thread.start()
+
+    def _probe(self):
+        """Sonda o banco em backoff exponencial até o circuito fechar"""
+        while not self._closed and not self.breaker.allow():
+            if self._probe_stop.wait(self.breaker.probe_delay()):
+                return
+            if not self.breaker.begin_probe():
+                return
+            with self._cond:
+                if self._size >= self.max_size:
+                    # Sem vaga para a conexão de teste: sonda e descarta
+                    reserve = False
+                else:
+                    self._size += 1
+                    reserve = True
+            try:
+                conn = self._new_connection()
+            except Exception as e:
+                logger.warning(f"Sondagem do banco falhou: {str(e)}")
+                if reserve:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                continue
+            if reserve:
+                self.release(conn)
+            else:
+                conn.close()
+
+    def fill(self):
+        """Abre conexões até atingir o tamanho mínimo"""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._new_connection()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            self.release(conn)
+
+    def acquire(self):
+        """Retira uma conexão do pool, aguardando até `timeout` segundos"""
+        if self.breaker is not None:
+            self.breaker.check()
+        start = time.monotonic()
+        deadline = start + self.timeout
+        conn = None
+        last_used = None
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeoutError("Pool de conexões fechado")
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(
+                        f"Nenhuma conexão disponível após {self.timeout}s"
+                    )
+                self._cond.wait(remaining)
+
+            waited_ms = (time.monotonic() - start) * 1000
+            self._stats['checkouts'] += 1
+            self._stats['wait_time_total_ms'] += waited_ms
+            self._stats['wait_time_max_ms'] = max(self._stats['wait_time_max_ms'], waited_ms)
+
+        try:
+            if conn is not None and not self._is_usable(conn, last_used):
+                self._discard(conn, reserve=True)
+                conn = None
+            if conn is None:
+                conn = self._new_connection()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        return conn
+
+    def _is_usable(self, conn, last_used):
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.validate_after:
+            return True
+        with self._cond:
+            self._stats['validations'] += 1
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn, reserve=False):
+        """Fecha uma conexão quebrada; com reserve=True a vaga continua ocupada"""
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._stats['broken_connections'] += 1
+            if not reserve:
+                self._size -= 1
+                self._cond.notify()
+
+    def release(self, conn, broken=False):
+        """Devolve a conexão ao pool, descartando-a se estiver quebrada"""
+        if not broken and not conn.closed:
+            try:
+                # Não deixa transações abertas ("idle in transaction")
+                if conn.status != psycopg2.extensions.STATUS_READY:
+                    conn.rollback()
+            except Exception:
+                broken = True
+        if broken or conn.closed:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                conn.close()
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager que faz checkout e devolve a conexão ao final"""
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            broken = True
+            # Conexão perdida no meio do uso (não um timeout de consulta ou de lock)
+            if conn.closed:
+                self._record_failure(e)
+            raise
+        finally:
+            self.release(conn, broken=broken)
+
+    def stats(self):
+        """Retorna estatísticas do pool"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['size'] = self._size
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._size - len(self._idle)
+            stats['min_size'] = self.min_size
+            stats['max_size'] = self.max_size
+        checkouts = stats['checkouts']
+        stats['wait_time_avg_ms'] = (
+            stats['wait_time_total_ms'] / checkouts if checkouts else 0.0
+        )
+        return stats
+
+    def close(self):
+        """Fecha todas as conexões ociosas e impede novos checkouts"""
+        self._probe_stop.set()
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
 class DatabaseManager:
-    def __init__(self):
-        self.connection = None
-        self.connect()
+    def __init__(self, min_size=None, max_size=None, connect=True):
+        """
+        Args:
+            connect: Abre as conexões mínimas já no construtor; com False o pool
+                conecta na primeira consulta (ou em `connect`)
+        """
+        config = self.get_db_config()
+        self.pool = ConnectionPool(
+            config,
+            min_size=min_size if min_size is not None else int(os.environ.get('DB_POOL_MIN_SIZE', 1)),
+            max_size=max_size if max_size is not None else int(os.environ.get('DB_POOL_MAX_SIZE', 5)),
+            validate_after=float(os.environ.get('DB_POOL_VALIDATE_AFTER_SECONDS', 30)),
+            timeout=float(os.environ.get('DB_POOL_TIMEOUT_SECONDS', 10)),
+            connect_timeout=int(os.environ.get('DB_CONNECT_TIMEOUT_SECONDS', 5)),
+            breaker=self.create_breaker()
+        )
+        # Meses cuja partição de exchange_rates já foi garantida por este processo
+        self._known_partitions = set()
+        if connect:
+            self.connect()
     
-    def get_db_config(self):
+    @staticmethod
+    def get_db_config():
         """Retorna configuração do banco de dados"""
         return {
             'host': os.environ.get('DB_HOST', 'postgres-service'),
@@ -21,12 +327,20 @@ class DatabaseManager:
             'password': os.environ.get('DB_PASSWORD', 'changeme')
         }
     
+    @staticmethod
+    def create_breaker():
+        """Circuit breaker do banco, configurado por DB_BREAKER_*"""
+        return CircuitBreaker(
+            'database',
+            failure_threshold=int(os.environ.get('DB_BREAKER_FAILURE_THRESHOLD', 3)),
+            backoff_initial=float(os.environ.get('DB_BREAKER_BACKOFF_SECONDS', 1)),
+            backoff_max=float(os.environ.get('DB_BREAKER_BACKOFF_MAX_SECONDS', 60))
+        )
+    
     def connect(self):
-        """Conecta ao banco de dados PostgreSQL"""
+        """Abre as conexões mínimas do pool com o PostgreSQL"""
         try:
-            config = self.get_db_config()
-            self.connection = psycopg2.connect(**config)
-            self.connection.autocommit = False
+            self.pool.fill()
             logger.info("Conectado ao banco de dados PostgreSQL")
             return True
         except Exception as e:
@@ -34,73 +348,234 @@ class DatabaseManager:
             return False
     
     def ensure_connection(self):
-        """Garante que a conexão está ativa"""
+        """Garante que o pool consegue entregar uma conexão ativa"""
         try:
-            if self.connection is None or self.connection.closed:
-                return self.connect()
-            # Testa a conexão
-            with self.connection.cursor() as cur:
-                cur.execute('SELECT 1')
-            return True
-        except:
-            return self.connect()
+            with self.pool.connection():
+                return True
+        except Exception:
+            return False
+    
+    def is_available(self):
+        """False enquanto o circuit breaker do banco está aberto (sem I/O)"""
+        return self.pool.breaker.allow()
+    
+    def require_available(self):
+        """Levanta CircuitOpenError se o banco está indisponível (modo degradado)"""
+        self.pool.breaker.check()
+    
+    def breaker_state(self):
+        """Estado do circuit breaker do banco, sem I/O"""
+        return self.pool.breaker.snapshot()
     
-    def save_rates(self, rates_dict, source='exchangerate-api'):
+    def pool_stats(self):
+        """Retorna estatísticas do pool de conexões"""
+        return self.pool.stats()
+    
+    def save_rates(self, rates_dict, source='exchangerate-api', conn=None):
         """
         Salva taxas de câmbio no banco de dados
         
         Args:
             rates_dict: Dict com {currency_code: rate_to_brl}
             source: Fonte dos dados
+            conn: Conexão com transação aberta por quem chamou (ver save_rates_bulk)
         """
-        if not self.ensure_connection():
-            logger.error("Não foi possível conectar ao banco de dados")
-            return False
+        return self.save_rates_bulk([(rates_dict, datetime.now(), source)], conn=conn)
+    
+    # Anti-join pelo índice (currency_code, recorded_at) para não duplicar amostras
+    _SKIP_EXISTING_SQL = """
+                                WHERE NOT EXISTS (
+                                    SELECT 1 FROM exchange_rates e
+                                    WHERE e.currency_code = incoming.currency_code
+                                        AND e.recorded_at = incoming.recorded_at::timestamp
+                                        AND e.source IS NOT DISTINCT FROM incoming.source
+                                )"""
+    
+    # Atualiza os candles de cada resolução com as linhas de `inserted`; abertura e
+    # fechamento só mudam se a amostra nova for anterior/posterior às do candle
+    _CANDLES_UPSERT_SQL = f"""
+                            candles AS (
+                                INSERT INTO rate_candles
+                                    (currency_code, resolution, bucket, open_rate, high_rate, low_rate,
+                                     close_rate, open_at, close_at, sum_rate, sample_count)
+                                SELECT
+                                    i.currency_code,
+                                    r.resolution,
+                                    date_bin(r.width, i.recorded_at, {CANDLE_ORIGIN}),
+                                    (array_agg(i.rate_to_brl ORDER BY i.recorded_at))[1],
+                                    MAX(i.rate_to_brl),
+                                    MIN(i.rate_to_brl),
+                                    (array_agg(i.rate_to_brl ORDER BY i.recorded_at DESC))[1],
+                                    MIN(i.recorded_at),
+                                    MAX(i.recorded_at),
+                                    SUM(i.rate_to_brl),
+                                    COUNT(*)
+                                FROM inserted i
+                                CROSS JOIN (VALUES {_CANDLE_RESOLUTIONS_SQL}) AS r (resolution, width)
+                                GROUP BY 1, 2, 3
+                                ON CONFLICT (currency_code, resolution, bucket) DO UPDATE SET
+                                    open_rate = CASE WHEN EXCLUDED.open_at < rate_candles.open_at
+                                        THEN EXCLUDED.open_rate ELSE rate_candles.open_rate END,
+                                    close_rate = CASE WHEN EXCLUDED.close_at >= rate_candles.close_at
+                                        THEN EXCLUDED.close_rate ELSE rate_candles.close_rate END,
+                                    open_at = LEAST(rate_candles.open_at, EXCLUDED.open_at),
+                                    close_at = GREATEST(rate_candles.close_at, EXCLUDED.close_at),
+                                    high_rate = GREATEST(rate_candles.high_rate, EXCLUDED.high_rate),
+                                    low_rate = LEAST(rate_candles.low_rate, EXCLUDED.low_rate),
+                                    sum_rate = rate_candles.sum_rate + EXCLUDED.sum_rate,
+                                    sample_count = rate_candles.sample_count + EXCLUDED.sample_count
+                            )"""
+    
+    @timed_db_method
+    def save_rates_bulk(self, snapshots, page_size=5000, skip_existing=False, log_updates=True, conn=None):
+        """
+        Salva vários snapshots de taxas em uma única transação
+        
+        As linhas de todos os snapshots são enviadas em INSERTs multi-row
+        (VALUES (...), (...)), com até `page_size` linhas por round trip.
+        O rollup diário (daily_rate_rollup) e os candles (rate_candles) são
+        atualizados no mesmo comando, e as partições mensais que ainda não
+        existem são criadas antes.
+        
+        Args:
+            snapshots: Lista de tuplas (rates_dict, recorded_at, source)
+            page_size: Máximo de linhas por comando INSERT
+            skip_existing: Ignora linhas com mesma moeda, recorded_at e source
+                já gravadas (replay idempotente da fila de escrita)
+            log_updates: Registra cada snapshot em rate_updates; False para
+                cargas de dados antigos, que não são atualizações das taxas
+            conn: Grava nesta conexão, dentro da transação de quem chamou (ex.:
+                a que segura o advisory lock), sem pegar outra do pool; o
+                commit e o rollback ficam com quem chamou
+        """
+        snapshots = [s for s in snapshots if s[0]]
+        if not snapshots:
+            return True
+        
+        rate_rows = [
+            (currency_code, rate, recorded_at, source)
+            for rates_dict, recorded_at, source in snapshots
+            for currency_code, rate in rates_dict.items()
+        ]
+        update_rows = [
+            (len(rates_dict), True) for rates_dict, _, _ in snapshots
+        ]
+        months = {recorded_at.date().replace(day=1) for _, recorded_at, _ in snapshots}
+        started = time.perf_counter()
+        
+        if conn is not None:
+            try:
+                with conn.cursor() as cur:
+                    self._insert_snapshots(cur, rate_rows, update_rows, months, page_size, skip_existing, log_updates)
+            except Exception as e:
+                logger.error(f"Erro ao salvar taxas: {str(e)}")
+                observe_save(started, len(rate_rows), False)
+                return False
+            # Partições criadas aqui só existem se quem chamou fizer commit: não entram em _known_partitions
+            observe_save(started, len(rate_rows), True)
+            logger.info(f"Salvou {len(rate_rows)} taxas de {len(snapshots)} snapshot(s) no banco de dados")
+            return True
         
         try:
-            with self.connection.cursor() as cur:
-                recorded_at = datetime.now()
-                
-                for currency_code, rate in rates_dict.items():
-                    cur.execute("""
-                        INSERT INTO exchange_rates (currency_code, rate_to_brl, recorded_at, source)
-                        VALUES (%s, %s, %s, %s)
-                    """, (currency_code, rate, recorded_at, source))
-                
-                # Registra a atualização
-                cur.execute("""
-                    INSERT INTO rate_updates (currencies_updated, success)
-                    VALUES (%s, %s)
-                """, (len(rates_dict), True))
-                
-                self.connection.commit()
-                logger.info(f"Salvou {len(rates_dict)} taxas no banco de dados")
-                return True
-                
+            with self.pool.connection() as conn:
+                try:
+                    with conn.cursor() as cur:
+                        self._insert_snapshots(cur, rate_rows, update_rows, months, page_size, skip_existing, log_updates)
+                    
+                    conn.commit()
+                    self._known_partitions |= months
+                    observe_save(started, len(rate_rows), True)
+                    logger.info(
+                        f"Salvou {len(rate_rows)} taxas de {len(snapshots)} snapshot(s) no banco de dados"
+                    )
+                    return True
+                    
+                except Exception as e:
+                    conn.rollback()
+                    logger.error(f"Erro ao salvar taxas: {str(e)}")
+                    
+                    # Registra falha
+                    try:
+                        with conn.cursor() as cur:
+                            cur.execute("""
+                                INSERT INTO rate_updates (currencies_updated, success, error_message)
+                                VALUES (%s, %s, %s)
+                            """, (0, False, str(e)))
+                        conn.commit()
+                    except:
+                        pass
+                    
+                    observe_save(started, len(rate_rows), False)
+                    return False
         except Exception as e:
-            self.connection.rollback()
-            logger.error(f"Erro ao salvar taxas: {str(e)}")
-            
-            # Registra falha
-            try:
-                with self.connection.cursor() as cur:
-                    cur.execute("""
-                        INSERT INTO rate_updates (currencies_updated, success, error_message)
-                        VALUES (%s, %s, %s)
-                    """, (0, False, str(e)))
-                    self.connection.commit()
-            except:
-                pass
-            
+            logger.error(f"Não foi possível conectar ao banco de dados: {str(e)}")
+            observe_save(started, len(rate_rows), False)
             return False
     
+    def _insert_snapshots(self, cur, rate_rows, update_rows, months, page_size, skip_existing, log_updates):
+        """Comandos de save_rates_bulk: partições, taxas + rollup + candles e rate_updates"""
+        known = months & self._known_partitions
+        for month in sorted(months - known):
+            cur.execute("SELECT create_exchange_rates_partition(%s)", (month,))
+        
+        if not known:
+            self._insert_rates(cur, rate_rows, page_size, skip_existing)
+        else:
+            # O apply_retention de outro processo pode ter removido uma partição que
+            # este ainda conhece: o INSERT falha ("no partition ... found for row");
+            # esquece as partições conhecidas, cria de novo e tenta mais uma vez
+            cur.execute("SAVEPOINT insert_rates")
+            try:
+                self._insert_rates(cur, rate_rows, page_size, skip_existing)
+            except psycopg2.errors.CheckViolation:
+                cur.execute("ROLLBACK TO SAVEPOINT insert_rates")
+                self._known_partitions -= known
+                for month in sorted(known):
+                    cur.execute("SELECT create_exchange_rates_partition(%s)", (month,))
+                self._insert_rates(cur, rate_rows, page_size, skip_existing)
+        
+        # Registra as atualizações
+        if log_updates:
+            execute_values(cur, """
+                INSERT INTO rate_updates (currencies_updated, success)
+                VALUES %s
+            """, update_rows, page_size=page_size)
+    
+    def _insert_rates(self, cur, rate_rows, page_size, skip_existing):
+        """Grava as taxas e atualiza o rollup diário e os candles no mesmo comando"""
+        execute_values(cur, f"""
+            WITH incoming (currency_code, rate_to_brl, recorded_at, source) AS (
+                VALUES %s
+            ),
+            inserted AS (
+                INSERT INTO exchange_rates (currency_code, rate_to_brl, recorded_at, source)
+                SELECT currency_code, rate_to_brl::numeric, recorded_at::timestamp, source
+                FROM incoming{self._SKIP_EXISTING_SQL if skip_existing else ''}
+                RETURNING currency_code, rate_to_brl, recorded_at
+            ),{self._CANDLES_UPSERT_SQL}
+            INSERT INTO daily_rate_rollup
+                (currency_code, date, min_rate, max_rate, sum_rate, sample_count)
+            SELECT
+                currency_code,
+                DATE(recorded_at),
+                MIN(rate_to_brl),
+                MAX(rate_to_brl),
+                SUM(rate_to_brl),
+                COUNT(*)
+            FROM inserted
+            GROUP BY currency_code, DATE(recorded_at)
+            ON CONFLICT (currency_code, date) DO UPDATE SET
+                min_rate = LEAST(daily_rate_rollup.min_rate, EXCLUDED.min_rate),
+                max_rate = GREATEST(daily_rate_rollup.max_rate, EXCLUDED.max_rate),
+                sum_rate = daily_rate_rollup.sum_rate + EXCLUDED.sum_rate,
+                sample_count = daily_rate_rollup.sample_count + EXCLUDED.sample_count
+        """, rate_rows, page_size=page_size)
+    
+    @timed_db_method
     def get_latest_rates(self):
         """Retorna as taxas mais recentes de cada moeda"""
-        if not self.ensure_connection():
-            return {}
-        
         try:
-            with self.connection.cursor(cursor_factory=RealDictCursor) as cur:
+            with self.pool.connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
                 cur.execute("""
                     SELECT currency_code, rate_to_brl, recorded_at
                     FROM latest_rates
@@ -119,49 +594,320 @@ class DatabaseManager:
             logger.error(f"Erro ao buscar taxas mais recentes: {str(e)}")
             return {}
     
+    @staticmethod
+    def _history_sql(keyset=False, limit=False):
+        """Monta a consulta de histórico (amostras brutas + candles horários)"""
+        raw_keyset = hourly_keyset = limit_clause = ''
+        if keyset:
+            # Keyset em (recorded_at, id) DESC; candles horários entram com id 0
+            raw_keyset = """
+                AND recorded_at <= %(after_ts)s
+                AND (recorded_at, id) < (%(after_ts)s, %(after_id)s)"""
+            hourly_keyset = """
+                AND bucket <= %(after_ts)s
+                AND (bucket, 0) < (%(after_ts)s, %(after_id)s)"""
+        if limit:
+            limit_clause = "LIMIT %(limit)s"
+        return f"""
+            SELECT 
+                id,
+                currency_code,
+                rate_to_brl::float8,
+                recorded_at,
+                source
+            FROM exchange_rates
+            WHERE currency_code = %(currency_code)s
+                AND recorded_at >= %(start_date)s
+                AND recorded_at <= %(end_date)s{raw_keyset}
+            UNION ALL
+            SELECT
+                NULL,
+                currency_code,
+                close_rate::float8,
+                bucket,
+                %(downsampled_source)s
+            FROM exchange_rates_hourly
+            WHERE currency_code = %(currency_code)s
+                AND bucket >= %(start_date)s
+                AND bucket <= %(end_date)s{hourly_keyset}
+            ORDER BY recorded_at DESC, id DESC NULLS LAST
+            {limit_clause}
+        """
+    
+    @staticmethod
+    def _history_params(currency_code, start_date, end_date, **extra):
+        params = {
+            'currency_code': currency_code,
+            'start_date': start_date,
+            'end_date': end_date,
+            'downsampled_source': DOWNSAMPLED_SOURCE
+        }
+        params.update(extra)
+        return params
+    
+    @timed_db_method
     def get_historical_rates(self, currency_code, start_date, end_date):
         """
         Retorna histórico de taxas para uma moeda em um período
         
+        Períodos já removidos pela retenção vêm de exchange_rates_hourly, com a
+        taxa de fechamento de cada hora e source='downsampled-1h'.
+        
         Args:
             currency_code: Código da moeda (ex: USD)
             start_date: Data inicial (datetime ou string YYYY-MM-DD)
             end_date: Data final (datetime ou string YYYY-MM-DD)
+        
+        Returns:
+            Records com os campos de HISTORY_FIELDS, do mais recente ao mais antigo
         """
-        if not self.ensure_connection():
-            return []
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cur:
+                cur.execute(
+                    self._history_sql(),
+                    self._history_params(currency_code, start_date, end_date)
+                )
+                
+                return Records(HISTORY_FIELDS, cur.fetchall())
+        except Exception as e:
+            logger.error(f"Erro ao buscar histórico: {str(e)}")
+            return Records(HISTORY_FIELDS)
+    
+    @staticmethod
+    def _multi_history_sql():
+        """
+        Histórico de várias moedas em uma consulta, do mais antigo ao mais recente
+        
+        Linhas (epoch, moeda, taxa, instante). O epoch é truncado para o segundo (FLOOR, não o arredondamento do cast),
+        a mesma regra de series_cache.to_epoch + floor; amostras de uma moeda no
+        mesmo segundo saem em ordem de instante, e a mais recente prevalece.
+        """
+        return """
+            SELECT
+                FLOOR(EXTRACT(EPOCH FROM recorded_at))::bigint,
+                currency_code,
+                rate_to_brl::float8,
+                recorded_at
+            FROM exchange_rates
+            WHERE currency_code = ANY(%(currency_codes)s::varchar[])
+                AND recorded_at >= %(start_date)s
+                AND recorded_at <= %(end_date)s
+            UNION ALL
+            SELECT
+                FLOOR(EXTRACT(EPOCH FROM bucket))::bigint,
+                currency_code,
+                close_rate::float8,
+                bucket
+            FROM exchange_rates_hourly
+            WHERE currency_code = ANY(%(currency_codes)s::varchar[])
+                AND bucket >= %(start_date)s
+                AND bucket <= %(end_date)s
+            ORDER BY 1, 2, 4
+        """
+    
+    @staticmethod
+    def _columnar(rows, currency_codes):
+        """
+        Alinha linhas (epoch, moeda, taxa, instante) ordenadas por epoch em colunas
+        
+        Returns:
+            Tupla (timestamps, {moeda: [taxa ou None por timestamp]})
+        """
+        timestamps = []
+        columns = {code: [] for code in currency_codes}
+        last_ts = None
+        for ts, code, rate, _ in rows:
+            if ts != last_ts:
+                timestamps.append(ts)
+                for column in columns.values():
+                    column.append(None)
+                last_ts = ts
+            columns[code][-1] = rate
+        return timestamps, columns
+    
+    @timed_db_method
+    def get_historical_rates_multi(self, currency_codes, start_date, end_date):
+        """
+        Retorna o histórico de várias moedas em formato colunar, com uma consulta
+        
+        As amostras de um mesmo snapshot têm o mesmo recorded_at, então cada
+        timestamp (epoch em segundos) vira uma posição em todas as colunas;
+        moedas sem amostra naquele instante ficam com None.
+        
+        Args:
+            currency_codes: Lista de códigos de moeda
+            start_date: Data inicial (datetime)
+            end_date: Data final (datetime)
         
+        Returns:
+            Tupla (timestamps, {moeda: [taxa]}), do mais antigo ao mais recente
+        """
         try:
-            with self.connection.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("""
-                    SELECT 
-                        id,
-                        currency_code,
-                        rate_to_brl,
-                        recorded_at,
-                        source
-                    FROM exchange_rates
-                    WHERE currency_code = %s
-                        AND recorded_at >= %s
-                        AND recorded_at <= %s
-                    ORDER BY recorded_at DESC
-                """, (currency_code, start_date, end_date))
+            with self.pool.connection() as conn, conn.cursor() as cur:
+                cur.execute(self._multi_history_sql(), {
+                    'currency_codes': list(currency_codes),
+                    'start_date': start_date,
+                    'end_date': end_date
+                })
+                return self._columnar(cur.fetchall(), currency_codes)
+        except Exception as e:
+            logger.error(f"Erro ao buscar histórico: {str(e)}")
+            return [], {code: [] for code in currency_codes}
+    
+    @timed_db_method
+    def get_historical_rates_page(self, currency_code, start_date, end_date, after=None, limit=1000):
+        """
+        Retorna uma página do histórico, do mais recente para o mais antigo
+        
+        Args:
+            currency_code: Código da moeda (ex: USD)
+            start_date: Data inicial
+            end_date: Data final
+            after: Tupla (recorded_at, id) da última linha da página anterior
+            limit: Máximo de linhas da página
+        
+        Returns:
+            Tupla (Records, próximo after) — o próximo after é None na última página
+        """
+        keyset = after is not None
+        after_ts, after_id = after if keyset else (None, None)
+        
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cur:
+                cur.execute(
+                    self._history_sql(keyset=keyset, limit=True),
+                    self._history_params(
+                        currency_code, start_date, end_date,
+                        after_ts=after_ts, after_id=after_id, limit=limit
+                    )
+                )
                 
                 results = cur.fetchall()
-                return [
-                    {
-                        'id': row['id'],
-                        'currency_code': row['currency_code'],
-                        'rate_to_brl': float(row['rate_to_brl']),
-                        'recorded_at': row['recorded_at'].isoformat(),
-                        'source': row['source']
-                    }
-                    for row in results
-                ]
         except Exception as e:
-            logger.error(f"Erro ao buscar histórico: {str(e)}")
-            return []
+            logger.error(f"Erro ao buscar página do histórico: {str(e)}")
+            return Records(HISTORY_FIELDS), None
+        
+        return Records(HISTORY_FIELDS, results), self._next_after(results, limit)
     
+    @staticmethod
+    def _next_after(results, limit):
+        """Cursor (recorded_at, id) da última linha de uma página cheia"""
+        if len(results) < limit:
+            return None
+        row_id, _, _, recorded_at, _ = results[-1]
+        return recorded_at, row_id or 0
+    
+    @timed_db_method
+    def iter_historical_rates(self, currency_code, start_date, end_date, chunk_size=2000):
+        """
+        Percorre o histórico com um cursor no servidor, em blocos
+        
+        Mantém uma conexão do pool enquanto o gerador está ativo; só
+        `chunk_size` linhas ficam em memória por vez.
+        
+        Yields:
+            Listas de tuplas (id, currency_code, rate_to_brl, recorded_at, source)
+        """
+        with self.pool.connection() as conn:
+            with conn.cursor(name='history_stream') as cur:
+                cur.itersize = chunk_size
+                cur.execute(
+                    self._history_sql(),
+                    self._history_params(currency_code, start_date, end_date)
+                )
+                while True:
+                    rows = cur.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+    
+    @timed_db_method
+    def iter_raw_rates(self, since=None, created_since=None, chunk_size=5000):
+        """
+        Percorre as amostras brutas de todas as moedas com um cursor no servidor
+        
+        Args:
+            since: Só amostras com recorded_at >= since
+            created_since: Só amostras gravadas (created_at) a partir deste
+                instante (sincronização incremental, pelo índice de created_at)
+        
+        Yields:
+            Listas de tuplas (id, currency_code, rate_to_brl, recorded_at, source, created_at),
+            em ordem crescente de recorded_at
+        """
+        with self.pool.connection() as conn:
+            with conn.cursor(name='raw_rates_stream') as cur:
+                cur.itersize = chunk_size
+                cur.execute("""
+                    SELECT id, currency_code, rate_to_brl, recorded_at, source, created_at
+                    FROM exchange_rates
+                    WHERE (%(since)s::timestamp IS NULL OR recorded_at >= %(since)s::timestamp)
+                        AND (%(created_since)s::timestamp IS NULL OR created_at >= %(created_since)s::timestamp)
+                    ORDER BY recorded_at, id
+                """, {'since': since, 'created_since': created_since})
+                while True:
+                    rows = cur.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+    
+    @staticmethod
+    def _export_sql():
+        """Amostras brutas filtradas por moeda e período, para exportação (taxa já em float8)"""
+        return """
+            SELECT id, currency_code, rate_to_brl::float8, recorded_at, source
+            FROM exchange_rates
+            WHERE (%(currency_codes)s::varchar[] IS NULL OR currency_code = ANY(%(currency_codes)s::varchar[]))
+                AND (%(start_date)s::timestamp IS NULL OR recorded_at >= %(start_date)s::timestamp)
+                AND (%(end_date)s::timestamp IS NULL OR recorded_at <= %(end_date)s::timestamp)
+            ORDER BY recorded_at, id
+        """
+    
+    @timed_db_method
+    def iter_export_rates(self, currency_codes=None, start_date=None, end_date=None, chunk_size=50000):
+        """
+        Percorre exchange_rates para exportação com um cursor no servidor
+        
+        Args:
+            currency_codes: Lista de moedas (None = todas)
+            start_date: Só amostras com recorded_at >= start_date (None = desde o início)
+            end_date: Só amostras com recorded_at <= end_date (None = até o fim)
+        
+        Yields:
+            Listas de até `chunk_size` tuplas (id, currency_code, rate_to_brl,
+            recorded_at, source), em ordem crescente de recorded_at
+        """
+        with self.pool.connection() as conn:
+            with conn.cursor(name='export_rates_stream') as cur:
+                cur.itersize = chunk_size
+                cur.execute(self._export_sql(), {
+                    'currency_codes': list(currency_codes) if currency_codes else None,
+                    'start_date': start_date,
+                    'end_date': end_date
+                })
+                while True:
+                    rows = cur.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+    
+    @staticmethod
+    def _daily_stats_sql():
+        """Agregados diários do rollup, do dia mais recente ao mais antigo (colunas de DAILY_STATS_FIELDS)"""
+        return """
+            SELECT 
+                date,
+                min_rate::float8,
+                max_rate::float8,
+                (sum_rate / sample_count)::float8 AS avg_rate,
+                sample_count
+            FROM daily_rate_rollup
+            WHERE currency_code = %(currency_code)s
+                AND date >= CURRENT_DATE - %(days)s::integer
+            ORDER BY date DESC
+        """
+    
+    @timed_db_method
     def get_daily_stats(self, currency_code, days=30):
         """
         Retorna estatísticas diárias para uma moeda
@@ -169,40 +915,101 @@ class DatabaseManager:
         Args:
             currency_code: Código da moeda
             days: Número de dias para retornar (padrão: 30)
-        """
-        if not self.ensure_connection():
-            return []
         
+        Returns:
+            Records com os campos de DAILY_STATS_FIELDS
+        """
         try:
-            with self.connection.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("""
-                    SELECT 
-                        date,
-                        min_rate,
-                        max_rate,
-                        avg_rate,
-                        sample_count
-                    FROM daily_rate_stats
-                    WHERE currency_code = %s
-                        AND date >= CURRENT_DATE - INTERVAL '%s days'
-                    ORDER BY date DESC
-                """, (currency_code, days))
-                
-                results = cur.fetchall()
-                return [
-                    {
-                        'date': row['date'].isoformat(),
-                        'min_rate': float(row['min_rate']),
-                        'max_rate': float(row['max_rate']),
-                        'avg_rate': float(row['avg_rate']),
-                        'sample_count': row['sample_count']
-                    }
-                    for row in results
-                ]
+            with self.pool.connection() as conn, conn.cursor() as cur:
+                cur.execute(self._daily_stats_sql(), {'currency_code': currency_code, 'days': days})
+                return Records(DAILY_STATS_FIELDS, cur.fetchall())
         except Exception as e:
             logger.error(f"Erro ao buscar estatísticas diárias: {str(e)}")
-            return []
+            return Records(DAILY_STATS_FIELDS)
+    
+    @staticmethod
+    def _ohlc_sql(resolution):
+        """
+        Monta a consulta de candles OHLC em buckets de largura `width`
+
+        Com `resolution`, agrega os candles pré-calculados de rate_candles
+        (ex.: 4h a partir de 1h); sem, agrega as amostras brutas de
+        exchange_rates, cada uma como um candle de um ponto.
+        """
+        if resolution:
+            source = """
+                SELECT bucket AS at, open_rate, high_rate, low_rate, close_rate, sample_count
+                FROM rate_candles
+                WHERE currency_code = %(currency_code)s
+                    AND resolution = %(resolution)s
+                    AND bucket >= date_bin(%(width)s::interval, %(start)s::timestamp, {origin})
+                    AND bucket < date_bin(%(width)s::interval, %(end)s::timestamp, {origin}) + %(width)s::interval"""
+        else:
+            source = """
+                SELECT recorded_at AS at, rate_to_brl AS open_rate, rate_to_brl AS high_rate,
+                    rate_to_brl AS low_rate, rate_to_brl AS close_rate, 1 AS sample_count
+                FROM exchange_rates
+                WHERE currency_code = %(currency_code)s
+                    AND recorded_at >= date_bin(%(width)s::interval, %(start)s::timestamp, {origin})
+                    AND recorded_at < date_bin(%(width)s::interval, %(end)s::timestamp, {origin}) + %(width)s::interval"""
+        return f"""
+            SELECT
+                date_bin(%(width)s::interval, at, {CANDLE_ORIGIN}) AS time,
+                ((array_agg(open_rate ORDER BY at))[1])::float8 AS open_rate,
+                MAX(high_rate)::float8 AS high_rate,
+                MIN(low_rate)::float8 AS low_rate,
+                ((array_agg(close_rate ORDER BY at DESC))[1])::float8 AS close_rate,
+                SUM(sample_count)::integer AS sample_count
+            FROM ({source.format(origin=CANDLE_ORIGIN)}
+            ) candles
+            GROUP BY 1
+            ORDER BY 1
+        """
+    
+    @staticmethod
+    def _ohlc_params(currency_code, interval, start, end):
+        width, resolution = OHLC_INTERVALS[interval]
+        return {
+            'currency_code': currency_code,
+            'resolution': resolution,
+            'width': width,
+            'start': start,
+            'end': end
+        }
+    
+    @timed_db_method
+    def get_ohlc(self, currency_code, interval, start, end):
+        """
+        Retorna candles OHLC de uma moeda, do mais antigo para o mais recente
+        
+        Intervalos a partir de 15m vêm de rate_candles (uma leitura pelo
+        índice, mesmo para um ano de candles horários) e cobrem também os
+        períodos já reduzidos pela retenção; 1m e 5m agregam as amostras
+        brutas. Os candles vão do bucket que contém `start` ao que contém
+        `end`, sempre completos.
+        
+        Args:
+            currency_code: Código da moeda
+            interval: Chave de OHLC_INTERVALS (15m, 1h, 4h, 1d...)
+            start: Início do período (datetime)
+            end: Fim do período (datetime)
+        
+        Returns:
+            Records com os campos de OHLC_FIELDS
+        """
+        width, resolution = OHLC_INTERVALS[interval]
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cur:
+                cur.execute(
+                    self._ohlc_sql(resolution),
+                    self._ohlc_params(currency_code, interval, start, end)
+                )
+                return Records(OHLC_FIELDS, cur.fetchall())
+        except Exception as e:
+            logger.error(f"Erro ao buscar candles: {str(e)}")
+            return Records(OHLC_FIELDS)
     
+    @timed_db_method
     def get_rate_at_date(self, currency_code, target_date):
         """
         Retorna a taxa mais próxima de uma data específica
@@ -211,21 +1018,41 @@ class DatabaseManager:
             currency_code: Código da moeda
             target_date: Data alvo (datetime ou string YYYY-MM-DD)
         """
-        if not self.ensure_connection():
-            return None
+        if isinstance(target_date, str):
+            target_date = datetime.fromisoformat(target_date)
+        # Intervalo [dia, dia + 1) em vez de DATE(recorded_at), para usar o índice
+        day_start = datetime.combine(target_date.date(), datetime.min.time())
+        day_end = day_start + timedelta(days=1)
         
         try:
-            with self.connection.cursor(cursor_factory=RealDictCursor) as cur:
+            with self.pool.connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
                 cur.execute("""
-                    SELECT 
-                        rate_to_brl,
-                        recorded_at
-                    FROM exchange_rates
-                    WHERE currency_code = %s
-                        AND DATE(recorded_at) = DATE(%s)
+                    (
+                        SELECT 
+                            rate_to_brl,
+                            recorded_at
+                        FROM exchange_rates
+                        WHERE currency_code = %(currency_code)s
+                            AND recorded_at >= %(day_start)s
+                            AND recorded_at < %(day_end)s
+                        ORDER BY recorded_at DESC
+                        LIMIT 1
+                    )
+                    UNION ALL
+                    (
+                        SELECT
+                            close_rate,
+                            bucket
+                        FROM exchange_rates_hourly
+                        WHERE currency_code = %(currency_code)s
+                            AND bucket >= %(day_start)s
+                            AND bucket < %(day_end)s
+                        ORDER BY bucket DESC
+                        LIMIT 1
+                    )
                     ORDER BY recorded_at DESC
                     LIMIT 1
-                """, (currency_code, target_date))
+                """, {'currency_code': currency_code, 'day_start': day_start, 'day_end': day_end})
                 
                 result = cur.fetchone()
                 if result:
@@ -238,8 +1065,332 @@ class DatabaseManager:
             logger.error(f"Erro ao buscar taxa na data: {str(e)}")
             return None
     
+    def get_rate_as_of(self, currency_code, at):
+        """
+        Retorna a última taxa registrada até `at` (inclusive), mesmo em outro dia
+        
+        Args:
+            currency_code: Código da moeda
+            at: Instante de referência (datetime)
+        """
+        results = self.get_rates_as_of_batch([(currency_code, at)])
+        return results[0] if results else None
+    
+    @timed_db_method
+    def get_rates_as_of_batch(self, lookups):
+        """
+        Resolve várias consultas "taxa vigente em" em uma única query
+        
+        Cada par usa o índice (currency_code, recorded_at DESC) com LIMIT 1
+        via LATERAL, caindo nos candles horários para períodos já reduzidos.
+        
+        Args:
+            lookups: Lista de tuplas (currency_code, at)
+        
+        Returns:
+            Lista na mesma ordem de `lookups` com {'rate', 'recorded_at'} ou
+            None quando não há taxa até aquele instante
+        """
+        if not lookups:
+            return []
+        
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cur:
+                rows = execute_values(cur, """
+                    SELECT q.idx, r.rate_to_brl, r.recorded_at
+                    FROM (VALUES %s) AS q(idx, currency_code, at)
+                    LEFT JOIN LATERAL (
+                        (
+                            SELECT rate_to_brl, recorded_at
+                            FROM exchange_rates e
+                            WHERE e.currency_code = q.currency_code
+                                AND e.recorded_at <= q.at
+                            ORDER BY e.recorded_at DESC
+                            LIMIT 1
+                        )
+                        UNION ALL
+                        (
+                            SELECT close_rate, bucket
+                            FROM exchange_rates_hourly h
+                            WHERE h.currency_code = q.currency_code
+                                AND h.bucket <= q.at
+                            ORDER BY h.bucket DESC
+                            LIMIT 1
+                        )
+                        ORDER BY recorded_at DESC
+                        LIMIT 1
+                    ) r ON true
+                """, [
+                    (i, currency_code, at) for i, (currency_code, at) in enumerate(lookups)
+                ], template="(%s, %s, %s::timestamp)", page_size=len(lookups), fetch=True)
+        except Exception as e:
+            logger.error(f"Erro ao buscar taxas vigentes: {str(e)}")
+            return [None] * len(lookups)
+        
+        results = [None] * len(lookups)
+        for idx, rate, recorded_at in rows:
+            if rate is not None:
+                results[idx] = {
+                    'rate': float(rate),
+                    'recorded_at': recorded_at.isoformat()
+                }
+        return results
+    
+    @timed_db_method
+    def backfill_daily_rollup(self, since=None):
+        """
+        Recalcula o rollup diário a partir de exchange_rates
+        
+        Sobrescreve os dias recalculados, então pode ser executado mais de uma vez.
+        
+        Args:
+            since: Data inicial (date ou string YYYY-MM-DD); None recalcula tudo
+        
+        Returns:
+            Número de dias (moeda, data) gravados
+        """
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO daily_rate_rollup
+                        (currency_code, date, min_rate, max_rate, sum_rate, sample_count)
+                    SELECT
+                        currency_code,
+                        DATE(recorded_at),
+                        MIN(rate_to_brl),
+                        MAX(rate_to_brl),
+                        SUM(rate_to_brl),
+                        COUNT(*)
+                    FROM exchange_rates
+                    WHERE %(since)s::date IS NULL OR recorded_at >= %(since)s::date
+                    GROUP BY currency_code, DATE(recorded_at)
+                    ON CONFLICT (currency_code, date) DO UPDATE SET
+                        min_rate = EXCLUDED.min_rate,
+                        max_rate = EXCLUDED.max_rate,
+                        sum_rate = EXCLUDED.sum_rate,
+                        sample_count = EXCLUDED.sample_count
+                """, {'since': since})
+                days = cur.rowcount
+            conn.commit()
+        logger.info(f"Rollup diário recalculado: {days} dias")
+        return days
+    
+    @timed_db_method
+    def backfill_candles(self, since=None):
+        """
+        Recalcula rate_candles a partir de exchange_rates e exchange_rates_hourly
+        
+        Sobrescreve os candles recalculados, então pode ser executado mais de
+        uma vez. Os candles horários da retenção alimentam só as resoluções
+        de 1h para cima.
+        
+        Args:
+            since: Data inicial (date ou string YYYY-MM-DD); None recalcula tudo
+        
+        Returns:
+            Número de candles (moeda, resolução, bucket) gravados
+        """
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    WITH source AS (
+                        SELECT currency_code, rate_to_brl AS open_rate, rate_to_brl AS high_rate,
+                            rate_to_brl AS low_rate, rate_to_brl AS close_rate,
+                            recorded_at AS open_at, recorded_at AS close_at,
+                            rate_to_brl AS sum_rate, 1 AS sample_count, false AS downsampled
+                        FROM exchange_rates
+                        WHERE %(since)s::date IS NULL OR recorded_at >= %(since)s::date
+                        UNION ALL
+                        SELECT currency_code, open_rate, high_rate, low_rate, close_rate,
+                            bucket, bucket + INTERVAL '1 hour' - INTERVAL '1 microsecond',
+                            sum_rate, sample_count, true
+                        FROM exchange_rates_hourly
+                        WHERE %(since)s::date IS NULL OR bucket >= %(since)s::date
+                    )
+                    INSERT INTO rate_candles
+                        (currency_code, resolution, bucket, open_rate, high_rate, low_rate,
+                         close_rate, open_at, close_at, sum_rate, sample_count)
+                    SELECT
+                        s.currency_code,
+                        r.resolution,
+                        date_bin(r.width, s.open_at, {CANDLE_ORIGIN}),
+                        (array_agg(s.open_rate ORDER BY s.open_at))[1],
+                        MAX(s.high_rate),
+                        MIN(s.low_rate),
+                        (array_agg(s.close_rate ORDER BY s.close_at DESC))[1],
+                        MIN(s.open_at),
+                        MAX(s.close_at),
+                        SUM(s.sum_rate),
+                        SUM(s.sample_count)
+                    FROM source s
+                    CROSS JOIN (VALUES {_CANDLE_RESOLUTIONS_SQL}) AS r (resolution, width)
+                    WHERE NOT s.downsampled OR r.width >= INTERVAL '1 hour'
+                    GROUP BY 1, 2, 3
+                    ON CONFLICT (currency_code, resolution, bucket) DO UPDATE SET
+                        open_rate = EXCLUDED.open_rate,
+                        high_rate = EXCLUDED.high_rate,
+                        low_rate = EXCLUDED.low_rate,
+                        close_rate = EXCLUDED.close_rate,
+                        open_at = EXCLUDED.open_at,
+                        close_at = EXCLUDED.close_at,
+                        sum_rate = EXCLUDED.sum_rate,
+                        sample_count = EXCLUDED.sample_count
+                """, {'since': since})
+                candles = cur.rowcount
+            conn.commit()
+        logger.info(f"Candles recalculados: {candles}")
+        return candles
+    
+    @timed_db_method
+    def list_partitions(self):
+        """Retorna [(nome, primeiro dia do mês)] das partições de exchange_rates"""
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT c.relname
+                    FROM pg_inherits i
+                    JOIN pg_class c ON c.oid = i.inhrelid
+                    WHERE i.inhparent = 'exchange_rates'::regclass
+                    ORDER BY c.relname
+                """)
+                names = [row[0] for row in cur.fetchall()]
+        
+        partitions = []
+        for name in names:
+            try:
+                month = datetime.strptime(name[-7:], '%Y_%m').date()
+            except ValueError:
+                continue
+            partitions.append((name, month))
+        return partitions
+    
+    @timed_db_method
+    def ensure_partitions(self, months_ahead=2):
+        """Cria as partições do mês atual e dos próximos `months_ahead` meses"""
+        month = datetime.now().date().replace(day=1)
+        created = []
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                for _ in range(months_ahead + 1):
+                    cur.execute("SELECT create_exchange_rates_partition(%s)", (month,))
+                    created.append(cur.fetchone()[0])
+                    self._known_partitions.add(month)
+                    month = (month + timedelta(days=32)).replace(day=1)
+            conn.commit()
+        return created
+    
+    @timed_db_method
+    def apply_retention(self, raw_retention_months=3):
+        """
+        Reduz partições antigas a candles horários e remove as amostras brutas
+        
+        Cada partição mensal inteiramente anterior à janela de retenção é
+        agregada em exchange_rates_hourly e removida na mesma transação.
+        O rollup diário não é alterado.
+        
+        Args:
+            raw_retention_months: Meses completos de amostras brutas a manter,
+                além do mês atual
+        
+        Returns:
+            Lista de partições removidas
+        """
+        cutoff = datetime.now().date().replace(day=1)
+        for _ in range(raw_retention_months):
+            cutoff = (cutoff - timedelta(days=1)).replace(day=1)
+        
+        dropped = []
+        for name, month in self.list_partitions():
+            if month >= cutoff:
+                continue
+            
+            with self.pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(sql.SQL("""
+                        INSERT INTO exchange_rates_hourly
+                            (currency_code, bucket, open_rate, high_rate, low_rate,
+                             close_rate, sum_rate, sample_count)
+                        SELECT
+                            currency_code,
+                            date_trunc('hour', recorded_at),
+                            (array_agg(rate_to_brl ORDER BY recorded_at))[1],
+                            MAX(rate_to_brl),
+                            MIN(rate_to_brl),
+                            (array_agg(rate_to_brl ORDER BY recorded_at DESC))[1],
+                            SUM(rate_to_brl),
+                            COUNT(*)
+                        FROM {}
+                        GROUP BY currency_code, date_trunc('hour', recorded_at)
+                        ON CONFLICT (currency_code, bucket) DO NOTHING
+                    """).format(sql.Identifier(name)))
+                    buckets = cur.rowcount
+                    cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(name)))
+                conn.commit()
+            
+            self._known_partitions.discard(month)
+            dropped.append(name)
+            logger.info(f"Partição {name} reduzida a {buckets} candles horários e removida")
+        
+        return dropped
+    
+    def migrate_to_partitions(self, schema_path):
+        """
+        Converte uma tabela exchange_rates não particionada (schema antigo)
+        
+        Renomeia a tabela antiga, aplica o schema, copia as linhas para as
+        partições mensais e remove a tabela antiga, tudo em uma transação.
+        
+        Returns:
+            Número de linhas migradas, ou None se a tabela já é particionada
+        """
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT relkind FROM pg_class
+                    WHERE oid = 'exchange_rates'::regclass
+                """)
+                if cur.fetchone()[0] == 'p':
+                    return None
+                
+                cur.execute("""
+                    DROP VIEW IF EXISTS latest_rates;
+                    ALTER TABLE exchange_rates RENAME TO exchange_rates_legacy;
+                    DROP INDEX IF EXISTS idx_exchange_rates_currency;
+                    DROP INDEX IF EXISTS idx_exchange_rates_recorded_at;
+                    DROP INDEX IF EXISTS idx_exchange_rates_currency_date;
+                """)
+                with open(schema_path, encoding='utf-8') as f:
+                    cur.execute(f.read())
+                
+                cur.execute("""
+                    SELECT create_exchange_rates_partition(month)
+                    FROM (
+                        SELECT DISTINCT date_trunc('month', recorded_at)::date AS month
+                        FROM exchange_rates_legacy
+                    ) months
+                """)
+                cur.execute("""
+                    INSERT INTO exchange_rates
+                        (id, currency_code, rate_to_brl, recorded_at, source, created_at)
+                    SELECT id, currency_code, rate_to_brl, recorded_at, source, created_at
+                    FROM exchange_rates_legacy
+                """)
+                rows = cur.rowcount
+                cur.execute("""
+                    SELECT setval(
+                        pg_get_serial_sequence('exchange_rates', 'id'),
+                        COALESCE((SELECT MAX(id) FROM exchange_rates), 0) + 1,
+                        false
+                    )
+                """)
+                cur.execute("DROP TABLE exchange_rates_legacy")
+            conn.commit()
+        
+        self._known_partitions.clear()
+        logger.info(f"exchange_rates migrada para particionamento mensal: {rows} linhas")
+        return rows
+    
     def close(self):
-        """Fecha a conexão com o banco de dados"""
-        if self.connection and not self.connection.closed:
-            self.connection.close()
-            logger.info("Conexão com banco de dados fechada")
+        """Fecha as conexões do pool com o banco de dados"""
+        self.pool.close()
+        logger.info("Conexões com banco de dados fechadas")
@@ -0,0 +1,637 @@
+import asyncpg
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+import os
+import re
+import asyncio
+import logging
+import time
+
+from database import DAILY_STATS_FIELDS, HISTORY_FIELDS, OHLC_FIELDS, OHLC_INTERVALS, DatabaseManager
+from metrics import observe_save, timed_db_method
+from response_encoding import Records
+
+logger = logging.getLogger(__name__)
+
+# Erros que indicam banco inacessível (contam no circuit breaker); TimeoutError
+# cobre tanto o connect quanto a espera por uma conexão livre do pool
+CONNECTION_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.ConnectionDoesNotExistError,
+    asyncpg.CannotConnectNowError
+)
+
+_NAMED_PARAM_RE = re.compile(r'%\((\w+)\)s')
+
+
+def _positional(query, params):
+    """
+    Converte uma consulta com parâmetros %(nome)s (psycopg2) para $1, $2... (asyncpg)
+
+    Returns:
+        Tupla (consulta, lista de argumentos)
+    """
+    order = []
+
+    def replace(match):
+        name = match.group(1)
+        if name not in order:
+            order.append(name)
+        return f'${order.index(name) + 1}'
+
+    query = _NAMED_PARAM_RE.sub(replace, query)
+    return query, [params[name] for name in order]
+
+
+class AsyncDatabaseManager:
+    """
+    Versão asyncio do DatabaseManager, sobre um pool do asyncpg
+
+    Usa as mesmas tabelas e as mesmas variáveis de ambiente (DB_*, DB_POOL_*,
+    DB_BREAKER_*). Os métodos retornam os mesmos formatos que os de
+    DatabaseManager, e o circuit breaker segue as mesmas regras, com a
+    sondagem em uma task no lugar da thread.
+    """
+
+    get_db_config = staticmethod(DatabaseManager.get_db_config)
+
+    def __init__(self, min_size=None, max_size=None):
+        self.min_size = min_size if min_size is not None else int(os.environ.get('DB_POOL_MIN_SIZE', 1))
+        self.max_size = max_size if max_size is not None else int(os.environ.get('DB_POOL_MAX_SIZE', 5))
+        self.timeout = float(os.environ.get('DB_POOL_TIMEOUT_SECONDS', 10))
+        self.connect_timeout = float(os.environ.get('DB_CONNECT_TIMEOUT_SECONDS', 5))
+        self.breaker = DatabaseManager.create_breaker()
+        self.pool = None
+        self._connect_lock = asyncio.Lock()
+        self._probe_task = None
+        # Meses cuja partição de exchange_rates já foi garantida por este processo
+        self._known_partitions = set()
+
+    async def connect(self):
+        """Cria o pool e abre as conexões mínimas com o PostgreSQL"""
+        try:
+            # Conexões concorrentes (inicialização, primeira consulta, sondagem) criam um único pool
+            async with self._connect_lock:
+                if self.pool is None:
+                    self.pool = await asyncpg.create_pool(
+                        **self.get_db_config(),
+                        timeout=self.connect_timeout,
+                        min_size=self.min_size,
+                        max_size=self.max_size,
+                        max_inactive_connection_lifetime=float(
+                            os.environ.get('DB_POOL_MAX_IDLE_SECONDS', 300)
+                        )
+                    )
+            logger.info("Conectado ao banco de dados PostgreSQL (asyncpg)")
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao conectar ao banco: {str(e)}")
+            self._record_failure(e)
+            return False
+
+    def _record_failure(self, error):
+        """Conta uma falha de conexão no breaker; se o circuito abriu, começa a sondar"""
+        if not self.breaker.record_failure(error):
+            return
+        if self.pool is not None:
+            # As conexões ociosas provavelmente caíram junto com o banco
+            asyncio.ensure_future(self.pool.expire_connections())
+        if self._probe_task is None or self._probe_task.done():
+            self._probe_task = asyncio.ensure_future(self._probe())
+
+    async def _probe(self):
+        """Sonda o banco em backoff exponencial até o circuito fechar"""
+        while not self.breaker.allow():
+            await asyncio.sleep(self.breaker.probe_delay())
+            if not self.breaker.begin_probe():
+                return
+            try:
+                conn = await asyncpg.connect(**self.get_db_config(), timeout=self.connect_timeout)
+                await conn.close()
+            except Exception as e:
+                logger.warning(f"Sondagem do banco falhou: {str(e)}")
+                self.breaker.record_failure(e)
+                continue
+            self.breaker.record_success()
+            if self.pool is None:
+                await self.connect()
+
+    @asynccontextmanager
+    async def acquire(self):
+        """
+        Conexão do pool (async with), respeitando DB_POOL_TIMEOUT_SECONDS
+
+        Falha na hora com CircuitOpenError enquanto o circuit breaker está aberto.
+        """
+        self.breaker.check()
+        if self.pool is None and not await self.connect():
+            raise ConnectionError('Pool do banco de dados não inicializado')
+        try:
+            async with self.pool.acquire(timeout=self.timeout) as conn:
+                yield conn
+        except CONNECTION_ERRORS as e:
+            self._record_failure(e)
+            raise
+        self.breaker.record_success()
+
+    async def ensure_connection(self):
+        """Garante que o pool consegue entregar uma conexão ativa"""
+        try:
+            async with self.acquire() as conn:
+                await conn.fetchval('SELECT 1')
+                return True
+        except Exception:
+            return False
+
+    def is_available(self):
+        """False enquanto o circuit breaker do banco está aberto (sem I/O)"""
+        return self.breaker.allow()
+
+    def require_available(self):
+        """Levanta CircuitOpenError se o banco está indisponível (modo degradado)"""
+        self.breaker.check()
+
+    def breaker_state(self):
+        """Estado do circuit breaker do banco, sem I/O"""
+        return self.breaker.snapshot()
+
+    def pool_stats(self):
+        """Retorna o tamanho atual do pool de conexões"""
+        if self.pool is None:
+            return {'size': 0, 'idle': 0, 'in_use': 0, 'min_size': self.min_size, 'max_size': self.max_size}
+        size = self.pool.get_size()
+        idle = self.pool.get_idle_size()
+        return {
+            'size': size,
+            'idle': idle,
+            'in_use': size - idle,
+            'min_size': self.pool.get_min_size(),
+            'max_size': self.pool.get_max_size()
+        }
+
+    async def save_rates(self, rates_dict, source='exchangerate-api', conn=None):
+        """
+        Salva taxas de câmbio no banco de dados
+
+        Args:
+            rates_dict: Dict com {currency_code: rate_to_brl}
+            source: Fonte dos dados
+            conn: Conexão com transação aberta por quem chamou (ver save_rates_bulk)
+        """
+        return await self.save_rates_bulk([(rates_dict, datetime.now(), source)], conn=conn)
+
+    @timed_db_method
+    async def save_rates_bulk(self, snapshots, skip_existing=False, log_updates=True, conn=None):
+        """
+        Salva vários snapshots de taxas em uma única transação
+
+        As linhas vão em arrays (unnest) em um único comando, que também
+        atualiza o rollup diário e os candles, como em DatabaseManager.save_rates_bulk.
+
+        Args:
+            snapshots: Lista de tuplas (rates_dict, recorded_at, source)
+            skip_existing: Ignora linhas com mesma moeda, recorded_at e source
+                já gravadas (replay idempotente da fila de escrita)
+            log_updates: Registra cada snapshot em rate_updates
+            conn: Grava nesta conexão, em um savepoint dentro da transação de
+                quem chamou (ex.: a que segura o advisory lock), sem pegar
+                outra do pool; o commit fica com quem chamou
+        """
+        snapshots = [s for s in snapshots if s[0]]
+        if not snapshots:
+            return True
+
+        codes, rates, recorded, sources = [], [], [], []
+        for rates_dict, recorded_at, source in snapshots:
+            for currency_code, rate in rates_dict.items():
+                codes.append(currency_code)
+                rates.append(rate)
+                recorded.append(recorded_at)
+                sources.append(source)
+        months = {recorded_at.date().replace(day=1) for _, recorded_at, _ in snapshots}
+        started = time.perf_counter()
+
+        if conn is not None:
+            try:
+                # Savepoint: uma falha aqui não aborta a transação de quem chamou
+                async with conn.transaction():
+                    await self._insert_snapshots(
+                        conn, codes, rates, recorded, sources, snapshots, months, skip_existing, log_updates
+                    )
+            except Exception as e:
+                logger.error(f"Erro ao salvar taxas: {str(e)}")
+                observe_save(started, len(codes), False)
+                return False
+            # Partições criadas aqui só existem se quem chamou fizer commit: não entram em _known_partitions
+            observe_save(started, len(codes), True)
+            logger.info(f"Salvou {len(codes)} taxas de {len(snapshots)} snapshot(s) no banco de dados")
+            return True
+
+        try:
+            async with self.acquire() as conn:
+                try:
+                    async with conn.transaction():
+                        await self._insert_snapshots(
+                            conn, codes, rates, recorded, sources, snapshots, months, skip_existing, log_updates
+                        )
+
+                    self._known_partitions |= months
+                    observe_save(started, len(codes), True)
+                    logger.info(
+                        f"Salvou {len(codes)} taxas de {len(snapshots)} snapshot(s) no banco de dados"
+                    )
+                    return True
+
+                except Exception as e:
+                    logger.error(f"Erro ao salvar taxas: {str(e)}")
+
+                    # Registra falha
+                    try:
+                        await conn.execute("""
+                            INSERT INTO rate_updates (currencies_updated, success, error_message)
+                            VALUES ($1, $2, $3)
+                        """, 0, False, str(e))
+                    except Exception:
+                        pass
+
+                    observe_save(started, len(codes), False)
+                    return False
+        except Exception as e:
+            logger.error(f"Não foi possível conectar ao banco de dados: {str(e)}")
+            observe_save(started, len(codes), False)
+            return False
+
+    async def _insert_snapshots(self, conn, codes, rates, recorded, sources, snapshots, months,
+                                skip_existing, log_updates):
+        """Comandos de save_rates_bulk: partições, taxas + rollup + candles e rate_updates"""
+        known = months & self._known_partitions
+        for month in sorted(months - known):
+            await conn.execute("SELECT create_exchange_rates_partition($1)", month)
+
+        if not known:
+            await self._insert_rates(conn, codes, rates, recorded, sources, skip_existing)
+        else:
+            # Como em database.py: a partição pode ter sido removida por outro processo
+            try:
+                async with conn.transaction():
+                    await self._insert_rates(conn, codes, rates, recorded, sources, skip_existing)
+            except asyncpg.CheckViolationError:
+                self._known_partitions -= known
+                for month in sorted(known):
+                    await conn.execute("SELECT create_exchange_rates_partition($1)", month)
+                await self._insert_rates(conn, codes, rates, recorded, sources, skip_existing)
+
+        # Registra as atualizações
+        if log_updates:
+            await conn.execute("""
+                INSERT INTO rate_updates (currencies_updated, success)
+                SELECT n, true FROM unnest($1::integer[]) AS n
+            """, [len(rates_dict) for rates_dict, _, _ in snapshots])
+
+    async def _insert_rates(self, conn, codes, rates, recorded, sources, skip_existing):
+        """Grava as taxas e atualiza o rollup diário e os candles no mesmo comando"""
+        await conn.execute(f"""
+            WITH incoming (currency_code, rate_to_brl, recorded_at, source) AS (
+                SELECT * FROM unnest($1::varchar[], $2::numeric[], $3::timestamp[], $4::varchar[])
+            ),
+            inserted AS (
+                INSERT INTO exchange_rates (currency_code, rate_to_brl, recorded_at, source)
+                SELECT * FROM incoming{DatabaseManager._SKIP_EXISTING_SQL if skip_existing else ''}
+                RETURNING currency_code, rate_to_brl, recorded_at
+            ),{DatabaseManager._CANDLES_UPSERT_SQL}
+            INSERT INTO daily_rate_rollup
+                (currency_code, date, min_rate, max_rate, sum_rate, sample_count)
+            SELECT
+                currency_code,
+                DATE(recorded_at),
+                MIN(rate_to_brl),
+                MAX(rate_to_brl),
+                SUM(rate_to_brl),
+                COUNT(*)
+            FROM inserted
+            GROUP BY currency_code, DATE(recorded_at)
+            ON CONFLICT (currency_code, date) DO UPDATE SET
+                min_rate = LEAST(daily_rate_rollup.min_rate, EXCLUDED.min_rate),
+                max_rate = GREATEST(daily_rate_rollup.max_rate, EXCLUDED.max_rate),
+                sum_rate = daily_rate_rollup.sum_rate + EXCLUDED.sum_rate,
+                sample_count = daily_rate_rollup.sample_count + EXCLUDED.sample_count
+        """, codes, rates, recorded, sources)
+
+    @timed_db_method
+    async def get_latest_rates(self):
+        """Retorna as taxas mais recentes de cada moeda"""
+        try:
+            async with self.acquire() as conn:
+                results = await conn.fetch("""
+                    SELECT currency_code, rate_to_brl, recorded_at
+                    FROM latest_rates
+                    ORDER BY currency_code
+                """)
+                return {
+                    row['currency_code']: {
+                        'rate': float(row['rate_to_brl']),
+                        'recorded_at': row['recorded_at'].isoformat()
+                    }
+                    for row in results
+                }
+        except Exception as e:
+            logger.error(f"Erro ao buscar taxas mais recentes: {str(e)}")
+            return {}
+
+    @timed_db_method
+    async def get_historical_rates(self, currency_code, start_date, end_date):
+        """
+        Retorna histórico de taxas para uma moeda em um período
+
+        Args:
+            currency_code: Código da moeda (ex: USD)
+            start_date: Data inicial (datetime)
+            end_date: Data final (datetime)
+
+        Returns:
+            Records com os campos de HISTORY_FIELDS, do mais recente ao mais antigo
+        """
+        query, args = _positional(
+            DatabaseManager._history_sql(),
+            DatabaseManager._history_params(currency_code, start_date, end_date)
+        )
+        try:
+            async with self.acquire() as conn:
+                return Records(HISTORY_FIELDS, await conn.fetch(query, *args))
+        except Exception as e:
+            logger.error(f"Erro ao buscar histórico: {str(e)}")
+            return Records(HISTORY_FIELDS)
+
+    @timed_db_method
+    async def get_historical_rates_multi(self, currency_codes, start_date, end_date):
+        """Histórico colunar de várias moedas (mesmo formato de DatabaseManager.get_historical_rates_multi)"""
+        query, args = _positional(DatabaseManager._multi_history_sql(), {
+            'currency_codes': list(currency_codes),
+            'start_date': start_date,
+            'end_date': end_date
+        })
+        try:
+            async with self.acquire() as conn:
+                return DatabaseManager._columnar(await conn.fetch(query, *args), currency_codes)
+        except Exception as e:
+            logger.error(f"Erro ao buscar histórico: {str(e)}")
+            return [], {code: [] for code in currency_codes}
+
+    @timed_db_method
+    async def get_historical_rates_page(self, currency_code, start_date, end_date, after=None, limit=1000):
+        """
+        Retorna uma página do histórico, do mais recente para o mais antigo
+
+        Returns:
+            Tupla (Records, próximo after) — o próximo after é None na última página
+        """
+        keyset = after is not None
+        after_ts, after_id = after if keyset else (None, None)
+        query, args = _positional(
+            DatabaseManager._history_sql(keyset=keyset, limit=True),
+            DatabaseManager._history_params(
+                currency_code, start_date, end_date,
+                after_ts=after_ts, after_id=after_id, limit=limit
+            )
+        )
+
+        try:
+            async with self.acquire() as conn:
+                results = await conn.fetch(query, *args)
+        except Exception as e:
+            logger.error(f"Erro ao buscar página do histórico: {str(e)}")
+            return Records(HISTORY_FIELDS), None
+
+        return Records(HISTORY_FIELDS, results), DatabaseManager._next_after(results, limit)
+
+    @timed_db_method
+    async def iter_historical_rates(self, currency_code, start_date, end_date, chunk_size=2000):
+        """
+        Percorre o histórico com um cursor no servidor, em blocos
+
+        Yields:
+            Listas de registros (id, currency_code, rate_to_brl, recorded_at, source)
+        """
+        query, args = _positional(
+            DatabaseManager._history_sql(),
+            DatabaseManager._history_params(currency_code, start_date, end_date)
+        )
+        async with self.acquire() as conn:
+            async with conn.transaction(readonly=True):
+                cursor = await conn.cursor(query, *args)
+                while True:
+                    rows = await cursor.fetch(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+
+    @timed_db_method
+    async def iter_raw_rates(self, since=None, created_since=None, chunk_size=5000):
+        """
+        Percorre as amostras brutas de todas as moedas com um cursor no servidor
+
+        Yields:
+            Listas de registros (id, currency_code, rate_to_brl, recorded_at, source, created_at),
+            em ordem crescente de recorded_at
+        """
+        async with self.acquire() as conn:
+            async with conn.transaction(readonly=True):
+                cursor = await conn.cursor("""
+                    SELECT id, currency_code, rate_to_brl, recorded_at, source, created_at
+                    FROM exchange_rates
+                    WHERE ($1::timestamp IS NULL OR recorded_at >= $1::timestamp)
+                        AND ($2::timestamp IS NULL OR created_at >= $2::timestamp)
+                    ORDER BY recorded_at, id
+                """, since, created_since)
+                while True:
+                    rows = await cursor.fetch(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+
+    @timed_db_method
+    async def iter_export_rates(self, currency_codes=None, start_date=None, end_date=None, chunk_size=50000):
+        """
+        Percorre exchange_rates para exportação com um cursor no servidor
+
+        Yields:
+            Listas de registros (id, currency_code, rate_to_brl, recorded_at, source),
+            em ordem crescente de recorded_at
+        """
+        query, args = _positional(DatabaseManager._export_sql(), {
+            'currency_codes': list(currency_codes) if currency_codes else None,
+            'start_date': start_date,
+            'end_date': end_date
+        })
+        async with self.acquire() as conn:
+            async with conn.transaction(readonly=True):
+                cursor = await conn.cursor(query, *args)
+                while True:
+                    rows = await cursor.fetch(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+
+    @timed_db_method
+    async def get_daily_stats(self, currency_code, days=30):
+        """
+        Retorna estatísticas diárias para uma moeda
+
+        Args:
+            currency_code: Código da moeda
+            days: Número de dias para retornar (padrão: 30)
+
+        Returns:
+            Records com os campos de DAILY_STATS_FIELDS
+        """
+        query, args = _positional(
+            DatabaseManager._daily_stats_sql(),
+            {'currency_code': currency_code, 'days': days}
+        )
+        try:
+            async with self.acquire() as conn:
+                return Records(DAILY_STATS_FIELDS, await conn.fetch(query, *args))
+        except Exception as e:
+            logger.error(f"Erro ao buscar estatísticas diárias: {str(e)}")
+            return Records(DAILY_STATS_FIELDS)
+
+    @timed_db_method
+    async def get_ohlc(self, currency_code, interval, start, end):
+        """Retorna candles OHLC de uma moeda (mesmas regras de DatabaseManager.get_ohlc)"""
+        _, resolution = OHLC_INTERVALS[interval]
+        query, args = _positional(
+            DatabaseManager._ohlc_sql(resolution),
+            DatabaseManager._ohlc_params(currency_code, interval, start, end)
+        )
+        try:
+            async with self.acquire() as conn:
+                return Records(OHLC_FIELDS, await conn.fetch(query, *args))
+        except Exception as e:
+            logger.error(f"Erro ao buscar candles: {str(e)}")
+            return Records(OHLC_FIELDS)
+
+    @timed_db_method
+    async def get_rate_at_date(self, currency_code, target_date):
+        """
+        Retorna a taxa mais próxima de uma data específica
+
+        Args:
+            currency_code: Código da moeda
+            target_date: Data alvo (datetime)
+        """
+        day_start = datetime.combine(target_date.date(), datetime.min.time())
+        day_end = day_start + timedelta(days=1)
+
+        try:
+            async with self.acquire() as conn:
+                result = await conn.fetchrow("""
+                    (
+                        SELECT
+                            rate_to_brl,
+                            recorded_at
+                        FROM exchange_rates
+                        WHERE currency_code = $1
+                            AND recorded_at >= $2
+                            AND recorded_at < $3
+                        ORDER BY recorded_at DESC
+                        LIMIT 1
+                    )
+                    UNION ALL
+                    (
+                        SELECT
+                            close_rate,
+                            bucket
+                        FROM exchange_rates_hourly
+                        WHERE currency_code = $1
+                            AND bucket >= $2
+                            AND bucket < $3
+                        ORDER BY bucket DESC
+                        LIMIT 1
+                    )
+                    ORDER BY recorded_at DESC
+                    LIMIT 1
+                """, currency_code, day_start, day_end)
+                if result:
+                    return {
+                        'rate': float(result['rate_to_brl']),
+                        'recorded_at': result['recorded_at'].isoformat()
+                    }
+                return None
+        except Exception as e:
+            logger.error(f"Erro ao buscar taxa na data: {str(e)}")
+            return None
+
+    async def get_rate_as_of(self, currency_code, at):
+        """Retorna a última taxa registrada até `at` (inclusive), mesmo em outro dia"""
+        results = await self.get_rates_as_of_batch([(currency_code, at)])
+        return results[0] if results else None
+
+    @timed_db_method
+    async def get_rates_as_of_batch(self, lookups):
+        """
+        Resolve várias consultas "taxa vigente em" em uma única query
+
+        Args:
+            lookups: Lista de tuplas (currency_code, at)
+
+        Returns:
+            Lista na mesma ordem de `lookups` com {'rate', 'recorded_at'} ou None
+        """
+        if not lookups:
+            return []
+
+        try:
+            async with self.acquire() as conn:
+                rows = await conn.fetch("""
+                    SELECT q.idx, r.rate_to_brl, r.recorded_at
+                    FROM unnest($1::integer[], $2::varchar[], $3::timestamp[]) AS q(idx, currency_code, at)
+                    LEFT JOIN LATERAL (
+                        (
+                            SELECT rate_to_brl, recorded_at
+                            FROM exchange_rates e
+                            WHERE e.currency_code = q.currency_code
+                                AND e.recorded_at <= q.at
+                            ORDER BY e.recorded_at DESC
+                            LIMIT 1
+                        )
+                        UNION ALL
+                        (
+                            SELECT close_rate, bucket
+                            FROM exchange_rates_hourly h
+                            WHERE h.currency_code = q.currency_code
+                                AND h.bucket <= q.at
+                            ORDER BY h.bucket DESC
+                            LIMIT 1
+                        )
+                        ORDER BY recorded_at DESC
+                        LIMIT 1
+                    ) r ON true
+                """,
+                    list(range(len(lookups))),
+                    [currency_code for currency_code, _ in lookups],
+                    [at for _, at in lookups]
+                )
+        except Exception as e:
+            logger.error(f"Erro ao buscar taxas vigentes: {str(e)}")
+            return [None] * len(lookups)
+
+        results = [None] * len(lookups)
+        for idx, rate, recorded_at in rows:
+            if rate is not None:
+                results[idx] = {
+                    'rate': float(rate),
+                    'recorded_at': recorded_at.isoformat()
+                }
+        return results
+
+    async def close(self):
+        """Fecha o pool de conexões"""
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            self._probe_task = None
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+            logger.info("Conexões com o banco de dados fechadas")
@@ -38,6 +38,7 @@ echo ""
 # 4. Deploy da aplicação
 print_step "4. Deploying Currency Converter application..."
 kubectl apply -f k8s-deployment-v2.yaml
+kubectl apply -f k8s-maintenance-cronjob.yaml
 
 # Aguarda os pods estarem prontos
 print_step "5. Waiting for application pods to be ready..."
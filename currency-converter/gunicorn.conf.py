@@ -0,0 +1,18 @@
+# Configuração do gunicorn para as métricas do Prometheus em modo multiprocesso
+import os
+import shutil
+
+
+def on_starting(server):
+    """Limpa os arquivos de métricas de uma execução anterior antes de criar os workers"""
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """Descarta os gauges do worker que saiu (contadores e histogramas continuam somados)"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
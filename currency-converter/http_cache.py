@@ -0,0 +1,133 @@
+from collections import namedtuple
+from datetime import timezone
+import gzip
+import hashlib
+import os
+
+import brotli
+from flask import Response, request
+
+# Corpos menores que isso saem sem compressão (o ganho não paga o custo)
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', 1024))
+# Content-Encodings suportados, na ordem de preferência em caso de empate no Accept-Encoding
+ENCODINGS = ('br', 'gzip')
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/msgpack',
+    'application/x-ndjson',
+    'text/csv',
+    'text/plain',
+    'text/html'
+}
+
+# Corpo já serializado de uma resposta, com os validadores HTTP calculados uma vez;
+# `encoded` guarda as versões comprimidas ({encoding: bytes}), feitas sob demanda
+PreparedPayload = namedtuple(
+    'PreparedPayload', ['body', 'etag', 'last_modified', 'created_at', 'mimetype', 'encoded']
+)
+
+
+def negotiate_encoding(accept_encodings):
+    """Content-Encoding preferido pelo cliente (br ou gzip), ou None para o corpo sem compressão"""
+    return accept_encodings.best_match(ENCODINGS)
+
+
+def compress(body, encoding, best=False):
+    """
+    Comprime `body` com br ou gzip
+
+    Args:
+        best: Nível máximo, para corpos comprimidos uma vez e servidos muitas
+            vezes; o padrão é um nível rápido, para respostas montadas a cada
+            requisição
+    """
+    if encoding == 'br':
+        return brotli.compress(body, quality=11 if best else 4)
+    return gzip.compress(body, compresslevel=9 if best else 6, mtime=0)
+
+
+def should_compress(mimetype, size):
+    """True se um corpo deste tipo e tamanho deve ser comprimido (e variar por Accept-Encoding)"""
+    return size >= COMPRESSION_MIN_BYTES and mimetype in COMPRESSIBLE_MIMETYPES
+
+
+def prepare_payload(body, last_modified, created_at, mimetype='application/json'):
+    """
+    Prepara um corpo serializado para ser servido várias vezes
+
+    Args:
+        body: Bytes já serializados
+        last_modified: datetime (local, sem fuso) dos dados, ou None
+        created_at: time.monotonic() de quando o corpo foi montado
+        mimetype: Content-Type do corpo (JSON ou MessagePack)
+    """
+    etag = hashlib.sha1(body).hexdigest()
+    if last_modified is not None:
+        # HTTP-date tem resolução de segundos e é sempre UTC
+        last_modified = last_modified.astimezone(timezone.utc).replace(microsecond=0)
+    return PreparedPayload(body, etag, last_modified, created_at, mimetype, {})
+
+
+def encoded_payload(payload, accept_encodings):
+    """
+    Escolhe a versão de um PreparedPayload para o Accept-Encoding do cliente
+
+    A versão comprimida é feita na primeira requisição que a pede e guardada
+    no próprio payload, então cada corpo é comprimido no máximo uma vez por
+    encoding. Cada versão tem sua ETag.
+
+    Returns:
+        Tupla (corpo, encoding ou None, etag, varia por Accept-Encoding)
+    """
+    if not should_compress(payload.mimetype, len(payload.body)):
+        return payload.body, None, payload.etag, False
+    encoding = negotiate_encoding(accept_encodings)
+    if encoding is None:
+        return payload.body, None, payload.etag, True
+    body = payload.encoded.get(encoding)
+    if body is None:
+        body = payload.encoded[encoding] = compress(payload.body, encoding, best=True)
+    return body, encoding, f'{payload.etag}-{encoding}', True
+
+
+def payload_response(payload, max_age):
+    """
+    Serve um PreparedPayload respeitando If-None-Match / If-Modified-Since
+
+    Responde 304 sem corpo quando o cliente já tem a versão atual. O corpo
+    depende do Accept (JSON ou MessagePack) e do Accept-Encoding, então a
+    resposta varia por eles.
+    """
+    body, encoding, etag, vary_encoding = encoded_payload(payload, request.accept_encodings)
+    response = Response(body, mimetype=payload.mimetype)
+    response.vary.add('Accept')
+    if vary_encoding:
+        response.vary.add('Accept-Encoding')
+    if encoding is not None:
+        response.content_encoding = encoding
+    response.set_etag(etag)
+    if payload.last_modified is not None:
+        response.last_modified = payload.last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = max(int(max_age), 0)
+    return response.make_conditional(request)
+
+
+def compress_response(response, accept_encodings):
+    """
+    Comprime uma resposta montada na requisição (after_request)
+
+    Só respostas com corpo em memória: streams (NDJSON/CSV, exportação, SSE)
+    e respostas que já têm Content-Encoding passam direto.
+    """
+    if response.is_streamed or response.content_encoding or response.status_code < 200:
+        return response
+    body = response.get_data()
+    if not should_compress(response.mimetype, len(body)):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(accept_encodings)
+    if encoding is not None:
+        response.set_data(compress(body, encoding))
+        response.content_encoding = encoding
+    return response
@@ -0,0 +1,141 @@
+"""
+Comandos de manutenção do banco de dados
+
+Uso:
+    python manage.py backfill-rollup [--since YYYY-MM-DD]
+    python manage.py backfill-candles [--since YYYY-MM-DD]
+    python manage.py ensure-partitions [--months-ahead N]
+    python manage.py apply-retention [--raw-retention-months N]
+    python manage.py maintain
+    python manage.py migrate-partitions
+    python manage.py export-rates [--format parquet|arrow] [--currencies USD,EUR]
+        [--start YYYY-MM-DD] [--end YYYY-MM-DD] [--output ARQUIVO]
+    python manage.py import-rates ARQUIVO
+"""
+import argparse
+import logging
+import os
+import sys
+
+from database import DatabaseManager
+import rate_export
+
+logging.basicConfig(level=logging.INFO)
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql')
+RAW_RETENTION_MONTHS = int(os.environ.get('RAW_RETENTION_MONTHS', 3))
+PARTITION_MONTHS_AHEAD = int(os.environ.get('PARTITION_MONTHS_AHEAD', 2))
+
+
+def backfill_rollup(db, args):
+    """Recalcula daily_rate_rollup a partir de exchange_rates"""
+    days = db.backfill_daily_rollup(since=args.since)
+    print(f"{days} dias recalculados")
+
+
+def backfill_candles(db, args):
+    """Recalcula rate_candles (OHLC 15m/1h/1d) a partir de exchange_rates"""
+    candles = db.backfill_candles(since=args.since)
+    print(f"{candles} candles recalculados")
+
+
+def ensure_partitions(db, args):
+    """Cria as partições mensais do mês atual e dos próximos meses"""
+    for name in db.ensure_partitions(months_ahead=args.months_ahead):
+        print(name)
+
+
+def apply_retention(db, args):
+    """Reduz partições antigas a candles horários e as remove"""
+    dropped = db.apply_retention(raw_retention_months=args.raw_retention_months)
+    print(f"{len(dropped)} partições removidas: {', '.join(dropped) or '-'}")
+
+
+def maintain(db, args):
+    """Rotina periódica: garante partições futuras e aplica a retenção"""
+    ensure_partitions(db, args)
+    apply_retention(db, args)
+
+
+def migrate_partitions(db, args):
+    """Converte uma tabela exchange_rates antiga para particionamento mensal"""
+    rows = db.migrate_to_partitions(SCHEMA_PATH)
+    if rows is None:
+        print("exchange_rates já é particionada")
+    else:
+        print(f"{rows} linhas migradas")
+
+
+def export_rates(db, args):
+    """Exporta exchange_rates em Parquet ou Arrow IPC, em blocos de memória limitada"""
+    currencies = [c.strip().upper() for c in args.currencies.split(',')] if args.currencies else None
+    output = args.output or f"exchange_rates{rate_export.EXTENSIONS[args.format]}"
+    chunks = db.iter_export_rates(currencies, args.start, args.end, chunk_size=args.chunk_size)
+    size = 0
+    with open(output, 'wb') as f:
+        for data in rate_export.iter_export(chunks, args.format):
+            f.write(data)
+            size += len(data)
+    print(f"{output}: {size} bytes")
+
+
+def import_rates(db, args):
+    """Carrega em exchange_rates um arquivo gerado por export-rates"""
+    rows = rate_export.import_file(db, args.file, batch_size=args.chunk_size)
+    print(f"{rows} linhas lidas de {args.file}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Manutenção do Currency Converter')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    for name, handler in [
+        ('backfill-rollup', backfill_rollup),
+        ('backfill-candles', backfill_candles),
+    ]:
+        backfill = subparsers.add_parser(name, help=handler.__doc__)
+        backfill.add_argument('--since', help='Recalcula apenas a partir desta data (YYYY-MM-DD)')
+        backfill.set_defaults(handler=handler)
+
+    for name, handler in [
+        ('ensure-partitions', ensure_partitions),
+        ('apply-retention', apply_retention),
+        ('maintain', maintain),
+    ]:
+        command = subparsers.add_parser(name, help=handler.__doc__)
+        command.add_argument('--months-ahead', type=int, default=PARTITION_MONTHS_AHEAD)
+        command.add_argument('--raw-retention-months', type=int, default=RAW_RETENTION_MONTHS)
+        command.set_defaults(handler=handler)
+
+    migrate = subparsers.add_parser('migrate-partitions', help=migrate_partitions.__doc__)
+    migrate.set_defaults(handler=migrate_partitions)
+
+    export = subparsers.add_parser('export-rates', help=export_rates.__doc__)
+    export.add_argument('--format', choices=['parquet', 'arrow'], default='parquet')
+    export.add_argument('--currencies', help='Moedas separadas por vírgula (padrão: todas)')
+    export.add_argument('--start', help='Data/hora inicial (YYYY-MM-DD)')
+    export.add_argument('--end', help='Data/hora final (YYYY-MM-DD)')
+    export.add_argument('--output', help='Arquivo de saída (padrão: exchange_rates.<formato>)')
+    export.add_argument('--chunk-size', type=int, default=50000, help='Linhas por bloco/row group')
+    export.set_defaults(handler=export_rates)
+
+    load = subparsers.add_parser('import-rates', help=import_rates.__doc__)
+    load.add_argument('file', help='Arquivo Parquet ou Arrow gerado por export-rates')
+    load.add_argument('--chunk-size', type=int, default=50000, help='Linhas por lote gravado')
+    load.set_defaults(handler=import_rates)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    db = DatabaseManager()
+    try:
+        args.handler(db, args)
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,153 @@
+import asyncio
+import functools
+import inspect
+import os
+import time
+
+# Com vários processos (workers do gunicorn), cada um grava seus valores em
+# arquivos neste diretório e /metrics soma todos. Precisa existir antes de
+# importar o prometheus_client.
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+if MULTIPROC_DIR:
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess
+)
+
+DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REQUEST_LATENCY = Histogram(
+    'currency_http_request_duration_seconds',
+    'Latência das requisições HTTP (até o início da resposta)',
+    ['method', 'route', 'status']
+)
+CACHE_LOOKUPS = Counter(
+    'currency_rates_cache_lookups_total',
+    'Leituras do snapshot de taxas em cache (hit, miss = vazio, stale = vencido)',
+    ['result']
+)
+UPSTREAM_FETCH_LATENCY = Histogram(
+    'currency_upstream_fetch_duration_seconds',
+    'Duração de cada requisição a um provedor de taxas',
+    ['provider', 'outcome']
+)
+UPSTREAM_FETCH_FAILURES = Counter(
+    'currency_upstream_fetch_failures_total',
+    'Requisições a provedores de taxas que falharam',
+    ['provider', 'reason']
+)
+SAVE_RATES_ROWS = Counter(
+    'currency_save_rates_rows_total',
+    'Linhas gravadas em exchange_rates'
+)
+SAVE_RATES_LATENCY = Histogram(
+    'currency_save_rates_duration_seconds',
+    'Duração das gravações de taxas (save_rates / save_rates_bulk)',
+    ['outcome'],
+    buckets=DB_BUCKETS
+)
+CIRCUIT_BREAKER_TRANSITIONS = Counter(
+    'currency_circuit_breaker_transitions_total',
+    'Trocas de estado dos circuit breakers (closed, open, half_open)',
+    ['breaker', 'state']
+)
+DB_QUERY_LATENCY = Histogram(
+    'currency_db_query_duration_seconds',
+    'Duração de cada método de acesso ao banco',
+    ['method'],
+    buckets=DB_BUCKETS
+)
+# Gauges somados entre os processos vivos (livesum)
+WRITE_QUEUE_DEPTH = Gauge(
+    'currency_write_queue_depth',
+    'Snapshots de taxas na fila de escrita, aguardando gravação no banco',
+    multiprocess_mode='livesum'
+)
+SPOOL_SNAPSHOTS = Gauge(
+    'currency_write_spool_snapshots',
+    'Snapshots no spool local, aguardando o banco voltar',
+    multiprocess_mode='livesum'
+)
+SPOOL_BYTES = Gauge(
+    'currency_write_spool_bytes',
+    'Tamanho em bytes do spool local',
+    multiprocess_mode='livesum'
+)
+
+
+def timed_db_method(func):
+    """
+    Registra em DB_QUERY_LATENCY a duração de um método de acesso ao banco
+
+    Funciona com funções, corrotinas e geradores (síncronos ou assíncronos);
+    nos geradores, mede do início até o fim da iteração.
+    """
+    observe = DB_QUERY_LATENCY.labels(func.__name__).observe
+
+    if inspect.isasyncgenfunction(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                async for item in func(*args, **kwargs):
+                    yield item
+            finally:
+                observe(time.perf_counter() - started)
+    elif inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                yield from func(*args, **kwargs)
+            finally:
+                observe(time.perf_counter() - started)
+    elif asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                observe(time.perf_counter() - started)
+    else:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(time.perf_counter() - started)
+    return wrapper
+
+
+def observe_request(method, route, status, seconds):
+    """Registra uma requisição HTTP; `route` é o padrão da rota (ex.: /history/<currency_code>)"""
+    REQUEST_LATENCY.labels(method, route or 'unmatched', str(status)).observe(seconds)
+
+
+def render():
+    """Retorna (corpo, content type) do /metrics, somando todos os processos se houver vários"""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def observe_upstream_fetch(provider, seconds, error=None):
+    """Registra uma requisição a um provedor de taxas; com `error`, conta como falha pelo nome da exceção"""
+    if error is None:
+        UPSTREAM_FETCH_LATENCY.labels(provider, 'success').observe(seconds)
+        return
+    UPSTREAM_FETCH_LATENCY.labels(provider, 'failure').observe(seconds)
+    UPSTREAM_FETCH_FAILURES.labels(provider, type(error).__name__).inc()
+
+
+def observe_save(started, rows, ok):
+    """Registra uma gravação de taxas iniciada em `started` (time.perf_counter())"""
+    SAVE_RATES_LATENCY.labels('success' if ok else 'failure').observe(time.perf_counter() - started)
+    if ok:
+        SAVE_RATES_ROWS.inc(rows)
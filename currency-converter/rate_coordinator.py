@@ -0,0 +1,339 @@
+import asyncio
+import select
+import threading
+import uuid
+import logging
+
+import asyncpg
+import psycopg2
+
+from rate_refresher import snapshot_from_latest
+
+logger = logging.getLogger(__name__)
+
+# Nome do advisory lock (hashtext) e do canal de LISTEN/NOTIFY
+LOCK_NAME = 'currency-converter:rate-refresh'
+CHANNEL = 'rates_updated'
+
+
+class RateCoordinator:
+    """
+    Coordena a busca de taxas entre todos os workers de todas as réplicas
+
+    A decisão de buscar e a gravação passam pelo advisory lock; os demais
+    processos recebem um NOTIFY e recarregam as taxas de `latest_rates`. Quem
+    pega o lock logo depois de outro processo ter gravado (dentro de
+    `fresh_seconds`) só recarrega do banco, sem ir à API.
+    """
+
+    def __init__(self, db, fetch_upstream, fresh_seconds, lock_timeout_seconds=30, retry_seconds=5,
+                 write_behind=None):
+        """
+        Args:
+            db: DatabaseManager (pool e configuração de conexão)
+            fetch_upstream: Função que retorna ({currency_code: rate_to_brl}, provedor), sem gravar
+            fresh_seconds: Idade máxima da última gravação para reaproveitá-la em vez de buscar
+            lock_timeout_seconds: Espera máxima pelo lock enquanto outro processo decide ou grava
+            retry_seconds: Intervalo até reconectar o LISTEN após uma falha
+            write_behind: WriteBehindQueue que guarda as taxas quando o banco não aceita a gravação
+        """
+        self.db = db
+        self.fetch_upstream = fetch_upstream
+        self.write_behind = write_behind
+        self.fresh_seconds = fresh_seconds
+        self.lock_timeout_seconds = lock_timeout_seconds
+        self.retry_seconds = retry_seconds
+        # Identifica os NOTIFYs deste processo (PIDs se repetem entre pods)
+        self.token = uuid.uuid4().hex
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def load_latest(self):
+        """Retorna (taxas, instante da gravação) de latest_rates, ou ({}, None)"""
+        return snapshot_from_latest(self.db.get_latest_rates())
+
+    def _defer_save(self, rates, source):
+        """Entrega à fila de escrita as taxas que não foram gravadas agora"""
+        if rates and self.write_behind is not None:
+            self.write_behind.submit(rates, source=source)
+
+    def _is_fresh(self, cur):
+        """
+        Pega o advisory lock e diz se outro processo gravou há menos de `fresh_seconds`
+
+        O lock é da transação de `cur`: sai no commit ou rollback de quem chamou.
+        """
+        cur.execute(
+            "SELECT set_config('lock_timeout', %s, true)",
+            (f'{int(self.lock_timeout_seconds * 1000)}ms',)
+        )
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (LOCK_NAME,))
+        cur.execute("""
+            SELECT EXTRACT(EPOCH FROM (NOW()::timestamp - update_timestamp))
+            FROM rate_updates
+            WHERE success
+            ORDER BY id DESC
+            LIMIT 1
+        """)
+        row = cur.fetchone()
+        age = float(row[0]) if row else None
+        if age is not None and age < self.fresh_seconds:
+            logger.info(f"Taxas gravadas há {age:.0f}s por outro processo; recarregando do banco")
+            return True
+        return False
+
+    def fetch_rates(self):
+        """
+        Função de busca para o RateRefresher no modo coordenado
+
+        O lock só é seguro enquanto se decide e enquanto se grava, nunca durante
+        a busca na API (até o timeout total dos provedores):
+        1. com o lock, confere se outro processo gravou há pouco; se sim, só
+           recarrega do banco;
+        2. sem lock e sem conexão, busca na API;
+        3. com o lock de novo, reconfere: se outro processo gravou no meio
+           tempo, as taxas dele valem e as buscadas são descartadas; senão
+           grava e faz o NOTIFY, que sai no commit, depois que as taxas já
+           estão visíveis para os outros processos.
+
+        Com o banco fora do ar (circuit breaker aberto), busca na API sem
+        coordenar e entrega as taxas à fila de escrita, que as guarda no spool local.
+        """
+        if not self.db.is_available():
+            logger.warning("Banco indisponível: buscando taxas na API sem coordenação")
+            rates, source = self.fetch_upstream()
+            self._defer_save(rates, source)
+            return rates
+
+        with self.db.pool.connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    fresh = self._is_fresh(cur)
+            finally:
+                conn.rollback()
+        if fresh:
+            latest, _ = self.load_latest()
+            return latest
+
+        rates, source = self.fetch_upstream()
+        if not rates:
+            return rates
+
+        # Uma conexão só: o lock, a gravação e o NOTIFY ficam na mesma transação
+        with self.db.pool.connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    if self._is_fresh(cur):
+                        conn.rollback()
+                    elif self.db.save_rates(rates, source=source, conn=conn):
+                        cur.execute("SELECT pg_notify(%s, %s)", (CHANNEL, self.token))
+                        conn.commit()
+                    else:
+                        conn.rollback()
+                        self._defer_save(rates, source)
+                        return rates
+            except Exception:
+                conn.rollback()
+                raise
+
+        # Mesmos valores (DECIMAL(12, 6)) que os outros processos vão ler
+        latest, _ = self.load_latest()
+        return latest or rates
+
+    def _listen(self, on_rates):
+        connected_before = False
+        while not self._stopped.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**self.db.get_db_config())
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANNEL}")
+                logger.info(f"Escutando atualizações de taxas no canal {CHANNEL}")
+
+                # NOTIFYs enviados enquanto a conexão estava caída se perderam
+                if connected_before:
+                    self._reload(on_rates)
+                connected_before = True
+
+                while not self._stopped.is_set():
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    notified = False
+                    while conn.notifies:
+                        if conn.notifies.pop(0).payload != self.token:
+                            notified = True
+                    if notified:
+                        self._reload(on_rates)
+            except Exception as e:
+                logger.error(f"Erro no LISTEN de taxas: {str(e)}")
+                self._stopped.wait(self.retry_seconds)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+    def _reload(self, on_rates):
+        rates, last_update = self.load_latest()
+        if rates:
+            on_rates(rates, last_update)
+
+    def start_listener(self, on_rates):
+        """
+        Inicia a thread que escuta os NOTIFYs dos outros processos
+
+        Args:
+            on_rates: Função chamada com (taxas, instante da gravação) a cada NOTIFY
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._listen, args=(on_rates,), name='rate-listener', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Para a thread de LISTEN (em até alguns segundos)"""
+        self._stopped.set()
+
+
+class AsyncRateCoordinator:
+    """Versão asyncio do RateCoordinator, sobre o AsyncDatabaseManager (asyncpg)"""
+
+    def __init__(self, db, fetch_upstream, fresh_seconds, lock_timeout_seconds=30, retry_seconds=5,
+                 write_behind=None):
+        """
+        Args:
+            db: AsyncDatabaseManager
+            fetch_upstream: Corrotina que retorna ({currency_code: rate_to_brl}, provedor), sem gravar
+            fresh_seconds: Idade máxima da última gravação para reaproveitá-la em vez de buscar
+            lock_timeout_seconds: Espera máxima pelo lock enquanto outro processo decide ou grava
+            retry_seconds: Intervalo até reconectar o LISTEN após uma falha
+            write_behind: AsyncWriteBehindQueue que guarda as taxas quando o banco não aceita a gravação
+        """
+        self.db = db
+        self.fetch_upstream = fetch_upstream
+        self.write_behind = write_behind
+        self.fresh_seconds = fresh_seconds
+        self.lock_timeout_seconds = lock_timeout_seconds
+        self.retry_seconds = retry_seconds
+        self.token = uuid.uuid4().hex
+        self._task = None
+
+    async def load_latest(self):
+        """Retorna (taxas, instante da gravação) de latest_rates, ou ({}, None)"""
+        return snapshot_from_latest(await self.db.get_latest_rates())
+
+    def _defer_save(self, rates, source):
+        """Entrega à fila de escrita as taxas que não foram gravadas agora"""
+        if rates and self.write_behind is not None:
+            self.write_behind.submit(rates, source=source)
+
+    async def _is_fresh(self, conn):
+        """Como RateCoordinator._is_fresh, na transação aberta em `conn`"""
+        await conn.execute(
+            "SELECT set_config('lock_timeout', $1, true)",
+            f'{int(self.lock_timeout_seconds * 1000)}ms'
+        )
+        await conn.execute("SELECT pg_advisory_xact_lock(hashtext($1))", LOCK_NAME)
+        age = await conn.fetchval("""
+            SELECT EXTRACT(EPOCH FROM (NOW()::timestamp - update_timestamp))::float8
+            FROM rate_updates
+            WHERE success
+            ORDER BY id DESC
+            LIMIT 1
+        """)
+        if age is not None and age < self.fresh_seconds:
+            logger.info(f"Taxas gravadas há {age:.0f}s por outro processo; recarregando do banco")
+            return True
+        return False
+
+    async def fetch_rates(self):
+        """Função de busca para o AsyncRateRefresher no modo coordenado (ver RateCoordinator.fetch_rates)"""
+        if not self.db.is_available():
+            logger.warning("Banco indisponível: buscando taxas na API sem coordenação")
+            rates, source = await self.fetch_upstream()
+            self._defer_save(rates, source)
+            return rates
+
+        async with self.db.acquire() as conn:
+            async with conn.transaction():
+                fresh = await self._is_fresh(conn)
+        if fresh:
+            latest, _ = await self.load_latest()
+            return latest
+
+        rates, source = await self.fetch_upstream()
+        if not rates:
+            return rates
+
+        async with self.db.acquire() as conn:
+            async with conn.transaction():
+                if not await self._is_fresh(conn):
+                    if not await self.db.save_rates(rates, source=source, conn=conn):
+                        self._defer_save(rates, source)
+                        return rates
+                    await conn.execute("SELECT pg_notify($1, $2)", CHANNEL, self.token)
+
+        latest, _ = await self.load_latest()
+        return latest or rates
+
+    async def _listen(self, on_rates):
+        connected_before = False
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(**self.db.get_db_config())
+                notified = asyncio.Event()
+
+                def on_notify(connection, pid, channel, payload):
+                    if payload != self.token:
+                        notified.set()
+
+                await conn.add_listener(CHANNEL, on_notify)
+                logger.info(f"Escutando atualizações de taxas no canal {CHANNEL}")
+
+                if connected_before:
+                    await self._reload(on_rates)
+                connected_before = True
+
+                while not conn.is_closed():
+                    try:
+                        await asyncio.wait_for(notified.wait(), 5)
+                    except asyncio.TimeoutError:
+                        continue
+                    notified.clear()
+                    await self._reload(on_rates)
+                raise ConnectionError('conexão do LISTEN fechada')
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Erro no LISTEN de taxas: {str(e)}")
+                await asyncio.sleep(self.retry_seconds)
+            finally:
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+
+    async def _reload(self, on_rates):
+        rates, last_update = await self.load_latest()
+        if rates:
+            on_rates(rates, last_update)
+
+    def start_listener(self, on_rates):
+        """Inicia a task que escuta os NOTIFYs dos outros processos (no loop atual)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._listen(on_rates))
+
+    async def stop(self):
+        """Cancela a task de LISTEN"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,183 @@
+from collections import defaultdict
+import asyncio
+import logging
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+# Formatos de exportação -> content type
+FORMATS = {
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.stream'
+}
+EXTENSIONS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+# Mesmas colunas de exchange_rates (sem created_at); a taxa vai como float64,
+# como nas respostas da API
+SCHEMA = pa.schema([
+    pa.field('id', pa.int64()),
+    pa.field('currency_code', pa.string(), nullable=False),
+    pa.field('rate_to_brl', pa.float64(), nullable=False),
+    pa.field('recorded_at', pa.timestamp('us'), nullable=False),
+    pa.field('source', pa.string())
+])
+
+
+class _ChunkSink:
+    """Arquivo só de escrita que acumula os bytes até o próximo `drain`"""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class RateExportEncoder:
+    """
+    Codifica blocos de linhas de exchange_rates em Parquet ou Arrow IPC (stream)
+
+    Cada bloco vira um row group (Parquet) ou record batch (Arrow) e os bytes
+    saem logo depois de codificados, então a memória fica limitada a um bloco,
+    qualquer que seja o tamanho da exportação.
+    """
+
+    def __init__(self, fmt, compression='zstd'):
+        if fmt not in FORMATS:
+            raise ValueError(f"Formato deve ser um de: {', '.join(FORMATS)}")
+        self.fmt = fmt
+        self.rows = 0
+        self._sink = _ChunkSink()
+        if fmt == 'parquet':
+            self._writer = pq.ParquetWriter(self._sink, SCHEMA, compression=compression)
+        else:
+            self._writer = ipc.new_stream(
+                self._sink, SCHEMA, options=ipc.IpcWriteOptions(compression=compression)
+            )
+
+    def encode(self, rows):
+        """
+        Codifica um bloco de tuplas (id, currency_code, rate_to_brl, recorded_at, source)
+
+        Returns:
+            Bytes prontos para enviar (podem ser vazios)
+        """
+        if not rows:
+            return b''
+        ids, codes, rates, recorded, sources = zip(*rows)
+        batch = pa.record_batch([
+            pa.array(ids, pa.int64()),
+            pa.array(codes, pa.string()),
+            pa.array(rates, pa.float64()),
+            pa.array(recorded, pa.timestamp('us')),
+            pa.array(sources, pa.string())
+        ], schema=SCHEMA)
+        if self.fmt == 'parquet':
+            self._writer.write_batch(batch, row_group_size=len(rows))
+        else:
+            self._writer.write_batch(batch)
+        self.rows += len(rows)
+        return self._sink.drain()
+
+    def close(self):
+        """Fecha o arquivo (footer do Parquet / fim do stream) e retorna os últimos bytes"""
+        self._writer.close()
+        return self._sink.drain()
+
+
+def iter_export(chunks, fmt):
+    """Gera os bytes da exportação a partir de blocos de linhas (ex.: DatabaseManager.iter_export_rates)"""
+    encoder = RateExportEncoder(fmt)
+    for rows in chunks:
+        data = encoder.encode(rows)
+        if data:
+            yield data
+    yield encoder.close()
+    logger.info(f"Exportadas {encoder.rows} linhas em {fmt}")
+
+
+async def aiter_export(chunks, fmt):
+    """Versão assíncrona de iter_export; a codificação roda em uma thread, fora do loop"""
+    encoder = RateExportEncoder(fmt)
+    async for rows in chunks:
+        data = await asyncio.to_thread(encoder.encode, rows)
+        if data:
+            yield data
+    yield await asyncio.to_thread(encoder.close)
+    logger.info(f"Exportadas {encoder.rows} linhas em {fmt}")
+
+
+def read_batches(path, batch_size=50000):
+    """
+    Lê um arquivo exportado (Parquet, Arrow IPC stream ou file) em record batches
+
+    O formato é detectado pelos bytes iniciais; Parquet é lido em lotes de
+    `batch_size` linhas, Arrow nos record batches gravados na exportação.
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(6)
+    columns = ['currency_code', 'rate_to_brl', 'recorded_at', 'source']
+    if magic[:4] == b'PAR1':
+        yield from pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=columns)
+    elif magic == b'ARROW1':
+        with pa.memory_map(path) as source:
+            reader = ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i).select(columns)
+    else:
+        with pa.OSFile(path) as source:
+            for batch in ipc.open_stream(source):
+                yield batch.select(columns)
+
+
+def import_file(db, path, batch_size=50000):
+    """
+    Carrega em exchange_rates um arquivo gerado pela exportação
+
+    As linhas são agrupadas em snapshots (recorded_at, source) e gravadas com
+    save_rates_bulk, que também atualiza o rollup diário e os candles.
+    Amostras que já existem são ignoradas, então importar o mesmo arquivo de
+    novo não duplica linhas.
+
+    Returns:
+        Número de linhas lidas do arquivo
+    """
+    rows = 0
+    for batch in read_batches(path, batch_size):
+        columns = batch.to_pydict()
+        snapshots = defaultdict(dict)
+        for code, rate, recorded_at, source in zip(
+            columns['currency_code'], columns['rate_to_brl'], columns['recorded_at'], columns['source']
+        ):
+            snapshots[(recorded_at, source)][code] = rate
+        if not db.save_rates_bulk(
+            [(rates, recorded_at, source) for (recorded_at, source), rates in snapshots.items()],
+            skip_existing=True,
+            log_updates=False
+        ):
+            raise RuntimeError(f'falha ao gravar o lote após {rows} linhas')
+        rows += batch.num_rows
+        logger.info(f"Importadas {rows} linhas de {path}")
+    return rows
@@ -0,0 +1,408 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+import asyncio
+import os
+import random
+import threading
+import time
+import logging
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Provedores conhecidos: todos respondem {"rates": {moeda: unidades por 1 BRL}}
+PROVIDER_URLS = {
+    'exchangerate-api': 'https://api.exchangerate-api.com/v4/latest/BRL',
+    'open-er-api': 'https://open.er-api.com/v6/latest/BRL',
+    'frankfurter': 'https://api.frankfurter.app/latest?from=BRL'
+}
+DEFAULT_PROVIDERS = 'exchangerate-api,open-er-api,frankfurter'
+
+# Status HTTP que valem nova tentativa no mesmo provedor
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class UpstreamUnavailableError(Exception):
+    """Nenhum provedor de taxas respondeu"""
+
+
+class RetryableError(Exception):
+    """Falha transitória de um provedor (timeout, conexão, 5xx, 429)"""
+
+
+def parse_rates(data, currencies):
+    """
+    Converte {"rates": {moeda: unidades por 1 BRL}} em {moeda: taxa para BRL}
+
+    Levanta ValueError se a resposta não tiver nenhuma das moedas pedidas.
+    """
+    quoted = data.get('rates') if isinstance(data, dict) else None
+    if not isinstance(quoted, dict):
+        raise ValueError('resposta sem o campo rates')
+    rates = {}
+    for currency in currencies:
+        value = quoted.get(currency)
+        if isinstance(value, (int, float)) and value > 0:
+            # Taxa inversa (de moeda estrangeira para BRL)
+            rates[currency] = 1 / value
+    if not rates:
+        raise ValueError('resposta sem nenhuma das moedas suportadas')
+    return rates
+
+
+class HttpRateProvider:
+    """Provedor HTTP com resposta no formato {"rates": {...}} e base BRL"""
+
+    def __init__(self, name, url):
+        self.name = name
+        self.url = url
+
+    @staticmethod
+    def _check_status(status_code):
+        if status_code in RETRY_STATUS:
+            raise RetryableError(f'HTTP {status_code}')
+        if status_code >= 400:
+            raise ValueError(f'HTTP {status_code}')
+
+    def fetch(self, session, timeout, currencies):
+        try:
+            response = session.get(self.url, timeout=timeout)
+        except (requests.Timeout, requests.ConnectionError) as e:
+            raise RetryableError(str(e)) from e
+        self._check_status(response.status_code)
+        return parse_rates(response.json(), currencies)
+
+    async def fetch_async(self, client, timeout, currencies):
+        try:
+            response = await client.get(self.url, timeout=timeout)
+        except (httpx.TimeoutException, httpx.TransportError) as e:
+            raise RetryableError(str(e) or type(e).__name__) from e
+        self._check_status(response.status_code)
+        return parse_rates(response.json(), currencies)
+
+
+class FakeRateProvider:
+    """
+    Provedor local, sem rede, para testes e desenvolvimento
+
+    Devolve um passeio aleatório em torno de taxas plausíveis, com atraso e
+    taxa de falhas configuráveis (FAKE_PROVIDER_DELAY_SECONDS e
+    FAKE_PROVIDER_FAILURE_RATE quando criado por build_providers).
+    """
+
+    BASE_RATES = {'USD': 5.0, 'EUR': 5.4, 'CAD': 3.7, 'CHF': 5.6, 'GBP': 6.3, 'JPY': 0.034, 'CNY': 0.69}
+
+    def __init__(self, name='fake', delay=0.0, failure_rate=0.0):
+        self.name = name
+        self.delay = delay
+        self.failure_rate = failure_rate
+        self._rates = dict(self.BASE_RATES)
+
+    def _next_rates(self, currencies):
+        if random.random() < self.failure_rate:
+            raise RetryableError('falha simulada')
+        self._rates = {
+            code: rate * random.uniform(0.998, 1.002) for code, rate in self._rates.items()
+        }
+        return {code: self._rates[code] for code in currencies if code in self._rates}
+
+    def fetch(self, session, timeout, currencies):
+        time.sleep(min(self.delay, timeout))
+        if self.delay > timeout:
+            raise RetryableError('timeout simulado')
+        return self._next_rates(currencies)
+
+    async def fetch_async(self, client, timeout, currencies):
+        await asyncio.sleep(min(self.delay, timeout))
+        if self.delay > timeout:
+            raise RetryableError('timeout simulado')
+        return self._next_rates(currencies)
+
+
+def build_providers(names, exchange_api_url=None):
+    """
+    Cria os provedores pela ordem de preferência
+
+    Args:
+        names: Nomes de PROVIDER_URLS ou 'fake'
+        exchange_api_url: URL no lugar da padrão do provedor exchangerate-api
+    """
+    providers = []
+    for name in names:
+        if name == 'fake':
+            providers.append(FakeRateProvider(
+                delay=float(os.environ.get('FAKE_PROVIDER_DELAY_SECONDS', 0)),
+                failure_rate=float(os.environ.get('FAKE_PROVIDER_FAILURE_RATE', 0))
+            ))
+        elif name in PROVIDER_URLS:
+            url = exchange_api_url if name == 'exchangerate-api' and exchange_api_url else PROVIDER_URLS[name]
+            providers.append(HttpRateProvider(name, url))
+        else:
+            raise ValueError(f'Provedor de taxas desconhecido: {name}')
+    if not providers:
+        raise ValueError('Nenhum provedor de taxas configurado')
+    return providers
+
+
+class ProviderStats:
+    """Contadores e latências de um provedor, para o /health"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.attempts = 0
+        self.successes = 0
+        self.failures = 0
+        self.retries = 0
+        self.hedged = 0
+        self.wins = 0
+        self.latency_ms_total = 0.0
+        self.latency_ms_last = None
+        self.last_error = None
+        self.last_success = None
+
+    def record(self, latency_ms, error=None):
+        with self._lock:
+            self.attempts += 1
+            self.latency_ms_total += latency_ms
+            self.latency_ms_last = latency_ms
+            if error is None:
+                self.successes += 1
+                self.last_success = datetime.now()
+            else:
+                self.failures += 1
+                self.last_error = str(error) or type(error).__name__
+
+    def increment(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'attempts': self.attempts,
+                'successes': self.successes,
+                'failures': self.failures,
+                'retries': self.retries,
+                'hedged_requests': self.hedged,
+                'wins': self.wins,
+                'latency_ms_avg': round(self.latency_ms_total / self.attempts, 1) if self.attempts else None,
+                'latency_ms_last': round(self.latency_ms_last, 1) if self.latency_ms_last is not None else None,
+                'last_error': self.last_error,
+                'last_success': self.last_success.isoformat() if self.last_success else None
+            }
+
+
+class _BaseRateFetcher:
+    def __init__(self, providers, currencies, timeout=5, retries=2, retry_backoff=0.25,
+                 hedge_after=2, total_timeout=20):
+        """
+        Args:
+            providers: Provedores pela ordem de preferência (build_providers)
+            currencies: Moedas a extrair de cada resposta
+            timeout: Timeout de cada requisição
+            retries: Novas tentativas no mesmo provedor após falha transitória
+            retry_backoff: Base do backoff exponencial (com jitter) entre tentativas
+            hedge_after: Segundos sem resposta até disparar também o próximo provedor
+            total_timeout: Tempo máximo de uma busca, somando todos os provedores
+        """
+        self.providers = list(providers)
+        self.currencies = list(currencies)
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.hedge_after = hedge_after
+        self.total_timeout = total_timeout
+        self._stats = {provider.name: ProviderStats() for provider in self.providers}
+
+    def _retry_delay(self, attempt):
+        # Full jitter: espera aleatória entre 0 e o backoff exponencial
+        return random.uniform(0, self.retry_backoff * (2 ** attempt))
+
+    def _record(self, provider, started, error=None):
+        elapsed = time.perf_counter() - started
+        self._stats[provider.name].record(elapsed * 1000, error)
+        metrics.observe_upstream_fetch(provider.name, elapsed, error)
+
+    def stats(self):
+        """Estatísticas por provedor, pela ordem de preferência"""
+        return {provider.name: self._stats[provider.name].to_dict() for provider in self.providers}
+
+    def _give_up(self, errors):
+        detail = '; '.join(f'{name}: {error}' for name, error in errors) or 'tempo esgotado'
+        return UpstreamUnavailableError(f'Nenhum provedor de taxas respondeu ({detail})')
+
+
+class RateFetcher(_BaseRateFetcher):
+    """
+    Busca as taxas em vários provedores, com sessão HTTP persistente
+
+    Cada provedor tem até `retries` novas tentativas em falhas transitórias.
+    Se o provedor atual não responde em `hedge_after` segundos (ou falha de
+    vez), o próximo é disparado em paralelo; vale a primeira resposta.
+    """
+
+    def __init__(self, providers, currencies, **kwargs):
+        super().__init__(providers, currencies, **kwargs)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.providers), pool_maxsize=4)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._executor = ThreadPoolExecutor(
+            max_workers=len(self.providers), thread_name_prefix='rate-provider'
+        )
+
+    def _fetch_provider(self, provider):
+        for attempt in range(self.retries + 1):
+            started = time.perf_counter()
+            try:
+                rates = provider.fetch(self.session, self.timeout, self.currencies)
+            except RetryableError as e:
+                self._record(provider, started, e)
+                if attempt == self.retries:
+                    raise
+                self._stats[provider.name].increment('retries')
+                time.sleep(self._retry_delay(attempt))
+                continue
+            except Exception as e:
+                self._record(provider, started, e)
+                raise
+            self._record(provider, started)
+            return rates
+
+    def fetch(self):
+        """
+        Returns:
+            Tupla (taxas, nome do provedor que respondeu)
+        """
+        deadline = time.monotonic() + self.total_timeout
+        waiting = list(self.providers)
+        running = {}
+        errors = []
+
+        def launch(hedge=False):
+            provider = waiting.pop(0)
+            if hedge:
+                self._stats[provider.name].increment('hedged')
+                logger.info(f"Provedor lento; disparando também {provider.name}")
+            running[self._executor.submit(self._fetch_provider, provider)] = provider
+
+        launch()
+        while running:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, _ = wait(
+                running,
+                timeout=min(self.hedge_after, remaining) if waiting else remaining,
+                return_when=FIRST_COMPLETED
+            )
+            if not done:
+                if waiting:
+                    launch(hedge=True)
+                continue
+            for future in done:
+                provider = running.pop(future)
+                try:
+                    rates = future.result()
+                except Exception as e:
+                    logger.warning(f"Provedor {provider.name} falhou: {str(e)}")
+                    errors.append((provider.name, e))
+                    continue
+                self._stats[provider.name].increment('wins')
+                return rates, provider.name
+            # Tudo o que terminou falhou: passa logo para o próximo provedor
+            if waiting:
+                launch()
+        raise self._give_up(errors)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+class AsyncRateFetcher(_BaseRateFetcher):
+    """Versão asyncio do RateFetcher, sobre um httpx.AsyncClient próprio"""
+
+    def __init__(self, providers, currencies, **kwargs):
+        super().__init__(providers, currencies, **kwargs)
+        self.client = None
+
+    async def _fetch_provider(self, provider):
+        for attempt in range(self.retries + 1):
+            started = time.perf_counter()
+            try:
+                rates = await provider.fetch_async(self.client, self.timeout, self.currencies)
+            except RetryableError as e:
+                self._record(provider, started, e)
+                if attempt == self.retries:
+                    raise
+                self._stats[provider.name].increment('retries')
+                await asyncio.sleep(self._retry_delay(attempt))
+                continue
+            except Exception as e:
+                self._record(provider, started, e)
+                raise
+            self._record(provider, started)
+            return rates
+
+    async def fetch(self):
+        """
+        Returns:
+            Tupla (taxas, nome do provedor que respondeu)
+        """
+        if self.client is None:
+            self.client = httpx.AsyncClient(limits=httpx.Limits(max_keepalive_connections=len(self.providers)))
+        deadline = time.monotonic() + self.total_timeout
+        waiting = list(self.providers)
+        running = {}
+        errors = []
+
+        def launch(hedge=False):
+            provider = waiting.pop(0)
+            if hedge:
+                self._stats[provider.name].increment('hedged')
+                logger.info(f"Provedor lento; disparando também {provider.name}")
+            running[asyncio.ensure_future(self._fetch_provider(provider))] = provider
+
+        launch()
+        try:
+            while running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, _ = await asyncio.wait(
+                    running,
+                    timeout=min(self.hedge_after, remaining) if waiting else remaining,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    if waiting:
+                        launch(hedge=True)
+                    continue
+                for task in done:
+                    provider = running.pop(task)
+                    try:
+                        rates = task.result()
+                    except Exception as e:
+                        logger.warning(f"Provedor {provider.name} falhou: {str(e)}")
+                        errors.append((provider.name, e))
+                        continue
+                    self._stats[provider.name].increment('wins')
+                    return rates, provider.name
+                if waiting:
+                    launch()
+        finally:
+            # Quem perdeu a corrida não precisa terminar
+            for task in running:
+                task.cancel()
+        raise self._give_up(errors)
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
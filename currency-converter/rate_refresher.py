@@ -0,0 +1,335 @@
+from collections import namedtuple
+from datetime import datetime
+import asyncio
+import json
+import os
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Snapshot imutável das taxas: trocado por inteiro a cada atualização
+RatesSnapshot = namedtuple('RatesSnapshot', ['rates', 'last_update'])
+
+EMPTY_SNAPSHOT = RatesSnapshot({}, None)
+
+
+def snapshot_from_latest(latest):
+    """Converte o retorno de get_latest_rates em RatesSnapshot (instante da gravação mais recente)"""
+    if not latest:
+        return EMPTY_SNAPSHOT
+    rates = {code: value['rate'] for code, value in latest.items()}
+    last_update = max(datetime.fromisoformat(value['recorded_at']) for value in latest.values())
+    return RatesSnapshot(rates, last_update)
+
+
+def _first_refresh_delay(snapshot, interval_seconds):
+    """Segundos até o snapshot aquecido vencer o intervalo de atualização (0 se vazio ou vencido)"""
+    if not snapshot.rates or snapshot.last_update is None:
+        return 0
+    age = (datetime.now() - snapshot.last_update).total_seconds()
+    return max(interval_seconds - age, 0)
+
+
+class SnapshotFile:
+    """
+    Último snapshot de taxas em um arquivo local
+
+    Registrado como listener do atualizador, regrava o arquivo a cada troca
+    de snapshot; na inicialização, `load` aquece o cache mesmo com o banco
+    fora do ar. A gravação é atômica (arquivo temporário + rename), então
+    vários workers podem compartilhar o mesmo arquivo.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """Snapshot gravado, ou EMPTY_SNAPSHOT se o arquivo não existe ou é inválido"""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            return RatesSnapshot(
+                {code: float(rate) for code, rate in data['rates'].items()},
+                datetime.fromisoformat(data['last_update'])
+            )
+        except FileNotFoundError:
+            return EMPTY_SNAPSHOT
+        except Exception as e:
+            logger.error(f"Snapshot local inválido em {self.path}: {str(e)}")
+            return EMPTY_SNAPSHOT
+
+    def save(self, previous, snapshot):
+        """Listener do atualizador: grava o novo snapshot"""
+        if not snapshot.rates or snapshot.last_update is None:
+            return
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump({'rates': snapshot.rates, 'last_update': snapshot.last_update.isoformat()}, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"Erro ao gravar snapshot local em {self.path}: {str(e)}")
+
+
+class RateRefresher:
+    """
+    Atualiza as taxas de câmbio em uma thread de fundo
+
+    O caminho das requisições só lê `snapshot`, nunca faz I/O. Atualizações
+    concorrentes (agendada, forçada ou disparada por cache vencido) são
+    colapsadas em uma única busca em andamento (single-flight).
+    """
+
+    def __init__(self, fetch_rates, interval_seconds, retry_seconds=60):
+        """
+        Args:
+            fetch_rates: Função que retorna {currency_code: rate_to_brl} ou lança exceção
+            interval_seconds: Intervalo entre atualizações bem-sucedidas
+            retry_seconds: Intervalo até nova tentativa após uma falha
+        """
+        self.fetch_rates = fetch_rates
+        self.interval_seconds = interval_seconds
+        self.retry_seconds = retry_seconds
+
+        self._snapshot = EMPTY_SNAPSHOT
+        self._lock = threading.Lock()
+        self._inflight = None
+        self._last_ok = False
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._listeners = []
+
+    @property
+    def snapshot(self):
+        """Snapshot atual (leitura atômica de uma referência)"""
+        return self._snapshot
+
+    def add_listener(self, callback):
+        """Registra callback(snapshot_antigo, snapshot_novo) chamado a cada troca"""
+        self._listeners.append(callback)
+
+    def refresh(self):
+        """
+        Busca novas taxas e troca o snapshot
+
+        Se já existe uma busca em andamento, aguarda o resultado dela em vez
+        de iniciar outra. Retorna True se o snapshot foi atualizado.
+        """
+        with self._lock:
+            inflight = self._inflight
+            leader = inflight is None
+            if leader:
+                inflight = self._inflight = threading.Event()
+
+        if not leader:
+            inflight.wait()
+            return self._last_ok
+
+        ok = False
+        try:
+            rates = self.fetch_rates()
+            if rates:
+                self._publish(RatesSnapshot(rates, datetime.now()))
+                ok = True
+        except Exception as e:
+            logger.error(f"Erro ao atualizar taxas: {str(e)}")
+        finally:
+            with self._lock:
+                self._last_ok = ok
+                self._inflight = None
+            inflight.set()
+        return ok
+
+    def _publish(self, snapshot):
+        previous = self._snapshot
+        self._snapshot = snapshot
+        for callback in self._listeners:
+            try:
+                callback(previous, snapshot)
+            except Exception as e:
+                logger.error(f"Erro no listener de taxas: {str(e)}")
+
+    def set_rates(self, rates, last_update=None):
+        """Publica taxas obtidas fora do atualizador (ex.: gravadas por outro processo)"""
+        self._publish(RatesSnapshot(rates, last_update or datetime.now()))
+
+    def warm(self, snapshot):
+        """
+        Publica um snapshot persistido (latest_rates ou arquivo local) na inicialização
+
+        Só publica se for mais novo que o atual, então não sobrescreve uma
+        busca que terminou antes. Retorna True se publicou.
+        """
+        current = self._snapshot
+        if not snapshot.rates or snapshot.last_update is None:
+            return False
+        if current.last_update is not None and snapshot.last_update <= current.last_update:
+            return False
+        self._publish(snapshot)
+        return True
+
+    def trigger(self):
+        """Pede uma atualização sem bloquear quem chamou"""
+        if self._thread is not None and self._thread.is_alive():
+            self._wakeup.set()
+        else:
+            threading.Thread(target=self.refresh, daemon=True).start()
+
+    def _run(self, delay):
+        if delay and self._wakeup.wait(delay):
+            self._wakeup.clear()
+        while not self._stopped.is_set():
+            ok = self.refresh()
+            self._wakeup.wait(self.interval_seconds if ok else self.retry_seconds)
+            self._wakeup.clear()
+
+    def start(self):
+        """
+        Inicia a thread de atualização periódica (idempotente)
+
+        Com um snapshot aquecido ainda dentro do intervalo, a primeira busca
+        espera o restante do intervalo em vez de acontecer na hora.
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._run,
+                args=(_first_refresh_delay(self._snapshot, self.interval_seconds),),
+                name='rate-refresher',
+                daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        """Para a thread de atualização"""
+        self._stopped.set()
+        self._wakeup.set()
+
+
+class AsyncRateRefresher:
+    """
+    Versão asyncio do RateRefresher, para a aplicação ASGI
+
+    Mesma semântica: o caminho das requisições só lê `snapshot` e
+    atualizações concorrentes aguardam a mesma task em andamento.
+    """
+
+    def __init__(self, fetch_rates, interval_seconds, retry_seconds=60):
+        """
+        Args:
+            fetch_rates: Corrotina que retorna {currency_code: rate_to_brl} ou lança exceção
+            interval_seconds: Intervalo entre atualizações bem-sucedidas
+            retry_seconds: Intervalo até nova tentativa após uma falha
+        """
+        self.fetch_rates = fetch_rates
+        self.interval_seconds = interval_seconds
+        self.retry_seconds = retry_seconds
+
+        self._snapshot = EMPTY_SNAPSHOT
+        self._inflight = None
+        self._wakeup = None
+        self._task = None
+        self._listeners = []
+
+    @property
+    def snapshot(self):
+        """Snapshot atual (leitura atômica de uma referência)"""
+        return self._snapshot
+
+    def add_listener(self, callback):
+        """Registra callback(snapshot_antigo, snapshot_novo) chamado a cada troca"""
+        self._listeners.append(callback)
+
+    async def _fetch_and_publish(self):
+        try:
+            rates = await self.fetch_rates()
+            if not rates:
+                return False
+            self._publish(RatesSnapshot(rates, datetime.now()))
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao atualizar taxas: {str(e)}")
+            return False
+        finally:
+            self._inflight = None
+
+    def set_rates(self, rates, last_update=None):
+        """Publica taxas obtidas fora do atualizador (ex.: gravadas por outro processo)"""
+        self._publish(RatesSnapshot(rates, last_update or datetime.now()))
+
+    def warm(self, snapshot):
+        """Publica um snapshot persistido se for mais novo que o atual (como RateRefresher.warm)"""
+        current = self._snapshot
+        if not snapshot.rates or snapshot.last_update is None:
+            return False
+        if current.last_update is not None and snapshot.last_update <= current.last_update:
+            return False
+        self._publish(snapshot)
+        return True
+
+    def _publish(self, snapshot):
+        previous = self._snapshot
+        self._snapshot = snapshot
+        for callback in self._listeners:
+            try:
+                callback(previous, snapshot)
+            except Exception as e:
+                logger.error(f"Erro no listener de taxas: {str(e)}")
+
+    async def refresh(self):
+        """Busca novas taxas, ou aguarda a busca já em andamento. Retorna True se atualizou."""
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._fetch_and_publish())
+        return await asyncio.shield(self._inflight)
+
+    def trigger(self):
+        """Pede uma atualização sem bloquear quem chamou"""
+        if self._wakeup is not None and self._task is not None and not self._task.done():
+            self._wakeup.set()
+        elif self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._fetch_and_publish())
+
+    async def _run(self, delay):
+        if delay:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+        while True:
+            ok = await self.refresh()
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(), self.interval_seconds if ok else self.retry_seconds
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self):
+        """
+        Inicia a task de atualização periódica no loop atual (idempotente)
+
+        Como RateRefresher.start: um snapshot aquecido adia a primeira busca.
+        """
+        if self._task is not None and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.ensure_future(
+            self._run(_first_refresh_delay(self._snapshot, self.interval_seconds))
+        )
+
+    async def stop(self):
+        """Cancela a task de atualização"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,119 @@
+from collections import OrderedDict
+import asyncio
+import hashlib
+import json
+
+# Quantos snapshots anteriores guardar para retomar com Last-Event-ID
+RESUME_HISTORY = 32
+
+
+def _event(event_id, event_type, data):
+    payload = json.dumps(data, separators=(',', ':'))
+    return f'id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n'.encode('utf-8')
+
+
+class RateStreamHub:
+    """
+    Distribui as trocas de snapshot de taxas para assinantes de Server-Sent Events
+
+    Cada evento é serializado uma vez por troca de snapshot, não por assinante.
+    Um assinante ocioso custa só uma corrotina esperando um asyncio.Event, então
+    um processo asyncio segura milhares deles.
+
+    O id do evento é um hash das taxas: réplicas com as mesmas taxas (modo
+    coordenado) geram os mesmos ids, então um cliente pode retomar em qualquer
+    uma. Um Last-Event-ID desconhecido recebe o snapshot completo.
+    """
+
+    def __init__(self, heartbeat_seconds=15, retry_ms=5000):
+        self.heartbeat_seconds = heartbeat_seconds
+        self.retry_ms = retry_ms
+        self.subscribers = 0
+
+        self._snapshots = OrderedDict()  # {id do evento: taxas}
+        self._current_id = None
+        self._current_last_update = None
+        self._full_event = None
+        self._diff_event = None  # (id anterior, bytes do diff para o atual)
+        self._changed = asyncio.Event()
+
+    @staticmethod
+    def event_id(rates):
+        canonical = json.dumps(sorted(rates.items()), separators=(',', ':'))
+        return hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def _diff(old_rates, new_rates):
+        return {
+            'changed': {
+                code: rate for code, rate in new_rates.items() if old_rates.get(code) != rate
+            },
+            'removed': [code for code in old_rates if code not in new_rates]
+        }
+
+    def publish(self, previous, snapshot):
+        """Listener do atualizador: registra o novo snapshot e acorda os assinantes"""
+        if not snapshot.rates or snapshot.last_update is None:
+            return
+        rates = dict(snapshot.rates)
+        new_id = self.event_id(rates)
+        if new_id == self._current_id:
+            return
+
+        last_update = snapshot.last_update.isoformat()
+        previous_id = self._current_id
+
+        self._full_event = _event(new_id, 'snapshot', {'last_update': last_update, 'rates': rates})
+        self._diff_event = None
+        if previous_id is not None:
+            diff = self._diff(self._snapshots[previous_id], rates)
+            diff['last_update'] = last_update
+            self._diff_event = (previous_id, _event(new_id, 'diff', diff))
+
+        self._snapshots[new_id] = rates
+        while len(self._snapshots) > RESUME_HISTORY:
+            self._snapshots.popitem(last=False)
+        self._current_id = new_id
+        self._current_last_update = last_update
+
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def _catch_up(self, last_id):
+        """Evento que leva um cliente em `last_id` ao snapshot atual, ou None se já está nele"""
+        if self._current_id is None or last_id == self._current_id:
+            return None
+        if self._diff_event is not None and last_id == self._diff_event[0]:
+            return self._diff_event[1]
+        old_rates = self._snapshots.get(last_id)
+        if old_rates is None:
+            return self._full_event
+        diff = self._diff(old_rates, self._snapshots[self._current_id])
+        diff['last_update'] = self._current_last_update
+        return _event(self._current_id, 'diff', diff)
+
+    async def subscribe(self, last_event_id=None):
+        """
+        Gera os bytes do stream de um assinante
+
+        Começa pelo que falta desde `last_event_id` (ou pelo snapshot completo)
+        e depois envia um diff a cada troca, com comentários de heartbeat nos
+        intervalos.
+        """
+        self.subscribers += 1
+        try:
+            yield f'retry: {self.retry_ms}\n\n'.encode('utf-8')
+            last_id = last_event_id
+            while True:
+                changed = self._changed
+                event = self._catch_up(last_id)
+                if event is not None:
+                    last_id = self._current_id
+                    yield event
+                    continue
+                try:
+                    await asyncio.wait_for(changed.wait(), self.heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    yield b': heartbeat\n\n'
+        finally:
+            self.subscribers -= 1
@@ -0,0 +1,233 @@
+from datetime import date, datetime
+from decimal import Decimal
+import json
+import secrets
+
+from flask.json.provider import JSONProvider
+import msgpack
+import orjson
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+
+# Tipos aceitos no header Accept -> formato da resposta
+NEGOTIABLE = {
+    JSON_MIMETYPE: 'json',
+    MSGPACK_MIMETYPE: 'msgpack',
+    'application/x-msgpack': 'msgpack'
+}
+MIMETYPES = {'json': JSON_MIMETYPE, 'msgpack': MSGPACK_MIMETYPE}
+
+
+# Tipos escalares: no JSON deles, vírgula e colchete só aparecem dentro de texto
+_SCALAR_TYPES = frozenset({int, float, bool, type(None), str, datetime, date, Decimal})
+
+
+class Records:
+    """
+    Linhas do banco como vieram do cursor (tuplas), com os nomes dos campos
+
+    Vão para a resposta como uma lista de objetos {campo: valor}, sem montar
+    um dict por linha: os valores são serializados direto das tuplas e
+    encaixados em um template com as chaves ({"campo":%b,...}) repetido por
+    linha. Taxas já vêm como float (cast no SQL) e datas/horas como datetime,
+    formatadas em ISO 8601 pelo encoder.
+    """
+
+    __slots__ = ('fields', 'rows')
+
+    def __init__(self, fields, rows=()):
+        self.fields = tuple(fields)
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _tuples(self):
+        rows = self.rows
+        if len(rows) and type(rows[0]) is not tuple:
+            # asyncpg Record: os encoders só conhecem tuplas
+            rows = list(map(tuple, rows))
+        return rows
+
+    def _json_values(self, rows, dumps):
+        """JSON de cada valor, linha após linha"""
+        # Colunas do SQL têm um tipo só (ou NULL): a primeira linha basta
+        if _SCALAR_TYPES.issuperset(map(type, rows[0])):
+            # Serializa todas as linhas como arrays de uma vez e corta nas vírgulas
+            values = dumps(rows)[2:-2].replace(b'],[', b',').split(b',')
+            # Vírgula dentro de um texto gera pedaços a mais: aí serializa valor a valor
+            if len(values) == len(rows) * len(self.fields):
+                return values
+        return [dumps(value) for row in rows for value in row]
+
+    def _json_objects(self, dumps, separator):
+        rows = self._tuples()
+        if not len(rows):
+            return b''
+        template = b'{' + b','.join(
+            dumps(field).replace(b'%', b'%%') + b':%b' for field in self.fields
+        ) + b'}'
+        return separator.join([template] * len(rows)) % tuple(self._json_values(rows, dumps))
+
+    def json_bytes(self, dumps):
+        """
+        A lista de objetos em JSON
+
+        Args:
+            dumps: Serializa um valor (ou uma lista de tuplas, como arrays) em bytes
+        """
+        return b'[' + self._json_objects(dumps, b',') + b']'
+
+    def json_lines(self, dumps):
+        """Um objeto JSON por linha (NDJSON), como em json_bytes"""
+        return self._json_objects(dumps, b'\n') + b'\n' if len(self.rows) else b''
+
+    def msgpack_bytes(self, packer):
+        """
+        A lista de objetos em MessagePack, com o mesmo template por linha de json_bytes
+
+        Args:
+            packer: msgpack.Packer com autoreset (cada pack retorna os bytes)
+        """
+        rows = self._tuples()
+        header = packer.pack_array_header(len(rows))
+        if not len(rows):
+            return header
+        width = len(self.fields)
+        template = packer.pack_map_header(width) + b''.join(
+            packer.pack(field).replace(b'%', b'%%') + b'%b' for field in self.fields
+        )
+        values = [None] * (len(rows) * width)
+        for i, column in enumerate(zip(*rows)):
+            if type(column[0]) is str:
+                # Textos se repetem (moeda, fonte): empacota cada um uma vez só
+                packed = {value: packer.pack(value) for value in set(column)}
+                values[i::width] = map(packed.__getitem__, column)
+            else:
+                values[i::width] = map(packer.pack, column)
+        return header + (template * len(rows)) % tuple(values)
+
+
+def _default(obj):
+    """Tipos que os encoders não conhecem: datas e Decimal"""
+    if isinstance(obj, date):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f'Tipo não serializável: {type(obj).__name__}')
+
+
+def _splice_records(obj, dumps, encode_records):
+    """
+    Serializa `obj` com um encoder que não aceita bytes prontos no meio do documento
+
+    Cada Records vira um texto marcador único; depois, o marcador já
+    serializado é trocado pelos bytes de `encode_records(records)`.
+
+    Args:
+        dumps: Função (obj, default) -> bytes
+        encode_records: Função Records -> bytes no mesmo formato
+    """
+    found = []
+    token = secrets.token_hex(8)
+
+    def default(value):
+        if isinstance(value, Records):
+            found.append(value)
+            return f'\x00records-{token}-{len(found) - 1}\x00'
+        return _default(value)
+
+    body = dumps(obj, default)
+    for i, records in enumerate(found):
+        marker = dumps(f'\x00records-{token}-{i}\x00', default)
+        body = body.replace(marker, encode_records(records), 1)
+    return body
+
+
+def _orjson_value(obj):
+    return orjson.dumps(obj, default=_default)
+
+
+def _orjson_default(obj):
+    if isinstance(obj, Records):
+        return orjson.Fragment(obj.json_bytes(_orjson_value))
+    return _default(obj)
+
+
+def _orjson_dumps(obj):
+    # orjson já serializa datetime/date em ISO 8601 (igual a isoformat());
+    # Records entra como Fragment, JSON já pronto
+    return orjson.dumps(obj, default=_orjson_default)
+
+
+def _stdlib_value(obj, default=_default):
+    return json.dumps(obj, default=default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def _stdlib_dumps(obj):
+    return _splice_records(obj, _stdlib_value, lambda records: records.json_bytes(_stdlib_value))
+
+
+# Backends JSON disponíveis: nome -> (dumps de um documento, dumps de um valor, loads), em bytes
+JSON_BACKENDS = {
+    'orjson': (_orjson_dumps, _orjson_value, orjson.loads),
+    'json': (_stdlib_dumps, _stdlib_value, json.loads)
+}
+
+
+def _msgpack_value(obj, default=_default):
+    return msgpack.packb(obj, default=default)
+
+
+def msgpack_dumps(obj):
+    """Serializa em MessagePack, com as mesmas conversões do JSON (datas em ISO 8601)"""
+    packer = msgpack.Packer(default=_default)
+    return _splice_records(obj, _msgpack_value, lambda records: records.msgpack_bytes(packer))
+
+
+class ResponseEncoder(JSONProvider):
+    """
+    Provider de JSON da aplicação (app.json) com negociação de conteúdo
+
+    `jsonify` passa por `response`, que responde em MessagePack quando o
+    cliente pede application/msgpack no Accept e em JSON (backend
+    `json_backend`) nos demais casos. Funciona no Flask e no Quart, que usam
+    o mesmo mecanismo de provider; `request` é o proxy do framework.
+    """
+
+    def __init__(self, app, request, json_backend='orjson'):
+        super().__init__(app)
+        if json_backend not in JSON_BACKENDS:
+            raise ValueError(f"Backend JSON deve ser um de: {', '.join(JSON_BACKENDS)}")
+        self.json_backend = json_backend
+        self._request = request
+        self._dumps, self._dumps_value, self._loads = JSON_BACKENDS[json_backend]
+
+    def dumps(self, obj, **kwargs):
+        return self._dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return self._loads(s)
+
+    def negotiate(self):
+        """Formato pedido pelo Accept da requisição atual ('json' ou 'msgpack')"""
+        best = self._request.accept_mimetypes.best_match(NEGOTIABLE, default=JSON_MIMETYPE)
+        return NEGOTIABLE[best]
+
+    def encode(self, obj, fmt='json'):
+        """Serializa `obj` no formato `fmt`, em bytes"""
+        if fmt == 'msgpack':
+            return msgpack_dumps(obj)
+        return self._dumps(obj)
+
+    def ndjson(self, records):
+        """Uma linha JSON por registro (streaming de /history)"""
+        return records.json_lines(self._dumps_value)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        fmt = self.negotiate()
+        response = self._app.response_class(self.encode(obj, fmt), mimetype=MIMETYPES[fmt])
+        response.vary.add('Accept')
+        return response
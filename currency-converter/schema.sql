@@ -1,19 +1,54 @@
 -- Schema para histórico de taxas de câmbio
 
--- Tabela principal de taxas de câmbio
+-- Tabela principal de taxas de câmbio, particionada por mês em recorded_at
 CREATE TABLE IF NOT EXISTS exchange_rates (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     currency_code VARCHAR(3) NOT NULL,
     rate_to_brl DECIMAL(12, 6) NOT NULL,
     recorded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     source VARCHAR(50) DEFAULT 'exchangerate-api',
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, recorded_at)
+) PARTITION BY RANGE (recorded_at);
+
+-- Índice para otimizar consultas (criado em cada partição)
+CREATE INDEX IF NOT EXISTS idx_exchange_rates_currency_date ON exchange_rates(currency_code, recorded_at DESC);
+
+-- Índice para a sincronização incremental do cache de séries (amostras gravadas desde um instante)
+CREATE INDEX IF NOT EXISTS idx_exchange_rates_created_at ON exchange_rates(created_at);
 
--- Índices para otimizar consultas
-CREATE INDEX idx_exchange_rates_currency ON exchange_rates(currency_code);
-CREATE INDEX idx_exchange_rates_recorded_at ON exchange_rates(recorded_at DESC);
-CREATE INDEX idx_exchange_rates_currency_date ON exchange_rates(currency_code, recorded_at DESC);
+-- Cria (se necessário) a partição mensal que contém month_start
+CREATE OR REPLACE FUNCTION create_exchange_rates_partition(month_start DATE)
+RETURNS TEXT AS $$
+DECLARE
+    start_date DATE := date_trunc('month', month_start)::date;
+    partition_name TEXT := 'exchange_rates_' || to_char(start_date, 'YYYY_MM');
+BEGIN
+    -- Serializa a criação entre processos que gravam ao mesmo tempo
+    PERFORM pg_advisory_xact_lock(hashtext('create_exchange_rates_partition'));
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF exchange_rates FOR VALUES FROM (%L) TO (%L)',
+        partition_name, start_date, (start_date + INTERVAL '1 month')::date
+    );
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT create_exchange_rates_partition(CURRENT_DATE);
+SELECT create_exchange_rates_partition((CURRENT_DATE + INTERVAL '1 month')::date);
+
+-- Amostras antigas reduzidas a candles horários antes de a partição ser removida
+CREATE TABLE IF NOT EXISTS exchange_rates_hourly (
+    currency_code VARCHAR(3) NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    open_rate DECIMAL(12, 6) NOT NULL,
+    high_rate DECIMAL(12, 6) NOT NULL,
+    low_rate DECIMAL(12, 6) NOT NULL,
+    close_rate DECIMAL(12, 6) NOT NULL,
+    sum_rate DECIMAL(20, 6) NOT NULL,
+    sample_count INTEGER NOT NULL,
+    PRIMARY KEY (currency_code, bucket)
+);
 
 -- Tabela para rastrear quando as taxas foram atualizadas
 CREATE TABLE IF NOT EXISTS rate_updates (
@@ -34,21 +69,53 @@ SELECT DISTINCT ON (currency_code)
 FROM exchange_rates
 ORDER BY currency_code, recorded_at DESC;
 
--- View para estatísticas diárias
-CREATE OR REPLACE VIEW daily_rate_stats AS
+-- Rollup diário mantido incrementalmente por save_rates
+-- (para dados existentes: python manage.py backfill-rollup)
+CREATE TABLE IF NOT EXISTS daily_rate_rollup (
+    currency_code VARCHAR(3) NOT NULL,
+    date DATE NOT NULL,
+    min_rate DECIMAL(12, 6) NOT NULL,
+    max_rate DECIMAL(12, 6) NOT NULL,
+    sum_rate DECIMAL(20, 6) NOT NULL,
+    sample_count INTEGER NOT NULL,
+    PRIMARY KEY (currency_code, date)
+);
+
+-- Candles OHLC pré-calculados em 15m, 1h e 1d, mantidos incrementalmente por save_rates
+-- (para dados existentes: python manage.py backfill-candles)
+CREATE TABLE IF NOT EXISTS rate_candles (
+    currency_code VARCHAR(3) NOT NULL,
+    resolution VARCHAR(3) NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    open_rate DECIMAL(12, 6) NOT NULL,
+    high_rate DECIMAL(12, 6) NOT NULL,
+    low_rate DECIMAL(12, 6) NOT NULL,
+    close_rate DECIMAL(12, 6) NOT NULL,
+    open_at TIMESTAMP NOT NULL,
+    close_at TIMESTAMP NOT NULL,
+    sum_rate DECIMAL(20, 6) NOT NULL,
+    sample_count INTEGER NOT NULL,
+    PRIMARY KEY (currency_code, resolution, bucket)
+);
+
+-- View para estatísticas diárias (lê o rollup, sem agregar exchange_rates)
+DROP VIEW IF EXISTS daily_rate_stats;
+CREATE VIEW daily_rate_stats AS
 SELECT 
     currency_code,
-    DATE(recorded_at) as date,
-    MIN(rate_to_brl) as min_rate,
-    MAX(rate_to_brl) as max_rate,
-    AVG(rate_to_brl) as avg_rate,
-    COUNT(*) as sample_count
-FROM exchange_rates
-GROUP BY currency_code, DATE(recorded_at)
+    date,
+    min_rate,
+    max_rate,
+    sum_rate / sample_count as avg_rate,
+    sample_count
+FROM daily_rate_rollup
 ORDER BY date DESC, currency_code;
 
 -- Comentários nas tabelas
 COMMENT ON TABLE exchange_rates IS 'Histórico completo de taxas de câmbio para BRL';
+COMMENT ON TABLE exchange_rates_hourly IS 'Taxas antigas reduzidas a agregados horários (retenção)';
 COMMENT ON TABLE rate_updates IS 'Log de atualizações das taxas de câmbio';
+COMMENT ON TABLE daily_rate_rollup IS 'Agregados diários por moeda (min/max/soma/contagem)';
+COMMENT ON TABLE rate_candles IS 'Candles OHLC por moeda em 15m, 1h e 1d';
 COMMENT ON VIEW latest_rates IS 'Taxas mais recentes para cada moeda';
 COMMENT ON VIEW daily_rate_stats IS 'Estatísticas agregadas por dia e moeda';
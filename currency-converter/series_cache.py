@@ -0,0 +1,255 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+import math
+import threading
+
+from database import DAILY_STATS_FIELDS, HISTORY_FIELDS
+from response_encoding import Records
+
+# Bytes por amostra: timestamp (d) + taxa (d) + id (q) + índice da fonte (H)
+BYTES_PER_SAMPLE = 8 + 8 + 8 + 2
+
+
+def to_epoch(dt):
+    """
+    Segundos desde 1970 de um recorded_at (sem fuso), lido como UTC
+
+    Mesma regra de EXTRACT(EPOCH FROM recorded_at) no PostgreSQL: não depende
+    do fuso do processo nem do horário de verão.
+    """
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+
+def from_epoch(ts):
+    """Inverso de to_epoch: datetime sem fuso"""
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None)
+
+
+class _Series:
+    """Amostras de uma moeda em arrays paralelos, ordenadas por timestamp"""
+
+    def __init__(self):
+        self.ts = array('d')
+        self.rates = array('d')
+        self.ids = array('q')
+        self.sources = array('H')
+
+    def __len__(self):
+        return len(self.ts)
+
+    def insert(self, ts, rate, row_id, source_idx):
+        """Insere a amostra na ordem; False se o id já está na série (mesmo timestamp)"""
+        if not self.ts or ts > self.ts[-1]:
+            self.ts.append(ts)
+            self.rates.append(rate)
+            self.ids.append(row_id)
+            self.sources.append(source_idx)
+            return True
+        # Já vista (janela de sobreposição da sincronização) ou fora de ordem
+        # (outro processo gravou um pouco antes): procura o id entre as de mesmo timestamp
+        pos = bisect_right(self.ts, ts)
+        if row_id in self.ids[bisect_left(self.ts, ts, 0, pos):pos]:
+            return False
+        self.ts.insert(pos, ts)
+        self.rates.insert(pos, rate)
+        self.ids.insert(pos, row_id)
+        self.sources.insert(pos, source_idx)
+        return True
+
+    def drop_oldest(self, count):
+        del self.ts[:count]
+        del self.rates[:count]
+        del self.ids[:count]
+        del self.sources[:count]
+
+
+class SeriesStore:
+    """
+    Cache em memória do histórico recente de cada moeda
+
+    Cada série cobre o intervalo [covered_from, última sincronização]; consultas
+    que começam antes de covered_from devem ir ao banco. Quando o total passa de
+    `max_bytes`, as amostras mais antigas de todas as séries são descartadas e
+    covered_from avança.
+
+    A sincronização relê as amostras gravadas (created_at) a partir de
+    `synced_until` menos uma janela de sobreposição: um id SERIAL menor pode
+    ser confirmado depois de um maior, e o replay da fila de escrita grava
+    recorded_at antigos. As já presentes são descartadas pelo id.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._series = {}
+        self._covered_from = {}
+        self._sources = []
+        self._source_index = {}
+        self._default_covered_from = None
+        self._synced_until = None
+        self._ready = False
+        self._lock = threading.RLock()
+
+    @property
+    def ready(self):
+        return self._ready
+
+    @property
+    def loaded_from(self):
+        """Início do período carregado (recorded_at), ou None antes da carga"""
+        if self._default_covered_from is None:
+            return None
+        return from_epoch(self._default_covered_from)
+
+    def sync_from(self, overlap):
+        """created_at a partir do qual a próxima sincronização deve ler"""
+        if self._synced_until is None:
+            return datetime.min
+        return self._synced_until - overlap
+
+    def _source_idx(self, source):
+        idx = self._source_index.get(source)
+        if idx is None:
+            idx = self._source_index[source] = len(self._sources)
+            self._sources.append(source)
+        return idx
+
+    def add(self, rows):
+        """
+        Adiciona amostras (id, currency_code, rate_to_brl, recorded_at, source, created_at)
+
+        Amostras já presentes (mesmo id) são ignoradas.
+
+        Returns:
+            Número de amostras novas
+        """
+        added = 0
+        with self._lock:
+            for row_id, code, rate, recorded_at, source, created_at in rows:
+                if created_at is not None and (self._synced_until is None or created_at > self._synced_until):
+                    self._synced_until = created_at
+                series = self._series.get(code)
+                if series is None:
+                    series = self._series[code] = _Series()
+                added += series.insert(to_epoch(recorded_at), float(rate), row_id, self._source_idx(source))
+            self._enforce_limit()
+        return added
+
+    def mark_loaded(self, covered_from):
+        """Marca a carga inicial como concluída a partir de `covered_from`"""
+        with self._lock:
+            ts = to_epoch(covered_from)
+            for code in self._series:
+                self._covered_from.setdefault(code, ts)
+            self._default_covered_from = ts
+            self._ready = True
+
+    def _enforce_limit(self):
+        total = sum(len(series) for series in self._series.values())
+        excess = total - self.max_bytes // BYTES_PER_SAMPLE
+        if excess <= 0:
+            return
+        # Descarta a mesma fração do início de cada série
+        for code, series in self._series.items():
+            count = min(len(series), -(-excess * len(series) // total))
+            if not count:
+                continue
+            series.drop_oldest(count)
+            if len(series):
+                self._covered_from[code] = series.ts[0]
+            else:
+                self._covered_from[code] = float('inf')
+
+    def covers(self, code, start):
+        """True se a série de `code` tem todas as amostras a partir de `start`"""
+        if not self._ready:
+            return False
+        with self._lock:
+            covered_from = self._covered_from.get(code, self._default_covered_from)
+        return covered_from is not None and to_epoch(start) >= covered_from
+
+    def _slice(self, code, start, end):
+        with self._lock:
+            series = self._series.get(code)
+            if series is None:
+                return array('d'), array('d'), array('q'), array('H')
+            lo = bisect_left(series.ts, to_epoch(start))
+            hi = bisect_right(series.ts, to_epoch(end))
+            return series.ts[lo:hi], series.rates[lo:hi], series.ids[lo:hi], series.sources[lo:hi]
+
+    def history(self, code, start, end):
+        """Amostras de [start, end] no formato de get_historical_rates (mais recente primeiro)"""
+        ts, rates, ids, sources = self._slice(code, start, end)
+        names = self._sources
+        return Records(HISTORY_FIELDS, [
+            (ids[i], code, rates[i], from_epoch(ts[i]), names[sources[i]])
+            for i in range(len(ts) - 1, -1, -1)
+        ])
+
+    def history_columnar(self, codes, start, end):
+        """
+        Amostras de várias moedas no formato de get_historical_rates_multi
+
+        Timestamps truncados para o segundo, como FLOOR(EXTRACT(EPOCH ...)) em
+        _multi_history_sql; duas amostras de uma moeda no mesmo segundo ficam
+        na mesma posição, com a taxa da mais recente, também como no banco.
+        """
+        slices = {code: self._slice(code, start, end)[:2] for code in codes}
+        timestamps = sorted({math.floor(t) for ts, _ in slices.values() for t in ts})
+        position = {t: i for i, t in enumerate(timestamps)}
+        columns = {}
+        for code, (ts, rates) in slices.items():
+            column = columns[code] = [None] * len(timestamps)
+            for t, rate in zip(ts, rates):
+                column[position[math.floor(t)]] = rate
+        return timestamps, columns
+
+    def daily_stats(self, code, start_date, end):
+        """Agregados diários a partir de start_date no formato de get_daily_stats"""
+        start = datetime.combine(start_date, datetime.min.time())
+        ts, rates, _, _ = self._slice(code, start, end)
+
+        stats = []
+        i = len(ts)
+        day = end.date()
+        # Percorre os dias de trás para frente, cortando o slice por bisect
+        while i > 0 and day >= start_date:
+            day_start = to_epoch(datetime.combine(day, datetime.min.time()))
+            lo = bisect_left(ts, day_start, 0, i)
+            if lo < i:
+                day_rates = rates[lo:i]
+                stats.append((
+                    day, min(day_rates), max(day_rates), sum(day_rates) / len(day_rates), len(day_rates)
+                ))
+            i = lo
+            day -= timedelta(days=1)
+        return Records(DAILY_STATS_FIELDS, stats)
+
+    def rate_at(self, code, day):
+        """Última amostra do dia `day` no formato de get_rate_at_date, ou None"""
+        day_start = datetime.combine(day, datetime.min.time())
+        day_end = day_start + timedelta(days=1) - timedelta(microseconds=1)
+        ts, rates, _, _ = self._slice(code, day_start, day_end)
+        if not ts:
+            return None
+        return {
+            'rate': rates[-1],
+            'recorded_at': from_epoch(ts[-1]).isoformat()
+        }
+
+    def stats(self):
+        """Uso de memória e cobertura de cada série"""
+        with self._lock:
+            samples = {code: len(series) for code, series in self._series.items()}
+            covered = {
+                code: from_epoch(ts).isoformat() if ts != float('inf') else None
+                for code, ts in self._covered_from.items()
+            }
+        total = sum(samples.values())
+        return {
+            'ready': self._ready,
+            'samples': samples,
+            'covered_from': covered,
+            'bytes': total * BYTES_PER_SAMPLE,
+            'max_bytes': self.max_bytes
+        }
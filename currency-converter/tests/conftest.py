@@ -0,0 +1,114 @@
+"""
+Fixtures da suíte de testes
+
+Os testes que usam o banco leem as variáveis DB_* (como a aplicação) e são
+pulados quando o PostgreSQL não responde. As aplicações sobem com o provedor
+fake (RATE_PROVIDERS=fake), sem rede, e spool e snapshot em um diretório
+temporário.
+"""
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from database import DatabaseManager  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def db():
+    """DatabaseManager conectado ao banco das variáveis DB_*"""
+    manager = DatabaseManager(min_size=1, max_size=4, connect=False)
+    if not manager.connect():
+        pytest.skip('PostgreSQL indisponível (variáveis DB_*)')
+    yield manager
+    manager.pool.close()
+
+
+@pytest.fixture
+def db_conn(db):
+    """Conexão com uma transação desfeita ao final: o teste não deixa dados no banco"""
+    with db.pool.connection() as conn:
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+
+
+@pytest.fixture
+def local_timezone():
+    """Fuso do processo diferente de UTC (e com horário de verão no passado)"""
+    previous = os.environ.get('TZ')
+    os.environ['TZ'] = 'America/Sao_Paulo'
+    time.tzset()
+    yield
+    if previous is None:
+        os.environ.pop('TZ', None)
+    else:
+        os.environ['TZ'] = previous
+    time.tzset()
+
+
+@pytest.fixture(scope='session')
+def app_env(tmp_path_factory):
+    """Ambiente das aplicações; precisa valer antes do import de app_v2/app_async"""
+    spool = tmp_path_factory.mktemp('spool')
+    os.environ.update(
+        RATE_PROVIDERS='fake',
+        FAKE_PROVIDER_DELAY_SECONDS='0',
+        WRITE_BEHIND_SPOOL_DIR=str(spool),
+        RATE_SNAPSHOT_FILE=str(spool / 'latest-snapshot.json')
+    )
+    os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+    return spool
+
+
+@pytest.fixture(scope='session')
+def flask_app(app_env):
+    """Módulo app_v2, com as primeiras taxas já no cache"""
+    import app_v2
+    deadline = time.monotonic() + 10
+    while not app_v2.refresher.snapshot.rates and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return app_v2
+
+
+@pytest.fixture(scope='session')
+def quart_app(app_env):
+    """Módulo app_async (before_serving só roda dentro de run_quart)"""
+    import app_async
+    return app_async
+
+
+@pytest.fixture(scope='session')
+def run_quart(quart_app):
+    """
+    Roda a corrotina `check(client)` com o app_async no ar e as primeiras taxas no cache
+
+    O app sobe uma vez por sessão, em um loop próprio: before_serving e
+    after_serving (spool, pool, atualizador) não foram feitos para reiniciar.
+    """
+    loop = asyncio.new_event_loop()
+    test_app = quart_app.app.test_app()
+    started = False
+
+    def run(check):
+        async def main():
+            nonlocal started
+            if not started:
+                await test_app.startup()
+                started = True
+                deadline = time.monotonic() + 10
+                while not quart_app.refresher.snapshot.rates and time.monotonic() < deadline:
+                    await asyncio.sleep(0.05)
+            return await check(test_app.test_client())
+        return loop.run_until_complete(main())
+
+    yield run
+    if started:
+        loop.run_until_complete(test_app.shutdown())
+    loop.close()
@@ -0,0 +1,97 @@
+"""app_v2 (Flask) e app_async (Quart) devem expor as mesmas rotas e respostas com o mesmo formato"""
+# Diferenças intencionais: o SSE só existe no app_async
+ASYNC_ONLY_ROUTES = {('/rates/stream', 'GET')}
+ASYNC_ONLY_FIELDS = {
+    '/health': {'stream_subscribers'},
+    '/': {'server'}
+}
+
+REQUESTS = [
+    ('GET', '/', None),
+    ('GET', '/health', None),
+    ('GET', '/ready', None),
+    ('GET', '/rates', None),
+    ('GET', '/rates/matrix', None),
+    ('GET', '/rates/latest', None),
+    ('GET', '/convert?from=USD&to=EUR&amount=100', None),
+    ('GET', '/convert?from=USD&amount=abc', None),
+    ('GET', '/convert?from=XXX&amount=1', None),
+    ('GET', '/convert/reverse?to=USD&amount=545', None),
+    ('POST', '/convert/batch', {'items': [{'from': 'USD', 'to': 'EUR', 'amount': 10}, {'from': 'XXX', 'amount': 1}]}),
+    ('POST', '/convert/batch', {'nada': []}),
+    ('GET', '/history?currencies=USD,EUR&start_date=2001-01-01&end_date=2001-01-02', None),
+    ('GET', '/history?currencies=USD,XXX', None),
+    ('GET', '/history/USD?start_date=2001-01-01&end_date=2001-01-02', None),
+    ('GET', '/history/USD?limit=2&start_date=2001-01-01&end_date=2001-01-02', None),
+    ('GET', '/history/USD?limit=0', None),
+    ('GET', '/history/USD?after=nope', None),
+    ('GET', '/history/USD?format=xml', None),
+    ('GET', '/history/USD?start_date=nope', None),
+    ('GET', '/export/rates?format=xlsx', None),
+    ('GET', '/stats/USD?days=7', None),
+    ('GET', '/stats/USD?days=0', None),
+    ('GET', '/stats/XXX', None),
+    ('GET', '/ohlc/USD?interval=1h&start=2001-01-01&end=2001-01-02', None),
+    ('GET', '/ohlc/USD?interval=2m', None),
+    ('GET', '/ohlc/USD?interval=1m&start=2001-01-01&end=2002-01-01', None),
+    ('GET', '/rate-at-date/USD', None),
+    ('GET', '/rate-at-date/USD?date=1990-01-01', None),
+    ('GET', '/rate-at-date/USD?date=1990-01-01&asof=true', None),
+    ('POST', '/rate-at-date', {'items': [{'currency': 'USD', 'date': '1990-01-01'}, {'currency': 'XXX', 'date': 'x'}]}),
+    ('POST', '/rate-at-date', {'nada': []}),
+]
+
+
+def shape(value):
+    """Estrutura do documento: chaves e tipos, sem os valores"""
+    if isinstance(value, dict):
+        return {key: shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [shape(value[0])] if value else []
+    return type(value).__name__
+
+
+def routes(app):
+    return {
+        (rule.rule, method)
+        for rule in app.url_map.iter_rules()
+        if rule.endpoint != 'static'
+        for method in rule.methods - {'HEAD', 'OPTIONS'}
+    }
+
+
+def normalize(path, status, document):
+    """Erros devem ser idênticos; respostas de sucesso, ter o mesmo formato"""
+    if status >= 400:
+        return status, document
+    for field in ASYNC_ONLY_FIELDS.get(path.split('?')[0], ()):
+        document.pop(field, None)
+    if path == '/':
+        document['endpoints'].pop('/rates/stream', None)
+    if path == '/health':
+        # Contadores do pool (psycopg2 x asyncpg) e dos provedores variam com o driver e o momento
+        return status, sorted(document)
+    return status, shape(document)
+
+
+def test_same_routes(flask_app, quart_app):
+    assert routes(quart_app.app) - ASYNC_ONLY_ROUTES == routes(flask_app.app)
+
+
+def test_same_response_shapes(flask_app, run_quart):
+    client = flask_app.app.test_client()
+    expected = []
+    for method, path, body in REQUESTS:
+        response = client.open(path, method=method, json=body)
+        expected.append(normalize(path, response.status_code, response.get_json()))
+
+    async def check(quart_client):
+        results = []
+        for method, path, body in REQUESTS:
+            response = await quart_client.open(path, method=method, json=body)
+            results.append(normalize(path, response.status_code, await response.get_json()))
+        return results
+
+    for (method, path, _), flask_result, quart_result in zip(REQUESTS, expected, run_quart(check)):
+        assert quart_result == flask_result, f'{method} {path}'
+
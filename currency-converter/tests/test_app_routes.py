@@ -0,0 +1,123 @@
+"""Comportamento das rotas do app_v2 e do app_async com o provedor fake"""
+import pytest
+
+from circuit_breaker import CircuitBreaker
+
+BATCH_ITEMS = [
+    {'from': 'USD', 'to': 'EUR', 'amount': 100},
+    {'from': 'GBP', 'amount': '2.5'},
+    {'from': 'XXX', 'amount': 1},
+    {'from': 'USD', 'amount': 'abc'}
+]
+
+
+@pytest.fixture
+def database_down(flask_app, monkeypatch):
+    """Circuit breaker do banco aberto, sem a sondagem em segundo plano"""
+    breaker = CircuitBreaker('postgres', failure_threshold=1)
+    breaker.record_failure(OSError('banco fora do ar'))
+    monkeypatch.setattr(flask_app.db.pool, 'breaker', breaker)
+    return breaker
+
+
+def test_rates_etag_returns_304(flask_app):
+    client = flask_app.app.test_client()
+    response = client.get('/rates')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    cached = client.get('/rates', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.data == b''
+    assert cached.headers['ETag'] == etag
+
+
+def test_rates_etag_returns_304_async(run_quart):
+    async def check(client):
+        response = await client.get('/rates')
+        cached = await client.get('/rates', headers={'If-None-Match': response.headers['ETag']})
+        return response.status_code, cached.status_code, await cached.get_data()
+
+    assert run_quart(check) == (200, 304, b'')
+
+
+def test_convert_batch_matches_single_conversions(flask_app):
+    client = flask_app.app.test_client()
+    document = client.post('/convert/batch', json={'items': BATCH_ITEMS}).get_json()
+    assert document['count'] == 4
+    assert document['errors'] == 2
+    assert [result['index'] for result in document['results']] == [0, 1, 2, 3]
+    assert 'error' in document['results'][2] and 'error' in document['results'][3]
+
+    for item, result in zip(BATCH_ITEMS[:2], document['results']):
+        single = client.get('/convert', query_string={
+            'from': item['from'], 'to': item.get('to', 'BRL'), 'amount': item['amount']
+        }).get_json()
+        assert result['converted_amount'] == pytest.approx(single['converted_amount'], abs=0.01)
+
+    csv_document = client.post(
+        '/convert/batch', data='from,to,amount\nUSD,EUR,100\n', content_type='text/csv'
+    ).get_json()
+    assert csv_document['results'] == document['results'][:1]
+
+
+def test_degraded_mode_serves_cached_rates(flask_app, database_down):
+    client = flask_app.app.test_client()
+    for path in ('/rates', '/convert?from=USD&amount=10'):
+        response = client.get(path)
+        assert response.status_code == 200, path
+        assert response.headers['X-Degraded-Mode'] == 'database-unavailable'
+
+    history = client.get('/history/USD?limit=10')
+    assert history.status_code == 503
+    assert int(history.headers['Retry-After']) >= 1
+    assert history.get_json()['degraded'] is True
+    assert client.get('/health').get_json()['mode'] == 'degraded'
+
+
+def test_history_pages_follow_next_after(flask_app):
+    client = flask_app.app.test_client()
+    expected = client.get('/history/USD?limit=12').get_json()['history']
+    if len(expected) < 4:
+        pytest.skip('Menos de 4 amostras de USD nos últimos 30 dias')
+
+    pages, after = [], None
+    while len(pages) < len(expected):
+        query = {'limit': 3, **({'after': after} if after else {})}
+        document = client.get('/history/USD', query_string=query).get_json()
+        pages.extend(document['history'])
+        after = document['next_after']
+        if after is None:
+            break
+    assert pages[:len(expected)] == expected
+
+
+def test_empty_latest_rates_are_not_cached(flask_app, monkeypatch):
+    client = flask_app.app.test_client()
+    flask_app.prepared_payloads.clear()
+    get_latest_rates = flask_app.db.get_latest_rates
+    monkeypatch.setattr(flask_app.db, 'get_latest_rates', lambda: {})
+    response = client.get('/rates/latest')
+    assert response.status_code == 503
+    assert 'rates_latest' not in {key for key, _ in flask_app.prepared_payloads}
+
+    monkeypatch.setattr(flask_app.db, 'get_latest_rates', get_latest_rates)
+    assert client.get('/rates/latest').status_code == 200
+
+
+def test_empty_latest_rates_are_not_cached_async(quart_app, run_quart, monkeypatch):
+    async def no_rates():
+        return {}
+
+    async def check(client):
+        quart_app.prepared_payloads.clear()
+        with monkeypatch.context() as patch:
+            patch.setattr(quart_app.db, 'get_latest_rates', no_rates)
+            empty = await client.get('/rates/latest')
+        cached = {key for key, _ in quart_app.prepared_payloads}
+        return empty.status_code, cached, (await client.get('/rates/latest')).status_code
+
+    status, cached, status_after = run_quart(check)
+    assert status == 503
+    assert 'rates_latest' not in cached
+    assert status_after == 200
@@ -0,0 +1,55 @@
+"""Gravação em partições que outro processo removeu (apply_retention)"""
+import asyncio
+from datetime import date, datetime
+
+import pytest
+
+from database_async import AsyncDatabaseManager
+
+# Mês antigo, sem partição no banco de testes; o teste a cria dentro de uma transação desfeita
+MONTH = date(1998, 1, 1)
+SNAPSHOTS = [({'USD': 5.0, 'EUR': 5.4}, datetime(1998, 1, 15, 12), 'test')]
+
+
+@pytest.fixture
+def dropped_partition(db_conn):
+    """Partição de MONTH ausente no banco, mas conhecida pelo processo"""
+    with db_conn.cursor() as cur:
+        cur.execute("SELECT to_regclass(%s)", (f"exchange_rates_{MONTH:%Y_%m}",))
+        if cur.fetchone()[0] is not None:
+            pytest.skip(f'Partição de {MONTH:%Y-%m} já existe no banco de testes')
+    return MONTH
+
+
+def test_save_recreates_partition_dropped_elsewhere(db, db_conn, dropped_partition):
+    db._known_partitions.add(dropped_partition)
+    try:
+        assert db.save_rates_bulk(SNAPSHOTS, log_updates=False, conn=db_conn)
+    finally:
+        db._known_partitions.discard(dropped_partition)
+    with db_conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM exchange_rates WHERE recorded_at = %s", (SNAPSHOTS[0][1],))
+        assert cur.fetchone()[0] == 2
+
+
+def test_save_recreates_partition_dropped_elsewhere_async(db, dropped_partition):
+    async def save():
+        manager = AsyncDatabaseManager(min_size=1, max_size=1)
+        assert await manager.connect()
+        manager._known_partitions.add(dropped_partition)
+        try:
+            async with manager.acquire() as conn:
+                transaction = conn.transaction()
+                await transaction.start()
+                try:
+                    saved = await manager.save_rates_bulk(SNAPSHOTS, log_updates=False, conn=conn)
+                    count = await conn.fetchval(
+                        "SELECT COUNT(*) FROM exchange_rates WHERE recorded_at = $1", SNAPSHOTS[0][1]
+                    )
+                finally:
+                    await transaction.rollback()
+        finally:
+            await manager.close()
+        return saved, count
+
+    assert asyncio.run(save()) == (True, 2)
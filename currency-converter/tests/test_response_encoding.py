@@ -0,0 +1,64 @@
+"""Records serializado sem dicts: o documento tem que sair igual ao de uma lista de dicts"""
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import json
+
+import msgpack
+import orjson
+import pytest
+
+from response_encoding import JSON_BACKENDS, Records, _default, msgpack_dumps
+
+FIELDS = ('id', 'currency_code', 'rate', 'recorded_at', 'source')
+START = datetime(2026, 1, 1, 12, 0, 0, 250000)
+
+
+class FakeRecord(tuple):
+    """Linha que não é uma tupla exata, como o asyncpg.Record"""
+
+
+def _rows(sources=('exchangerate-api',)):
+    return [
+        (i, 'USD', 5.1 + i / 1e6 if i % 7 else None, START + timedelta(seconds=i * 1.5), sources[i % len(sources)])
+        for i in range(300)
+    ]
+
+
+def _document(records):
+    return {'currency': 'USD', 'history': records, 'empty': Records(FIELDS), 'nested': {'first': records}}
+
+
+def _expected(rows):
+    dicts = [dict(zip(FIELDS, row)) for row in rows]
+    return {'currency': 'USD', 'history': dicts, 'empty': [], 'nested': {'first': dicts}}
+
+
+ROW_SETS = {
+    'simples': _rows(),
+    'textos com vírgula, aspas e colchetes': _rows(('a,b', 'x"y', 'ção\n', 'p],[q', '%s%b', '')),
+    'decimal e date': [(Decimal('1.5'), 'E,UR', 1e-7, date(2026, 1, 2), None)] + _rows()[:5],
+    'asyncpg': [FakeRecord(row) for row in _rows()],
+}
+
+
+@pytest.mark.parametrize('rows', ROW_SETS.values(), ids=ROW_SETS.keys())
+def test_json_backends_match_list_of_dicts(rows):
+    document = _document(Records(FIELDS, rows))
+    expected = _expected(rows)
+
+    assert JSON_BACKENDS['orjson'][0](document) == orjson.dumps(expected, default=_default)
+    assert JSON_BACKENDS['json'][0](document) == json.dumps(
+        expected, default=_default, separators=(',', ':'), ensure_ascii=False
+    ).encode('utf-8')
+
+
+@pytest.mark.parametrize('rows', ROW_SETS.values(), ids=ROW_SETS.keys())
+def test_msgpack_matches_list_of_dicts(rows):
+    assert msgpack_dumps(_document(Records(FIELDS, rows))) == msgpack.packb(_expected(rows), default=_default)
+
+
+def test_ndjson_has_one_object_per_line():
+    rows = ROW_SETS['textos com vírgula, aspas e colchetes']
+    lines = Records(FIELDS, rows).json_lines(JSON_BACKENDS['orjson'][1])
+    assert lines == b''.join(orjson.dumps(dict(zip(FIELDS, row)), default=_default) + b'\n' for row in rows)
+    assert Records(FIELDS).json_lines(JSON_BACKENDS['orjson'][1]) == b''
@@ -0,0 +1,94 @@
+"""Cache de séries contra o banco: as duas fontes do /history devem responder igual"""
+from datetime import datetime, timedelta
+
+from series_cache import SeriesStore, from_epoch, to_epoch
+
+# Fevereiro de 2001 ficava no horário de verão de São Paulo (fixture local_timezone)
+START = datetime(2001, 2, 3, 12, 0, 0)
+SOURCE = 'test-parity'
+
+
+def _seed(db, conn):
+    """Grava amostras com frações de segundo, inclusive duas de USD no mesmo segundo"""
+    snapshots = [
+        ({'USD': 5.10, 'EUR': 5.50}, START + timedelta(microseconds=200000), SOURCE),
+        ({'USD': 5.11}, START + timedelta(microseconds=700000), SOURCE),
+        ({'USD': 5.12, 'EUR': 5.52}, START + timedelta(seconds=1, microseconds=600000), SOURCE),
+        ({'EUR': 5.53}, START + timedelta(minutes=5), SOURCE),
+    ]
+    assert db.save_rates_bulk(snapshots, conn=conn)
+
+
+def _load_store(conn):
+    store = SeriesStore(max_bytes=1 << 20)
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT id, currency_code, rate_to_brl, recorded_at, source, created_at
+            FROM exchange_rates
+            WHERE source = %s
+            ORDER BY recorded_at, id
+        """, (SOURCE,))
+        store.add(cur.fetchall())
+    store.mark_loaded(START)
+    return store
+
+
+def test_epoch_round_trip_ignores_process_timezone(local_timezone):
+    recorded_at = datetime(2001, 2, 3, 12, 0, 0, 600000)
+    assert to_epoch(recorded_at) == 981201600.6
+    assert from_epoch(to_epoch(recorded_at)) == recorded_at
+
+
+def test_columnar_cache_matches_database(db, db_conn, local_timezone):
+    _seed(db, db_conn)
+    store = _load_store(db_conn)
+    codes = ['USD', 'EUR']
+    end = START + timedelta(hours=1)
+
+    with db_conn.cursor() as cur:
+        cur.execute(db._multi_history_sql(), {'currency_codes': codes, 'start_date': START, 'end_date': end})
+        from_db = db._columnar(cur.fetchall(), codes)
+
+    assert store.history_columnar(codes, START, end) == from_db
+    timestamps, columns = from_db
+    # Duas amostras de USD no mesmo segundo: uma posição, com a mais recente
+    assert timestamps[:2] == [981201600, 981201601]
+    assert columns['USD'][:2] == [5.11, 5.12]
+
+
+def test_history_recorded_at_matches_database(db, db_conn, local_timezone):
+    _seed(db, db_conn)
+    store = _load_store(db_conn)
+
+    with db_conn.cursor() as cur:
+        cur.execute(
+            "SELECT recorded_at FROM exchange_rates WHERE source = %s AND currency_code = 'USD' "
+            "ORDER BY recorded_at DESC",
+            (SOURCE,)
+        )
+        expected = [row[0] for row in cur.fetchall()]
+
+    records = store.history('USD', START, START + timedelta(hours=1))
+    assert [row[3] for row in records.rows] == expected
+
+
+def test_add_skips_samples_already_in_the_store():
+    store = SeriesStore(max_bytes=1 << 20)
+    created = datetime(2001, 2, 3, 12, 10)
+    first = [
+        (1, 'USD', 5.10, START, SOURCE, created),
+        (3, 'USD', 5.12, START + timedelta(seconds=2), SOURCE, created + timedelta(seconds=1)),
+    ]
+    # Sobreposição: a 3 de novo, mais a 2, que confirmou depois da 3 com recorded_at anterior
+    overlap = [
+        (2, 'USD', 5.11, START + timedelta(seconds=1), SOURCE, created),
+        (3, 'USD', 5.12, START + timedelta(seconds=2), SOURCE, created + timedelta(seconds=1)),
+    ]
+    assert store.add(first) == 2
+    assert store.add(overlap) == 1
+    assert store.add(overlap) == 0
+    store.mark_loaded(START)
+
+    records = store.history('USD', START, START + timedelta(minutes=1))
+    assert [row[0] for row in records.rows] == [3, 2, 1]
+    assert store.sync_from(timedelta(minutes=5)) == created + timedelta(seconds=1) - timedelta(minutes=5)
@@ -0,0 +1,103 @@
+"""
+Tempo de inicialização: o servidor fica pronto sem esperar o upstream
+
+O servidor real (gunicorn/uvicorn) sobe em um subprocesso com o provedor fake
+atrasado em UPSTREAM_DELAY_SECONDS, como uma primeira busca fria. O /ready
+precisa responder 200 antes do initialDelaySeconds do readinessProbe
+(k8s-deployment-v2.yaml), com o cache aquecido pelo banco (latest_rates) ou,
+sem banco, pelo snapshot local. benchmarks/bench_startup.py mede os mesmos
+cenários com mais detalhe.
+"""
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import httpx
+import pytest
+
+from conftest import APP_DIR
+
+READY_BUDGET_SECONDS = 2.0
+UPSTREAM_DELAY_SECONDS = 3.0
+
+SERVERS = {
+    'gunicorn': lambda port: [
+        sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', '1', 'app_v2:app'
+    ],
+    'uvicorn': lambda port: [
+        sys.executable, '-m', 'uvicorn', '--host', '127.0.0.1', '--port', str(port),
+        '--log-level', 'warning', 'app_async:app'
+    ]
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def seconds_until_ready(name, env, timeout=30):
+    """Lança o servidor e retorna os segundos até o primeiro 200 em /ready"""
+    port = free_port()
+    started = time.monotonic()
+    proc = subprocess.Popen(
+        SERVERS[name](port), cwd=APP_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True
+    )
+    try:
+        with httpx.Client(timeout=timeout) as client:
+            while time.monotonic() - started < timeout:
+                assert proc.poll() is None, f'{name} terminou ao iniciar (código {proc.returncode})'
+                try:
+                    if client.get(f'http://127.0.0.1:{port}/ready').status_code == 200:
+                        return time.monotonic() - started
+                except httpx.HTTPError:
+                    pass
+                time.sleep(0.02)
+        pytest.fail(f'{name} não ficou pronto em {timeout}s')
+    finally:
+        os.killpg(proc.pid, signal.SIGTERM)
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            os.killpg(proc.pid, signal.SIGKILL)
+
+
+@pytest.fixture
+def server_env(tmp_path):
+    """Provedor fake lento, spool e snapshot próprios do teste"""
+    env = dict(
+        os.environ,
+        RATE_PROVIDERS='fake',
+        FAKE_PROVIDER_DELAY_SECONDS=str(UPSTREAM_DELAY_SECONDS),
+        RATE_PROVIDER_TIMEOUT_SECONDS=str(UPSTREAM_DELAY_SECONDS + 5),
+        WRITE_BEHIND_SPOOL_DIR=str(tmp_path / 'spool'),
+        RATE_SNAPSHOT_FILE=str(tmp_path / 'latest-snapshot.json')
+    )
+    env.pop('PROMETHEUS_MULTIPROC_DIR', None)
+    return env
+
+
+@pytest.mark.parametrize('name', SERVERS)
+def test_ready_from_database_before_upstream(name, db, server_env):
+    if not db.get_latest_rates():
+        pytest.skip('latest_rates vazia: nada para aquecer o cache')
+    assert seconds_until_ready(name, server_env) < READY_BUDGET_SECONDS
+
+
+@pytest.mark.parametrize('name', SERVERS)
+def test_ready_from_snapshot_without_database(name, server_env):
+    with open(server_env['RATE_SNAPSHOT_FILE'], 'w') as f:
+        json.dump({
+            'rates': {'USD': 5.0, 'EUR': 5.4, 'CAD': 3.7, 'CHF': 5.6, 'GBP': 6.3, 'JPY': 0.034, 'CNY': 0.69},
+            'last_update': datetime.now().isoformat()
+        }, f)
+    # Porta fechada: a conexão com o banco falha na hora
+    server_env.update(DB_HOST='127.0.0.1', DB_PORT=str(free_port()))
+    assert seconds_until_ready(name, server_env) < READY_BUDGET_SECONDS
@@ -0,0 +1,400 @@
+from collections import deque
+from datetime import datetime
+import asyncio
+import fcntl
+import glob
+import json
+import os
+import threading
+import uuid
+import logging
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _encode(snapshot):
+    rates, recorded_at, source = snapshot
+    return json.dumps(
+        {'rates': rates, 'recorded_at': recorded_at.isoformat(), 'source': source},
+        separators=(',', ':')
+    ) + '\n'
+
+
+def _decode(line):
+    data = json.loads(line)
+    return data['rates'], datetime.fromisoformat(data['recorded_at']), data['source']
+
+
+class SnapshotSpool:
+    """
+    Arquivo local, só de acréscimo, com os snapshots que não chegaram ao banco
+
+    Cada processo grava no próprio arquivo (rates-<pid>-<id>.jsonl), com um
+    flock exclusivo enquanto vive. Arquivos sem dono (de processos que
+    morreram) são assumidos por quem conseguir o flock e reenviados antes,
+    do mais antigo para o mais novo.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f'rates-{os.getpid()}-{uuid.uuid4().hex[:8]}.jsonl')
+        self._file = open(self.path, 'a+', encoding='utf-8')
+        fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._orphans = []  # [(caminho, arquivo com flock)]
+        self.snapshots = 0
+        self.bytes = 0
+        self.claim_orphans()
+
+    def claim_orphans(self):
+        """Assume os arquivos de processos que morreram sem reenviar o spool"""
+        claimed = {path for path, _ in self._orphans}
+        for path in sorted(glob.glob(os.path.join(self.directory, 'rates-*.jsonl')), key=os.path.getmtime):
+            if path == self.path or path in claimed:
+                continue
+            try:
+                f = open(path, 'r+', encoding='utf-8')
+            except FileNotFoundError:
+                continue
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                continue
+            # Pode ter sido reenviado e removido entre o glob e o flock
+            if not os.path.exists(path):
+                f.close()
+                continue
+            lines = sum(1 for line in f if line.strip())
+            self._orphans.append((path, f))
+            self.snapshots += lines
+            self.bytes += os.path.getsize(path)
+            logger.info(f"Spool órfão assumido: {path} ({lines} snapshot(s))")
+        self._update_metrics()
+
+    def _update_metrics(self):
+        metrics.SPOOL_SNAPSHOTS.set(self.snapshots)
+        metrics.SPOOL_BYTES.set(self.bytes)
+
+    def append(self, snapshots):
+        """Acrescenta snapshots ao arquivo deste processo, com fsync"""
+        data = ''.join(_encode(snapshot) for snapshot in snapshots)
+        self._file.seek(0, os.SEEK_END)
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.snapshots += len(snapshots)
+        self.bytes += len(data.encode('utf-8'))
+        self._update_metrics()
+
+    def _files(self):
+        return self._orphans + [(self.path, self._file)]
+
+    def replay(self, save, batch_size):
+        """
+        Reenvia o spool em ordem, em lotes de `batch_size`
+
+        Args:
+            save: Função que grava uma lista de snapshots e retorna True/False;
+                precisa ser idempotente, porque um lote pode ser reenviado
+                depois de uma falha
+
+        Returns:
+            True se o spool ficou vazio
+        """
+        for path, f in self._files():
+            f.seek(0)
+            batch = []
+            for line in f:
+                if line.strip():
+                    batch.append(_decode(line))
+                if len(batch) >= batch_size:
+                    if not save(batch):
+                        return False
+                    batch = []
+            if batch and not save(batch):
+                return False
+            self._discard(path, f)
+        return True
+
+    def _discard(self, path, f):
+        size = os.path.getsize(path)
+        f.seek(0)
+        lines = sum(1 for line in f if line.strip())
+        if f is self._file:
+            f.truncate(0)
+            f.flush()
+            os.fsync(f.fileno())
+        else:
+            os.unlink(path)
+            f.close()
+            self._orphans.remove((path, f))
+        self.snapshots = max(0, self.snapshots - lines)
+        self.bytes = max(0, self.bytes - size)
+        self._update_metrics()
+
+    def close(self):
+        """Fecha os arquivos; o deste processo só é removido se estiver vazio"""
+        for path, f in self._orphans:
+            f.close()
+        self._orphans = []
+        empty = os.path.getsize(self.path) == 0
+        self._file.close()
+        if empty:
+            os.unlink(self.path)
+
+
+class _BaseWriteBehindQueue:
+    def __init__(self, db, spool_dir, batch_size=100, retry_seconds=10, max_queue=10000):
+        """
+        Args:
+            db: DatabaseManager ou AsyncDatabaseManager
+            spool_dir: Diretório do spool local
+            batch_size: Máximo de snapshots por gravação
+            retry_seconds: Intervalo entre tentativas de reenviar o spool
+            max_queue: Snapshots em memória a partir dos quais vão direto para o spool
+        """
+        self.db = db
+        self.batch_size = batch_size
+        self.retry_seconds = retry_seconds
+        self.max_queue = max_queue
+        self.spool = SnapshotSpool(spool_dir)
+        self._queue = deque()
+        self._listeners = []
+        self.written = 0
+        self.last_error = None
+
+    def add_listener(self, callback):
+        """Registra callback(lote) chamado depois de cada gravação bem-sucedida (fila ou spool)"""
+        self._listeners.append(callback)
+
+    def _notify_saved(self, batch):
+        # Só aqui as linhas já estão no banco (commit feito) e visíveis para quem lê
+        for callback in self._listeners:
+            try:
+                callback(batch)
+            except Exception as e:
+                logger.error(f"Erro no listener da fila de escrita: {str(e)}")
+
+    def _take_batch(self):
+        batch = []
+        while self._queue and len(batch) < self.batch_size:
+            batch.append(self._queue.popleft())
+        metrics.WRITE_QUEUE_DEPTH.set(len(self._queue))
+        return batch
+
+    def _spill(self, batch, reason):
+        # Lotes que só seguem o spool pendente (para manter a ordem) não são erro
+        if self.spool.snapshots == 0:
+            self.last_error = reason
+        self.spool.append(batch)
+        logger.warning(f"{len(batch)} snapshot(s) enviados ao spool local: {reason}")
+
+    def stats(self):
+        """Profundidade da fila e tamanho do spool, para o /health"""
+        return {
+            'queue_depth': len(self._queue),
+            'spool_snapshots': self.spool.snapshots,
+            'spool_bytes': self.spool.bytes,
+            'written': self.written,
+            'last_error': self.last_error
+        }
+
+
+class WriteBehindQueue(_BaseWriteBehindQueue):
+    """
+    Grava snapshots de taxas no banco em uma thread, fora do caminho da atualização
+
+    `submit` só enfileira. A thread grava em lotes com save_rates_bulk; se o
+    banco estiver fora (circuit breaker aberto) ou a gravação falhar, o lote
+    vai para o spool local. Enquanto houver spool, novos lotes também vão
+    para ele, para manter a ordem, e o spool é reenviado (de forma
+    idempotente) assim que o banco voltar.
+    """
+
+    def __init__(self, db, spool_dir, **kwargs):
+        super().__init__(db, spool_dir, **kwargs)
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    def submit(self, rates, recorded_at=None, source='exchangerate-api'):
+        """Enfileira um snapshot; nunca bloqueia em I/O"""
+        if not rates:
+            return
+        with self._cond:
+            self._queue.append((dict(rates), recorded_at or datetime.now(), source))
+            metrics.WRITE_QUEUE_DEPTH.set(len(self._queue))
+            self._cond.notify()
+
+    def _save(self, batch, log_updates=True):
+        if not self.db.is_available():
+            return False
+        if not self.db.save_rates_bulk(batch, skip_existing=True, log_updates=log_updates):
+            return False
+        self.written += len(batch)
+        self.last_error = None
+        self._notify_saved(batch)
+        return True
+
+    def _save_replayed(self, batch):
+        # Snapshots do spool são antigos (ou já gravados): não contam como atualização
+        # recente em rate_updates, que o modo coordenado usa para decidir se busca na API
+        return self._save(batch, log_updates=False)
+
+    def _flush(self):
+        with self._cond:
+            batch = self._take_batch()
+            overflow = len(self._queue) >= self.max_queue
+        if self.spool.snapshots:
+            if batch:
+                self._spill(batch, 'spool pendente')
+            if self.spool.replay(self._save_replayed, self.batch_size):
+                logger.info("Spool local reenviado ao banco")
+            return
+        if batch and not self._save(batch):
+            self._spill(batch, 'banco indisponível' if not self.db.is_available() else 'falha ao gravar')
+        elif overflow:
+            with self._cond:
+                batch = list(self._queue)
+                self._queue.clear()
+            self._spill(batch, 'fila cheia')
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._queue and not self._stopped:
+                    self._cond.wait(self.retry_seconds if self.spool.snapshots else None)
+                stopped = self._stopped
+            try:
+                self._flush()
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Erro na fila de escrita: {str(e)}")
+                if stopped:
+                    return
+            # No encerramento, esvazia a fila antes de sair (o que falhar vai para o spool)
+            if stopped and not self._queue:
+                return
+
+    def start(self):
+        """Inicia a thread de gravação (idempotente)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        """Para a thread; o que não for gravado a tempo vai para o spool"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        with self._cond:
+            batch = list(self._queue)
+            self._queue.clear()
+        if batch:
+            self._spill(batch, 'encerramento')
+        self.spool.close()
+
+
+class AsyncWriteBehindQueue(_BaseWriteBehindQueue):
+    """Versão asyncio da WriteBehindQueue, sobre o AsyncDatabaseManager"""
+
+    def __init__(self, db, spool_dir, **kwargs):
+        super().__init__(db, spool_dir, **kwargs)
+        self._event = None
+        self._task = None
+
+    def submit(self, rates, recorded_at=None, source='exchangerate-api'):
+        """Enfileira um snapshot; nunca bloqueia"""
+        if not rates:
+            return
+        self._queue.append((dict(rates), recorded_at or datetime.now(), source))
+        metrics.WRITE_QUEUE_DEPTH.set(len(self._queue))
+        if self._event is not None:
+            self._event.set()
+
+    async def _save(self, batch, log_updates=True):
+        if not self.db.is_available():
+            return False
+        if not await self.db.save_rates_bulk(batch, skip_existing=True, log_updates=log_updates):
+            return False
+        self.written += len(batch)
+        self.last_error = None
+        self._notify_saved(batch)
+        return True
+
+    async def _replay(self):
+        # O spool é lido e gravado em uma thread; os lotes voltam para o loop
+        loop = asyncio.get_running_loop()
+
+        def save(batch):
+            # Sem registro em rate_updates, como em WriteBehindQueue._save_replayed
+            return asyncio.run_coroutine_threadsafe(self._save(batch, log_updates=False), loop).result()
+
+        return await asyncio.to_thread(self.spool.replay, save, self.batch_size)
+
+    async def _flush(self):
+        batch = self._take_batch()
+        overflow = len(self._queue) >= self.max_queue
+        if self.spool.snapshots:
+            if batch:
+                await asyncio.to_thread(self._spill, batch, 'spool pendente')
+            if await self._replay():
+                logger.info("Spool local reenviado ao banco")
+            return
+        if batch and not await self._save(batch):
+            reason = 'banco indisponível' if not self.db.is_available() else 'falha ao gravar'
+            await asyncio.to_thread(self._spill, batch, reason)
+        elif overflow:
+            batch = list(self._queue)
+            self._queue.clear()
+            await asyncio.to_thread(self._spill, batch, 'fila cheia')
+
+    async def _run(self):
+        while True:
+            if not self._queue:
+                try:
+                    await asyncio.wait_for(
+                        self._event.wait(), self.retry_seconds if self.spool.snapshots else None
+                    )
+                except asyncio.TimeoutError:
+                    pass
+            self._event.clear()
+            try:
+                await self._flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Erro na fila de escrita: {str(e)}")
+
+    def start(self):
+        """Inicia a task de gravação no loop atual (idempotente)"""
+        if self._task is None or self._task.done():
+            self._event = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Cancela a task e tenta gravar o que ficou na fila; o resto vai para o spool"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            while self._queue:
+                await self._flush()
+        except Exception as e:
+            logger.error(f"Erro ao esvaziar a fila de escrita: {str(e)}")
+        batch = list(self._queue)
+        self._queue.clear()
+        if batch:
+            self._spill(batch, 'encerramento')
+        self.spool.close()